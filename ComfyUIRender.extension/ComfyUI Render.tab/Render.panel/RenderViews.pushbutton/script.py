@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""Render Views — export several saved 3D views and queue a render of each."""
+
+import os, sys
+
+EXTENSION_DIR = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+LIB_DIR = os.path.join(EXTENSION_DIR, "lib")
+if LIB_DIR not in sys.path:
+    sys.path.insert(0, LIB_DIR)
+
+import clr
+clr.AddReference("RevitAPI")
+clr.AddReference("RevitAPIUI")
+
+from Autodesk.Revit.DB import View3D
+from pyrevit import revit, forms
+
+import app_state
+import revit_context
+
+uidoc = revit.uidoc
+revit_context.uidoc = uidoc
+
+views = forms.select_views(
+    title="Views to render", button_name="Render", multiple=True,
+    filterfunc=lambda v: isinstance(v, View3D) and not v.IsTemplate)
+
+prompt = None
+if views:
+    default = app_state.window.prompt() if app_state.is_window_open() else ""
+    prompt  = forms.ask_for_string(
+        default=default, prompt="Prompt for all {0} views:".format(len(views)),
+        title="ComfyUI Render")
+
+if views and prompt:
+    opened = [app_state.window if app_state.is_window_open() else None]
+
+    def _queue(view, path):
+        """Called after each ExportImage chunk; rendering starts right away."""
+        win = opened[0]
+        if win is None:
+            from render_window import RenderWindow
+            win = RenderWindow(path, uidoc=uidoc)
+            app_state.window = win
+            win.show()          # non-modal — Revit stays interactive
+            opened[0] = win
+        win.queue_view(path, view.Name, prompt)
+
+    try:
+        from snapshot import export_views
+        import profiles
+        import settings_manager
+        # Snapshots of views still queued from an earlier run must survive
+        keep = opened[0].snapshots_in_use() if opened[0] is not None else ()
+        done = export_views(uidoc.Document, list(views),
+                            profiles.capture_size(settings_manager.load()),
+                            on_view=_queue, keep=keep)
+        if len(done) < len(views):
+            exported = set(v.Id for v, _ in done)
+            forms.alert("Not exported:\n" + "\n".join(
+                v.Name for v in views if v.Id not in exported),
+                title="ComfyUI Render", warn_icon=True)
+    except Exception as ex:
+        forms.alert("Error: " + str(ex), title="ComfyUI Render", warn_icon=True)
+    finally:
+        if opened[0] is not None:
+            opened[0].end_views()
@@ -29,7 +29,9 @@ if not isinstance(uidoc.ActiveView, View3D):
 else:
     try:
         from snapshot import capture
-        snapshot_path = capture(uidoc)
+        import profiles
+        import settings_manager
+        snapshot_path = capture(uidoc, profiles.capture_size(settings_manager.load()))
 
         # If window is already open just update its snapshot
         if app_state.is_window_open():
@@ -5,21 +5,11 @@ Shared module-level state so ribbon buttons can communicate
 with the currently open render window.
 
 window        -- reference to the active RenderWindow instance (or None)
-stop_requested -- set to True to cancel a running render
+
+Cancelling renders is per job (see job_queue.RenderJob.cancel).
 """
 
 window         = None
-stop_requested = False
-
-
-def request_stop():
-    global stop_requested
-    stop_requested = True
-
-
-def clear_stop():
-    global stop_requested
-    stop_requested = False
 
 
 def is_window_open():
@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+"""
+batch_render.py
+Render a folder of exported view images without Revit or the window.
+
+    python batch_render.py VIEWS_DIR --prompt "timber facade, dusk"
+    python batch_render.py VIEWS_DIR --prompts prompts.txt --concurrency 3
+    python batch_render.py VIEWS_DIR --csv jobs.csv --server http://gpu2:8188
+
+--prompt / --prompts render every image with every prompt; --csv lists
+`image,prompt[,seed]` rows (image relative to VIEWS_DIR). Results are
+written next to the inputs as <name>_render.png (<name>_render_<n>.png for
+the n-th of several prompts).
+
+Progress is kept in a manifest (VIEWS_DIR/batch_manifest.json by default),
+rewritten after every finished render. Running the same command again after
+an interruption skips renders that are done and whose output still exists,
+and reuses the seeds already chosen, so the batch finishes as if it had
+never stopped.
+
+Jobs go through a pipelined render_engine.RenderSession (the next image is
+uploaded and queued while one renders), so servers, workflow file and
+timeouts come from settings.json unless given on the command line.
+
+Runs under CPython (Linux or Windows) and IronPython 2.7.
+"""
+
+import os
+import re
+import sys
+import csv
+import json
+import time
+import random
+import argparse
+
+import settings_manager
+import profiles
+import render_engine
+import server_pool
+
+IMAGE_EXTS    = (".png", ".jpg", ".jpeg")
+OUTPUT_SUFFIX = "_render"
+MANIFEST_NAME = "batch_manifest.json"
+
+_OUTPUT_RE = re.compile(re.escape(OUTPUT_SUFFIX) + r"(_\d+)?$")
+
+
+# ── Tasks ─────────────────────────────────────────────────────────────────────
+
+def _output_path(image_path, index, count):
+    stem = os.path.splitext(image_path)[0] + OUTPUT_SUFFIX
+    if count > 1:
+        stem += "_{0}".format(index + 1)
+    return stem + ".png"
+
+
+def list_images(folder):
+    """Input images in folder, sorted, skipping this tool's own outputs."""
+    names = []
+    for name in sorted(os.listdir(folder)):
+        stem, ext = os.path.splitext(name)
+        if ext.lower() not in IMAGE_EXTS or _OUTPUT_RE.search(stem):
+            continue
+        names.append(os.path.join(folder, name))
+    return names
+
+
+def read_prompts(path):
+    """One prompt per line; blank lines and # comments are skipped."""
+    prompts = []
+    with open(path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                prompts.append(line)
+    return prompts
+
+
+def _open_csv(path):
+    if sys.version_info[0] >= 3:
+        return open(path, "r", newline="", encoding="utf-8-sig")
+    return open(path, "rb")
+
+
+def tasks_from_prompts(folder, prompts):
+    """Every image with every prompt."""
+    tasks = []
+    for image in list_images(folder):
+        for i, prompt in enumerate(prompts):
+            tasks.append({"image": image, "prompt": prompt, "seed": None,
+                          "output": _output_path(image, i, len(prompts))})
+    return tasks
+
+
+def tasks_from_csv(folder, path):
+    """Rows of image,prompt[,seed] (with that header)."""
+    rows = []
+    with _open_csv(path) as f:
+        for row in csv.DictReader(f):
+            image  = (row.get("image") or "").strip()
+            prompt = (row.get("prompt") or "").strip()
+            if not image or not prompt:
+                continue
+            seed = (row.get("seed") or "").strip()
+            rows.append((os.path.join(folder, image), prompt,
+                         int(seed) if seed.isdigit() else None))
+    counts = {}
+    for image, _, _ in rows:
+        counts[image] = counts.get(image, 0) + 1
+    seen  = {}
+    tasks = []
+    for image, prompt, seed in rows:
+        if not os.path.exists(image):
+            raise Exception("CSV lists a missing image: " + image)
+        index = seen.get(image, 0)
+        seen[image] = index + 1
+        tasks.append({"image": image, "prompt": prompt, "seed": seed,
+                      "output": _output_path(image, index, counts[image])})
+    return tasks
+
+
+# ── Manifest ──────────────────────────────────────────────────────────────────
+
+class Manifest(object):
+    """
+    Task status by output path: {"image", "prompt", "seed", "status",
+    "error", "seconds"}. Saved atomically, so an interrupted batch leaves a
+    readable file.
+    """
+
+    def __init__(self, path):
+        self.path    = path
+        self.entries = {}
+        if os.path.exists(path):
+            try:
+                with open(path, "r") as f:
+                    self.entries = json.load(f).get("tasks", {})
+            except Exception:
+                self.entries = {}
+
+    def plan(self, tasks, base_seed=None):
+        """
+        Fill in seeds and return the tasks still to render. A task keeps its
+        recorded seed while its image and prompt are unchanged.
+        """
+        todo = []
+        for i, task in enumerate(tasks):
+            entry = self.entries.get(task["output"])
+            same  = (entry is not None and entry.get("image") == task["image"]
+                     and entry.get("prompt") == task["prompt"])
+            if task["seed"] is None:
+                if same and entry.get("seed") is not None:
+                    task["seed"] = entry["seed"]
+                elif base_seed is not None:
+                    task["seed"] = (base_seed + i) % 2147483648
+                else:
+                    task["seed"] = random.randint(0, 2147483647)
+            if (same and entry.get("seed") == task["seed"]
+                    and entry.get("status") == "done" and os.path.exists(task["output"])):
+                continue
+            self.entries[task["output"]] = {"image": task["image"], "prompt": task["prompt"],
+                                            "seed": task["seed"], "status": "pending"}
+            todo.append(task)
+        return todo
+
+    def mark(self, task, status, error=None, seconds=None):
+        entry = self.entries.setdefault(task["output"], {})
+        entry.update({"image": task["image"], "prompt": task["prompt"],
+                      "seed": task["seed"], "status": status})
+        entry.pop("error", None)
+        if error:
+            entry["error"] = error
+        if seconds is not None:
+            entry["seconds"] = round(seconds, 1)
+
+    def save(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"updated": time.strftime("%Y-%m-%d %H:%M:%S"),
+                       "tasks": self.entries}, f, indent=1, sort_keys=True)
+        # os.rename won't replace an existing file on Windows
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        os.rename(tmp, self.path)
+
+
+# ── Run ───────────────────────────────────────────────────────────────────────
+
+def run(tasks, manifest, session, log=None):
+    """
+    Render tasks through session, keeping up to the session's max_jobs
+    submitted (its pipeline bounds each stage). Returns (done, failed).
+    Ctrl+C cancels what is in flight.
+    """
+    log     = log or (lambda msg: sys.stdout.write(msg + "\n"))
+    limit   = session.queue.max_jobs
+    pending = list(tasks)
+    flight  = []            # (task, job)
+    total   = len(tasks)
+    done    = failed = 0
+    try:
+        while pending or flight:
+            while pending and len(flight) < limit:
+                task = pending.pop(0)
+                job  = session.submit(task["image"], task["prompt"], seed=task["seed"],
+                                      output=task["output"])
+                flight.append((task, job))
+            finished = [(t, j) for t, j in flight if j.wait(0)]
+            if not finished:
+                flight[0][1].wait(0.25)
+                continue
+            for task, job in finished:
+                flight.remove((task, job))
+                seconds = (job.finished or time.time()) - job.created
+                name    = os.path.basename(task["image"])
+                try:
+                    job.result(0)
+                    done += 1
+                    manifest.mark(task, "done", seconds=seconds)
+                    log("[{0}/{1}] {2} -> {3} ({4:.1f}s)".format(
+                        done + failed, total, name, os.path.basename(task["output"]), seconds))
+                except Exception as ex:
+                    failed += 1
+                    manifest.mark(task, "failed", error=str(ex))
+                    log("[{0}/{1}] {2} FAILED: {3}".format(done + failed, total, name, ex))
+            manifest.save()
+    except BaseException:
+        session.cancel_all(wait=10)
+        for task, _ in flight:
+            manifest.mark(task, "pending")
+        manifest.save()
+        raise
+    return done, failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Render a folder of view images through ComfyUI.")
+    parser.add_argument("folder", help="folder of exported view images (.png/.jpg)")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--prompt", help="one prompt for every image")
+    source.add_argument("--prompts", help="text file, one prompt per line")
+    source.add_argument("--csv", help="CSV with image,prompt[,seed] columns")
+    parser.add_argument("--concurrency", type=int, default=2,
+                        help="prompts kept in each server's queue (default 2: "
+                             "the running one and the next)")
+    parser.add_argument("--seed", type=int, help="first seed (default: random per render)")
+    parser.add_argument("--server", action="append",
+                        help="ComfyUI URL (repeat for several; default: settings.json)")
+    parser.add_argument("--workflow", help="API-format workflow JSON (default: settings.json)")
+    parser.add_argument("--profile", choices=[n for n, _ in profiles.PROFILES])
+    parser.add_argument("--aspect", choices=[n for n, _ in profiles.ASPECTS])
+    parser.add_argument("--manifest", help="progress file (default: FOLDER/" + MANIFEST_NAME + ")")
+    args = parser.parse_args(argv)
+
+    folder = os.path.abspath(args.folder)
+    if not os.path.isdir(folder):
+        parser.error("not a folder: " + folder)
+    if args.csv:
+        tasks = tasks_from_csv(folder, args.csv)
+    else:
+        prompts = [args.prompt] if args.prompt else read_prompts(args.prompts)
+        if not prompts:
+            parser.error("no prompts given")
+        tasks = tasks_from_prompts(folder, prompts)
+
+    s = settings_manager.load()
+    if args.server:
+        s["comfy_url"], s["servers"] = args.server[0], args.server[1:]
+    if args.workflow:
+        s["workflow_path"] = os.path.abspath(args.workflow)
+    if args.profile:
+        s["profile"] = args.profile
+    if args.aspect:
+        s["aspect"] = args.aspect
+
+    manifest = Manifest(args.manifest or os.path.join(folder, MANIFEST_NAME))
+    todo     = manifest.plan(tasks, args.seed)
+    manifest.save()
+    print("{0} renders, {1} already done.".format(len(tasks), len(tasks) - len(todo)))
+    if not todo:
+        return 0
+
+    servers = len(server_pool.server_urls(s))
+    # Pipelined: the next image is uploaded and queued while one renders.
+    # The manifest is the resume record; the result cache would only copy
+    # every output a second time
+    session = render_engine.RenderSession(
+        s, cache=False, pipelined=True,
+        ahead=max(1, args.concurrency) * max(1, servers))
+    start   = time.time()
+    try:
+        done, failed = run(todo, manifest, session)
+    except KeyboardInterrupt:
+        print("Interrupted; run the same command again to resume.")
+        return 130
+    finally:
+        session.shutdown()
+    elapsed = time.time() - start
+    print("{0} done, {1} failed in {2:.0f}s ({3:.1f} images/min).".format(
+        done, failed, elapsed, 60.0 * done / elapsed if elapsed else 0.0))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
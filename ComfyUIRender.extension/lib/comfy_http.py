@@ -8,15 +8,23 @@ IronPython 2.7 compatible.
 import os
 import json
 import base64
+import socket
+import struct
+import hashlib
+import random
+import threading
+import time
+import uuid
 
-# ── urllib fallback (always works in IronPython) ──────────────────────────────
-def _get_urlopen():
+import tracing
+
+# ── py2/py3 shims (IronPython ships httplib/urlparse) ─────────────────────────
+def _get_httplib():
     try:
-        from urllib.request import urlopen, Request
-        return urlopen, Request
+        import http.client as httplib
     except ImportError:
-        from urllib2 import urlopen, Request
-        return urlopen, Request
+        import httplib
+    return httplib
 
 def _url_quote(s):
     try:
@@ -26,41 +34,302 @@ def _url_quote(s):
         from urllib import quote
         return quote(str(s))
 
+def _url_split(url):
+    try:
+        from urllib.parse import urlsplit
+    except ImportError:
+        from urlparse import urlsplit
+    return urlsplit(url)
 
-# ── POST JSON ─────────────────────────────────────────────────────────────────
-def post_json(base_url, endpoint, payload):
-    """POST dict as JSON. Returns parsed response dict. Raises on error."""
-    url  = base_url.rstrip("/") + endpoint
-    body = json.dumps(payload).encode("utf-8")
+def _split_url(url):
+    """"http://host:port/a?b" -> ("http://host:port", "/a?b")"""
+    parts = _url_split(url)
+    path  = parts.path or "/"
+    if parts.query:
+        path += "?" + parts.query
+    return "{0}://{1}".format(parts.scheme, parts.netloc), path
 
-    urlopen, Request = _get_urlopen()
-    req = Request(url, body)
-    req.add_header("Content-Type", "application/json")
 
-    try:
-        resp = urlopen(req, timeout=60)
-        raw  = resp.read().decode("utf-8")
-        return json.loads(raw)
-    except Exception as ex:
-        # Attach useful context to the exception
-        msg = str(ex)
-        # For urllib HTTPError, read the body for more detail
+# ── Keep-alive client ─────────────────────────────────────────────────────────
+class ConnectionFailed(Exception):
+    """The server couldn't be reached, or the connection broke mid-request."""
+
+
+class ComfyClient(object):
+    """
+    HTTP/1.1 client for one ComfyUI base URL.
+    Keeps a small pool of idle keep-alive connections so a render costs one
+    TCP handshake instead of one per request. Thread-safe: each request
+    checks a connection out of the pool and returns it when the body is read.
+
+    GETs are retried on connection errors. Other methods are retried only
+    when a reused idle connection turns out to be dead before the request
+    was sent, so a prompt can never be queued twice.
+    """
+
+    IDLE_TTL = 20.0     # drop idle sockets before the server times them out
+
+    def __init__(self, base_url, timeout=30, retries=2, max_idle=4):
+        parts = _url_split(base_url.rstrip("/"))
+        self.base_url = base_url.rstrip("/")
+        self.scheme   = parts.scheme or "http"
+        self.host     = parts.hostname
+        self.port     = parts.port
+        self.timeout  = timeout
+        self.retries  = retries
+        self.max_idle = max_idle
+        self._idle    = []          # [(conn, released_at)]
+        self._lock    = threading.Lock()
+
+    # ── Pool ──────────────────────────────────────────────────────────────
+
+    def _new_conn(self, timeout):
+        httplib = _get_httplib()
+        if self.scheme == "https":
+            conn = httplib.HTTPSConnection(self.host, self.port, timeout=timeout)
+        else:
+            conn = httplib.HTTPConnection(self.host, self.port, timeout=timeout)
+        conn.connect()
+        # Small request writes must not wait for delayed ACKs
+        conn.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return conn
+
+    def _acquire(self, timeout):
+        """Return (conn, reused)."""
+        now = time.time()
+        with self._lock:
+            while self._idle:
+                conn, released = self._idle.pop()
+                if now - released < self.IDLE_TTL:
+                    if conn.sock is not None:
+                        conn.sock.settimeout(timeout)
+                    return conn, True
+                conn.close()
+        return self._new_conn(timeout), False
+
+    def _release(self, conn):
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append((conn, time.time()))
+                return
+        conn.close()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            conn.close()
+
+    # ── Requests ──────────────────────────────────────────────────────────
+
+    def request(self, method, path, body=None, headers=None, timeout=None,
+                retries=None, sink=None, on_progress=None):
+        """
+        Send one request. Returns (status, body_bytes).
+        Raises ConnectionFailed on connection failure; HTTP error statuses
+        are returned.
+
+        With sink (a writable binary file), a successful response body is
+        streamed into it in chunks and (status, bytes_written) is returned.
+        on_progress(done, total) follows the stream; total is the
+        Content-Length, or 0 if the server didn't send one.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        if retries is None:
+            retries = self.retries if method in ("GET", "HEAD") else 0
+        headers = dict(headers or {})
+        attempt = 0
+        while True:
+            conn, reused, sent = None, False, False
+            if sink is not None:
+                sink.seek(0)
+                sink.truncate()
+            try:
+                conn, reused = self._acquire(timeout)
+                if isinstance(body, list):
+                    self._send_chunks(conn, method, path, body, headers)
+                else:
+                    conn.request(method, path, body, headers)
+                sent = True
+                resp = conn.getresponse()
+                if sink is None or resp.status >= 400:
+                    data = resp.read()
+                else:
+                    data = self._drain(resp, sink, on_progress)
+            except Exception as ex:
+                if conn is not None:
+                    conn.close()
+                if reused and not sent:
+                    continue            # stale idle socket, doesn't count
+                if attempt < retries:
+                    attempt += 1
+                    continue
+                if isinstance(ex, ConnectionFailed):
+                    raise
+                raise ConnectionFailed(str(ex))
+            if resp.will_close:
+                conn.close()
+            else:
+                self._release(conn)
+            return resp.status, data
+
+    CHUNK = 256 * 1024
+
+    @classmethod
+    def _drain(cls, resp, sink, on_progress):
+        """Copy a response body into sink chunk by chunk. Returns byte count."""
+        total = int(resp.getheader("Content-Length") or 0)
+        done  = 0
+        while True:
+            chunk = resp.read(cls.CHUNK)
+            if not chunk:
+                break
+            sink.write(chunk)
+            done += len(chunk)
+            if on_progress:
+                on_progress(done, total)
+        if total and done != total:
+            raise Exception("Incomplete download: {0} of {1} bytes".format(done, total))
+        return done
+
+    @staticmethod
+    def _send_chunks(conn, method, path, chunks, headers):
+        """Stream a body given as a list of byte strings, without joining it."""
+        conn.putrequest(method, path)
+        for name, value in headers.items():
+            conn.putheader(name, value)
+        conn.putheader("Content-Length", str(sum(len(c) for c in chunks)))
+        conn.endheaders()
+        for chunk in chunks:
+            conn.send(chunk)
+
+    def _url(self, path):
+        return self.base_url + path
+
+    def get_json(self, path, timeout=30):
+        """GET path, return parsed JSON. Raises on error."""
+        status, data = self.request("GET", path, timeout=timeout)
+        if status >= 400:
+            raise Exception("HTTP {0} from {1}".format(status, self._url(path)))
+        return json.loads(data.decode("utf-8"))
+
+    def post_json(self, path, payload, timeout=60):
+        """
+        POST dict as JSON. Returns parsed response dict. Raises on error.
+        payload may also be a list of byte chunks that already form the
+        JSON body (see workflow.prompt_body); they are streamed as-is.
+        """
+        if isinstance(payload, list):
+            body = payload
+        else:
+            body = json.dumps(payload).encode("utf-8")
+        try:
+            with tracing.span("post " + path.split("?")[0]) as sp:
+                status, data = self.request(
+                    "POST", path, body,
+                    {"Content-Type": "application/json"}, timeout=timeout)
+                sp.set(bytes=sum(len(c) for c in body) if isinstance(body, list) else len(body))
+        except ConnectionFailed as ex:
+            raise ConnectionFailed("Request failed: {0}\nURL was: {1}".format(
+                str(ex), self._url(path)))
+        text = data.decode("utf-8", "replace")
+        if status >= 400:
+            raise Exception("HTTP {0} from {1}\nResponse: {2}".format(
+                status, self._url(path), text[:500]))
+        return json.loads(text) if text.strip() else {}
+
+    def post_multipart(self, path, fields, files, timeout=120):
+        """
+        POST multipart/form-data. fields: {name: str},
+        files: {name: (filename, bytes, content_type)}.
+        Returns parsed JSON response. Raises on error.
+        """
+        boundary = "----ComfyUIRender" + uuid.uuid4().hex
+        parts = []
+        for name, value in fields.items():
+            parts.append((
+                "--{0}\r\nContent-Disposition: form-data; name=\"{1}\"\r\n\r\n"
+                "{2}\r\n").format(boundary, name, value).encode("utf-8"))
+        for name, (filename, data, ctype) in files.items():
+            parts.append((
+                "--{0}\r\nContent-Disposition: form-data; name=\"{1}\"; "
+                "filename=\"{2}\"\r\nContent-Type: {3}\r\n\r\n").format(
+                    boundary, name, filename, ctype).encode("utf-8"))
+            parts.append(data)
+            parts.append(b"\r\n")
+        parts.append("--{0}--\r\n".format(boundary).encode("utf-8"))
+        body = b"".join(parts)
+        try:
+            status, data = self.request(
+                "POST", path, body,
+                {"Content-Type": "multipart/form-data; boundary=" + boundary},
+                timeout=timeout)
+        except ConnectionFailed as ex:
+            raise ConnectionFailed("Upload failed: {0}\nURL was: {1}".format(
+                str(ex), self._url(path)))
+        text = data.decode("utf-8", "replace")
+        if status >= 400:
+            raise Exception("HTTP {0} from {1}\nResponse: {2}".format(
+                status, self._url(path), text[:500]))
+        return json.loads(text)
+
+    def download(self, path, dest_path, on_progress=None, timeout=120):
+        """
+        Stream GET path straight into dest_path (via a .part file, renamed
+        when complete). Returns the byte count. Raises on error.
+        """
+        part = dest_path + ".part"
+        try:
+            with open(part, "wb") as sink:
+                status, result = self.request(
+                    "GET", path, timeout=timeout, sink=sink, on_progress=on_progress)
+            if status >= 400:
+                raise Exception("HTTP {0} downloading {1}".format(status, self._url(path)))
+            if os.path.exists(dest_path):
+                os.remove(dest_path)
+            os.rename(part, dest_path)
+            return result
+        finally:
+            if os.path.exists(part):
+                os.remove(part)
+
+    def get_bytes(self, path, timeout=120):
+        """GET path, return raw bytes. Raises on error."""
         try:
-            body_text = ex.read().decode("utf-8")
-            msg = "HTTP {0} from {1}\nResponse: {2}".format(
-                ex.code, url, body_text[:500])
-        except Exception:
-            msg = "Request failed: {0}\nURL was: {1}".format(str(ex), url)
-        raise Exception(msg)
+            status, data = self.request("GET", path, timeout=timeout)
+        except ConnectionFailed as ex:
+            raise ConnectionFailed("Download failed: {0}\nURL: {1}".format(
+                str(ex), self._url(path)))
+        if status >= 400:
+            raise Exception("HTTP {0} downloading {1}".format(status, self._url(path)))
+        return data
+
+
+_clients      = {}
+_clients_lock = threading.Lock()
+
+def client_for(base_url):
+    """Shared ComfyClient for base_url (one connection pool per server)."""
+    key = base_url.rstrip("/")
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = ComfyClient(key)
+        return client
+
+
+# ── POST JSON ─────────────────────────────────────────────────────────────────
+def post_json(base_url, endpoint, payload):
+    """POST dict (or pre-serialized byte chunks) as JSON. Raises on error."""
+    return client_for(base_url).post_json(endpoint, payload)
 
 
 # ── GET JSON ──────────────────────────────────────────────────────────────────
 def get_json(url):
     """GET URL, return parsed JSON. Returns {} on any error."""
     try:
-        urlopen, Request = _get_urlopen()
-        resp = urlopen(url, timeout=30)
-        return json.loads(resp.read().decode("utf-8"))
+        base, path = _split_url(url)
+        return client_for(base).get_json(path)
     except Exception:
         return {}
 
@@ -68,54 +337,170 @@ def get_json(url):
 # ── GET bytes ─────────────────────────────────────────────────────────────────
 def get_bytes(url):
     """GET URL, return raw bytes. Raises on error."""
-    urlopen, Request = _get_urlopen()
-    try:
-        resp = urlopen(url, timeout=120)
-        return resp.read()
-    except Exception as ex:
-        try:
-            msg = "HTTP {0} downloading {1}".format(ex.code, url)
-        except Exception:
-            msg = "Download failed: {0}\nURL: {1}".format(str(ex), url)
-        raise Exception(msg)
+    base, path = _split_url(url)
+    return client_for(base).get_bytes(path)
 
 
 # ── Image to base64 ───────────────────────────────────────────────────────────
 def image_to_base64(image_path):
     """Read PNG file, return base64 string (no header prefix)."""
-    with open(image_path, "rb") as f:
-        data = f.read()
-    encoded = base64.b64encode(data)
+    with tracing.span("base64") as sp:
+        with open(image_path, "rb") as f:
+            data = f.read()
+        encoded = base64.b64encode(data)
+        sp.set(bytes=len(encoded))
     if isinstance(encoded, bytes):
         return encoded.decode("utf-8")
     return str(encoded)
 
 
+# ── Upload snapshot ───────────────────────────────────────────────────────────
+_uploads      = {}      # (base_url, sha1) -> server filename for LoadImage
+_uploading    = {}      # (base_url, sha1) -> lock held while that upload runs
+_uploads_lock = threading.Lock()
+
+def upload_image(base_url, image_path, subfolder="revit", force=False,
+                 data=None, digest=None):
+    """
+    Upload a snapshot to ComfyUI's input folder via /upload/image.
+    The server name is derived from the content hash, and uploads are
+    remembered per server, so re-rendering the same snapshot sends nothing;
+    workers uploading the same snapshot at once wait for the first one.
+    Pass data (and its SHA-1 hex digest) when the bytes are already in
+    memory; the file is not read then.
+    Returns the name to put in LoadImage's "image" input ("subfolder/name").
+    """
+    key_base = base_url.rstrip("/")
+    if data is None:
+        with open(image_path, "rb") as f:
+            data = f.read()
+        digest = None
+    if digest is None:
+        digest = hashlib.sha1(data).hexdigest()
+    key    = (key_base, digest)
+    with _uploads_lock:
+        lock = _uploading.setdefault(key, threading.Lock())
+    with lock:
+        if not force:
+            with _uploads_lock:
+                if key in _uploads:
+                    return _uploads[key]
+
+        with tracing.span("upload", bytes=len(data)):
+            resp = client_for(key_base).post_multipart(
+                "/upload/image",
+                {"type": "input", "subfolder": subfolder, "overwrite": "true"},
+                {"image": ("revit_{0}.png".format(digest[:16]), data, "image/png")})
+        name = resp.get("name")
+        if not name:
+            raise Exception("Upload returned no filename. Got: " + str(resp)[:300])
+        if resp.get("subfolder"):
+            name = resp["subfolder"] + "/" + name
+        with _uploads_lock:
+            _uploads[key] = name
+    return name
+
+
+# ── Queue management ──────────────────────────────────────────────────────────
+def delete_queued(base_url, prompt_ids):
+    """Remove prompts that are still pending in ComfyUI's queue."""
+    if prompt_ids:
+        post_json(base_url, "/queue", {"delete": list(prompt_ids)})
+
+
+def running_prompts(base_url):
+    """prompt_ids executing on the server right now (from /queue)."""
+    queue = client_for(base_url).get_json("/queue", timeout=5)
+    return [item[1] for item in queue.get("queue_running", []) if len(item) > 1]
+
+
+def interrupt_prompt(base_url, prompt_id):
+    """
+    Interrupt prompt_id only if it is the prompt executing. A bare
+    /interrupt stops whatever runs, for every client of the server, so
+    /queue is checked first and prompt_id is sent along for servers that
+    support targeted interrupts. Returns True if an interrupt was sent.
+    """
+    if prompt_id not in running_prompts(base_url):
+        return False
+    post_json(base_url, "/interrupt", {"prompt_id": prompt_id})
+    return True
+
+
+def cancel_prompt(base_url, prompt_id, interrupt=True):
+    """
+    Take one prompt off a server: delete it if pending, interrupt it if
+    running (unless interrupt=False). Never touches other prompts.
+    """
+    delete_queued(base_url, [prompt_id])
+    if interrupt:
+        interrupt_prompt(base_url, prompt_id)
+
+
 # ── Download result ───────────────────────────────────────────────────────────
-def download_image(base_url, filename):
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+_PNG_IEND      = b"\x00\x00\x00\x00IEND\xaeB`\x82"
+
+def is_complete_png(path):
+    """True if the file starts with the PNG signature and ends with IEND."""
+    try:
+        with open(path, "rb") as f:
+            head = f.read(8)
+            f.seek(0, 2)
+            if f.tell() < 8 + 12:
+                return False
+            f.seek(-12, 2)
+            tail = f.read(12)
+        return head == _PNG_SIGNATURE and tail == _PNG_IEND
+    except Exception:
+        return False
+
+
+def download_image(base_url, image, dest_path, on_progress=None):
     """
-    Download output image from /view endpoint.
-    Tries type=output first, then type=temp, then type=input.
-    ComfyUI nodes like easyPreview save to temp, not output.
+    Stream an output image from the /view endpoint straight to dest_path.
+
+    image is an output descriptor from /history or the websocket
+    ({"filename", "subfolder", "type"}): exactly one request is made.
+    A bare filename is also accepted; its folder is then unknown, so
+    type=output, temp and input are tried in turn (easyPreview-style nodes
+    save to temp, not output).
+    The file is checked to be a complete PNG (signature + IEND); a
+    truncated transfer is retried once. Returns dest_path.
     """
-    enc      = _url_quote(filename)
-    base     = base_url.rstrip("/")
-    urlopen, Request = _get_urlopen()
+    client = client_for(base_url)
+    if isinstance(image, dict):
+        filename  = image["filename"]
+        subfolder = image.get("subfolder", "")
+        ftypes    = (image.get("type") or "output",)
+    else:
+        filename, subfolder = image, ""
+        ftypes    = ("output", "temp", "input")
+    query = "/view?filename={0}".format(_url_quote(filename))
+    if subfolder:
+        query += "&subfolder={0}".format(_url_quote(subfolder))
 
-    for ftype in ("output", "temp", "input"):
-        url = "{0}/view?filename={1}&type={2}".format(base, enc, ftype)
-        try:
-            resp = urlopen(url, timeout=120)
-            data = resp.read()
-            if len(data) > 1000:   # real image, not an error page
-                return data
-        except Exception:
-            pass   # try next type
+    error = "not found"
+    with tracing.span("download") as sp:
+        for ftype in ftypes:
+            path = "{0}&type={1}".format(query, ftype)
+            for attempt in (1, 2):
+                try:
+                    size = client.download(path, dest_path, on_progress, timeout=120)
+                except Exception as ex:
+                    error = str(ex)
+                    break   # not there — try next type
+                if is_complete_png(dest_path):
+                    sp.set(bytes=size)
+                    return dest_path
+                error = "incomplete or not a PNG"
+            if os.path.exists(dest_path):
+                os.remove(dest_path)
 
     raise Exception(
         "Could not download image \'\'{0}\'\' from ComfyUI.\n"
-        "Tried types: output, temp, input.\n"
-        "URL base: {1}".format(filename, base)
+        "Tried types: {1} ({2}).\n"
+        "URL base: {3}".format(filename, ", ".join(ftypes), error, client.base_url)
     )
 
 
@@ -126,10 +511,461 @@ def test_connection(base_url):
     Returns (True, "OK") or (False, error_message).
     """
     try:
-        urlopen, Request = _get_urlopen()
-        url  = base_url.rstrip("/") + "/system_stats"
-        resp = urlopen(url, timeout=5)
-        resp.read()
+        status, _ = client_for(base_url).request(
+            "GET", "/system_stats", timeout=5, retries=0)
+        if status >= 400:
+            raise Exception("HTTP {0}".format(status))
         return True, "Connected"
     except Exception as ex:
         return False, "Cannot reach {0}\n{1}".format(base_url, str(ex))
+
+
+# ── History parsing ───────────────────────────────────────────────────────────
+def output_descriptor(img):
+    """Normalise an image entry from /history or an executed event."""
+    return {
+        "filename":  img["filename"],
+        "subfolder": img.get("subfolder", ""),
+        "type":      img.get("type", "output"),
+    }
+
+
+def find_output_image(history, prompt_id):
+    """
+    Pick the result image for prompt_id from a /history response.
+    Prefers type=output (SaveImage) over temp previews.
+    Returns an output descriptor ({"filename", "subfolder", "type"}) for
+    download_image, or None if the job has no images yet.
+    """
+    if prompt_id not in history:
+        return None
+    all_imgs = []
+    for node_out in history[prompt_id].get("outputs", {}).values():
+        for img in node_out.get("images", []):
+            all_imgs.append(img)
+    for img in all_imgs:
+        if img.get("type", "") == "output":
+            return output_descriptor(img)
+    if all_imgs:
+        return output_descriptor(all_imgs[0])
+    return None
+
+
+def history_error(history, prompt_id):
+    """
+    Why prompt_id failed, from its /history entry (status.messages), or None
+    if it has no entry yet or finished normally.
+    """
+    entry = history.get(prompt_id)
+    if not entry:
+        return None
+    status = entry.get("status") or {}
+    if status.get("status_str") != "error" and status.get("completed", True):
+        return None
+    for message in reversed(status.get("messages") or []):
+        kind, data = message[0], (message[1] if len(message) > 1 else {}) or {}
+        if kind == "execution_error":
+            return "ComfyUI error in node {0} ({1}):\n{2}".format(
+                data.get("node_id", "?"), data.get("node_type", "?"),
+                data.get("exception_message", ""))
+        if kind == "execution_interrupted":
+            return "Render was interrupted on the server."
+    return "ComfyUI reported an error (no details)."
+
+
+def queue_state(queue, prompt_id):
+    """
+    Classify prompt_id using a /queue response.
+    Returns ("running", 0), ("pending", position) or ("gone", 0).
+    position is 1-based among the pending items.
+    """
+    for item in queue.get("queue_running", []):
+        if len(item) > 1 and item[1] == prompt_id:
+            return "running", 0
+    pending = sorted(queue.get("queue_pending", []), key=lambda it: it[0])
+    for i, item in enumerate(pending):
+        if len(item) > 1 and item[1] == prompt_id:
+            return "pending", i + 1
+    return "gone", 0
+
+
+# ── Adaptive polling ──────────────────────────────────────────────────────────
+class HistoryPoller(object):
+    """
+    Wait for a queued prompt by polling /history, without a websocket.
+
+    Starts at a sub-second interval and backs off exponentially (with
+    jitter) up to max_interval. /queue is read after each miss to tell
+    "pending" from "running": the interval resets to `initial` when the
+    job starts running or leaves the queue, since the result is then close.
+
+    It fails early instead of waiting out the deadline when the history
+    entry reports an error or interruption, when the prompt finished
+    without any image, or when it has been in neither /queue nor /history
+    for `grace` seconds (deleted, or the server restarted).
+
+    Every request and every sleep is recorded in self.events as
+    (kind, label, start_offset, duration); summary() totals them.
+    """
+
+    def __init__(self, base_url, prompt_id, deadline=600, initial=0.25,
+                 factor=1.6, max_interval=5.0, jitter=0.2,
+                 should_stop=None, on_state=None, grace=5.0):
+        self.base_url     = base_url.rstrip("/")
+        self.prompt_id    = prompt_id
+        self.deadline     = deadline
+        self.initial      = initial
+        self.factor       = factor
+        self.max_interval = max_interval
+        self.jitter       = jitter
+        self.should_stop  = should_stop
+        self.on_state     = on_state
+        self.grace        = grace
+        self.events       = []
+        self._t0          = None
+
+    def _record(self, kind, label, start):
+        self.events.append((kind, label, start - self._t0, time.time() - start))
+
+    def _get(self, endpoint):
+        start = time.time()
+        try:
+            return get_json(self.base_url + endpoint)
+        finally:
+            self._record("request", endpoint.split("/")[1], start)
+
+    def _sleep(self, seconds):
+        # Sleep in short slices so Stop stays responsive
+        start = time.time()
+        end   = start + seconds
+        try:
+            while True:
+                if self.should_stop and self.should_stop():
+                    raise Exception("Stopped.")
+                left = end - time.time()
+                if left <= 0:
+                    return
+                time.sleep(min(left, 0.25))
+        finally:
+            self._record("wait", "sleep", start)
+
+    def poll(self):
+        """Block until the job has an image. Returns its output descriptor."""
+        self._t0  = time.time()
+        interval  = self.initial
+        state     = None
+        gone_at   = None
+        while True:
+            spread = interval * self.jitter
+            self._sleep(interval + random.uniform(-spread, spread))
+
+            history = self._get("/history/" + self.prompt_id)
+            image   = find_output_image(history, self.prompt_id)
+            if image:
+                return image
+            error = history_error(history, self.prompt_id)
+            if error:
+                raise Exception(error)
+            if self.prompt_id in history:
+                raise Exception("Prompt finished without an output image.")
+
+            new_state, position = queue_state(self._get("/queue"), self.prompt_id)
+            if new_state != "gone":
+                gone_at = None
+            elif gone_at is None:
+                gone_at = time.time()
+            elif time.time() - gone_at > self.grace:
+                raise Exception("Prompt is no longer queued on the server and has no "
+                                "history (deleted, or ComfyUI restarted).")
+            if self.on_state:
+                self.on_state(new_state, time.time() - self._t0, position)
+
+            if new_state != "pending" and new_state != state:
+                interval = self.initial
+            else:
+                interval = min(interval * self.factor, self.max_interval)
+            state = new_state
+
+            if time.time() - self._t0 > self.deadline:
+                raise Exception("Timed out after {0}s.".format(int(self.deadline)))
+
+    def summary(self):
+        """Totals of the recorded timeline, in seconds."""
+        waiting  = sum(e[3] for e in self.events if e[0] == "wait")
+        requests = [e for e in self.events if e[0] == "request"]
+        wall     = 0.0
+        if self.events:
+            last = self.events[-1]
+            wall = last[2] + last[3]
+        return {
+            "wall":         wall,
+            "waiting":      waiting,
+            "requests":     len(requests),
+            "request_time": sum(e[3] for e in requests),
+        }
+
+
+# ── WebSocket progress ────────────────────────────────────────────────────────
+_WS_GUID      = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+_WS_MAX_FRAME = 64 << 20        # larger than any preview; guards a corrupt length
+
+
+class ComfyWebSocket(object):
+    """
+    Minimal client for ComfyUI's /ws endpoint (RFC 6455, client side only).
+    Connect BEFORE posting to /prompt with the same client_id, otherwise
+    the first events of the job can be missed.
+    Binary frames (live previews) are read and discarded.
+    """
+
+    def __init__(self, base_url, client_id, timeout=5):
+        self.base_url  = base_url.rstrip("/")
+        self.client_id = client_id
+        self.timeout   = timeout
+        self._sock     = None
+        self._buf      = bytearray()
+        self._message  = None           # (opcode, data) of a fragmented message
+
+    # ── Connection ────────────────────────────────────────────────────────
+
+    def connect(self):
+        parts = _url_split(self.base_url)
+        if parts.scheme != "http":
+            raise Exception("WebSocket only supported over http://")
+        host = parts.hostname
+        port = parts.port or 80
+
+        sock = socket.create_connection((host, port), self.timeout)
+        key  = base64.b64encode(os.urandom(16))
+        if isinstance(key, bytes):
+            key = key.decode("ascii")
+        request = (
+            "GET /ws?clientId={0} HTTP/1.1\r\n"
+            "Host: {1}:{2}\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            "Sec-WebSocket-Key: {3}\r\n"
+            "Sec-WebSocket-Version: 13\r\n\r\n"
+        ).format(_url_quote(self.client_id), host, port, key)
+        sock.sendall(request.encode("ascii"))
+
+        self._sock = sock
+        head = self._read_http_head()
+        status = head.split("\r\n", 1)[0]
+        if status.split(" ")[1:2] != ["101"]:
+            self.close()
+            raise Exception("WebSocket upgrade refused: " + status)
+
+        expected = base64.b64encode(
+            hashlib.sha1((key + _WS_GUID).encode("ascii")).digest())
+        if isinstance(expected, bytes):
+            expected = expected.decode("ascii")
+        if expected not in head:
+            self.close()
+            raise Exception("WebSocket handshake: bad Sec-WebSocket-Accept")
+        return self
+
+    def close(self):
+        if self._sock is not None:
+            try:
+                self._send_frame(0x8, b"")
+            except Exception:
+                pass
+            try:
+                self._sock.close()
+            except Exception:
+                pass
+        self._sock = None
+
+    # ── Low-level IO ──────────────────────────────────────────────────────
+
+    def _fill(self):
+        chunk = self._sock.recv(65536)
+        if not chunk:
+            raise Exception("WebSocket closed by server")
+        self._buf.extend(bytearray(chunk))
+
+    def _read_http_head(self):
+        while True:
+            idx = self._buf.find(b"\r\n\r\n")
+            if idx >= 0:
+                head = bytes(self._buf[:idx]).decode("latin-1")
+                del self._buf[:idx + 4]
+                return head
+            if len(self._buf) > 65536:
+                raise Exception("WebSocket handshake: header too large")
+            self._fill()
+
+    def _send_frame(self, opcode, payload):
+        payload = bytearray(payload)
+        n       = len(payload)
+        header  = bytearray([0x80 | opcode])
+        if n < 126:
+            header.append(0x80 | n)
+        elif n < 65536:
+            header.append(0x80 | 126)
+            header.extend(bytearray(struct.pack(">H", n)))
+        else:
+            header.append(0x80 | 127)
+            header.extend(bytearray(struct.pack(">Q", n)))
+        mask = bytearray(os.urandom(4))
+        header.extend(mask)
+        for i in range(n):
+            payload[i] ^= mask[i % 4]
+        self._sock.sendall(bytes(header + payload))
+
+    def _parse_frame(self):
+        """
+        Take the first complete frame off the buffer: (fin, opcode, payload),
+        or None while part of it is still to arrive. Nothing is consumed
+        until the whole frame is there, so a recv timeout mid-frame leaves
+        the stream aligned.
+        """
+        buf = self._buf
+        if len(buf) < 2:
+            return None
+        b1, b2 = buf[0], buf[1]
+        n   = b2 & 0x7F
+        pos = 2
+        if n == 126:
+            if len(buf) < 4:
+                return None
+            n, pos = struct.unpack(">H", bytes(buf[2:4]))[0], 4
+        elif n == 127:
+            if len(buf) < 10:
+                return None
+            n, pos = struct.unpack(">Q", bytes(buf[2:10]))[0], 10
+        if n > _WS_MAX_FRAME:
+            raise Exception("WebSocket frame too large ({0} bytes)".format(n))
+        mask = None
+        if b2 & 0x80:
+            if len(buf) < pos + 4:
+                return None
+            mask = buf[pos:pos + 4]
+            pos += 4
+        if len(buf) < pos + n:
+            return None
+        payload = buf[pos:pos + n]
+        del buf[:pos + n]
+        if mask:
+            for i in range(n):
+                payload[i] ^= mask[i % 4]
+        return bool(b1 & 0x80), b1 & 0x0F, payload
+
+    def _read_frame(self):
+        frame = self._parse_frame()
+        while frame is None:
+            self._fill()                # may raise socket.timeout; buffer kept
+            frame = self._parse_frame()
+        return frame
+
+    def recv_message(self):
+        """
+        Return the next JSON text message as a dict.
+        Returns None for binary frames, control frames and the first parts
+        of a fragmented message (kept until its last fragment arrives).
+        Raises socket.timeout if nothing arrives within self.timeout; the
+        next call picks up where this one stopped.
+        """
+        fin, opcode, payload = self._read_frame()
+        if opcode == 0x9:                       # ping
+            self._send_frame(0xA, payload)
+            return None
+        if opcode == 0x8:                       # close
+            self._sock.close()
+            self._sock = None
+            raise Exception("WebSocket closed by server")
+        if opcode in (0x1, 0x2):
+            self._message = (opcode, payload)
+        elif opcode == 0x0 and self._message is not None:
+            self._message[1].extend(payload)    # continuation
+        else:
+            return None
+        if not fin:
+            return None
+        opcode, data = self._message
+        self._message = None
+        if opcode == 0x2:
+            return None                         # preview image bytes
+        try:
+            return json.loads(bytes(data).decode("utf-8"))
+        except ValueError:
+            return None
+
+    # ── Job tracking ──────────────────────────────────────────────────────
+
+    def wait_for_outputs(self, prompt_ids, on_output=None, on_progress=None,
+                         should_stop=None, timeout=600, on_start=None):
+        """
+        Follow execution events for every id in prompt_ids (all queued with
+        this socket's client_id) until each one has finished.
+
+        on_output(prompt_id, image) fires as soon as a node reports a
+        saved (type=output) image for that prompt; image is an output
+        descriptor for download_image.
+        on_progress(prompt_id, value, max) is called for every sampler step.
+        on_start(prompt_id) fires when ComfyUI starts executing the prompt.
+        should_stop() is checked every second; when True, raises "Stopped.".
+        Returns {prompt_id: image}. A prompt that finished without
+        reporting an image (e.g. fully cached) maps to None — read /history.
+        """
+        self._sock.settimeout(1.0)
+        deadline = time.time() + timeout
+        waiting  = set(prompt_ids)
+        results  = {}
+        temp     = {}
+
+        def _finish(pid, image):
+            waiting.discard(pid)
+            results[pid] = image
+            if image and on_output:
+                on_output(pid, image)
+
+        while waiting:
+            if should_stop and should_stop():
+                raise Exception("Stopped.")
+            if time.time() > deadline:
+                raise Exception("Timed out.")
+            try:
+                msg = self.recv_message()
+            except socket.timeout:
+                continue
+            if not msg:
+                continue
+
+            mtype = msg.get("type")
+            data  = msg.get("data") or {}
+            pid   = data.get("prompt_id")
+            if pid not in waiting:
+                continue
+
+            if mtype == "execution_start":
+                if on_start:
+                    on_start(pid)
+            elif mtype == "progress":
+                if on_progress:
+                    on_progress(pid, data.get("value", 0), data.get("max", 0))
+            elif mtype == "executed":
+                for img in (data.get("output") or {}).get("images", []):
+                    if img.get("type", "") == "output":
+                        _finish(pid, output_descriptor(img))
+                        break
+                    temp.setdefault(pid, output_descriptor(img))
+            elif mtype == "execution_error":
+                raise Exception("ComfyUI error in node {0} ({1}):\n{2}".format(
+                    data.get("node_id", "?"), data.get("node_type", "?"),
+                    data.get("exception_message", "")))
+            elif mtype == "execution_interrupted":
+                raise Exception("Stopped.")
+            elif mtype == "execution_success" or (
+                    mtype == "executing" and data.get("node") is None):
+                _finish(pid, temp.get(pid))
+        return results
+
+
+def open_websocket(base_url, client_id, timeout=5):
+    """Open a ComfyWebSocket, or return None if the socket can't be opened."""
+    try:
+        return ComfyWebSocket(base_url, client_id, timeout).connect()
+    except Exception:
+        return None
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+image_ops.py
+Pure-Python image geometry, PNG encoding and change detection.
+
+snapshot.py uses center_crop_box() to drive System.Drawing, so the crop
+maths is the same on Revit and off it. The pixel routines work on packed
+8-bit buffers (`channels` bytes per pixel, rows packed without padding);
+pass a bytearray — under IronPython 2.7 `bytes` is str, whose items are
+characters, not ints.
+
+luma_signature() / signature_difference() are the change detector of watch
+mode: a frame is reduced to a small grid of luma values, so comparing two
+views costs a few hundred subtractions.
+
+IronPython 2.7 compatible (encode_png is slow there; snapshots are encoded
+with System.Drawing).
+"""
+
+import struct
+import zlib
+
+
+def center_crop_box(src_w, src_h, target_w, target_h):
+    """
+    Largest centred rectangle of src with the target aspect ratio.
+    Returns (x, y, w, h) in source pixels.
+    """
+    target_ratio = float(target_w) / float(target_h)
+    src_ratio    = float(src_w) / float(src_h)
+    if src_ratio > target_ratio:
+        crop_w = int(round(src_h * target_ratio))
+        crop_h = src_h
+    else:
+        crop_w = src_w
+        crop_h = int(round(src_w / target_ratio))
+    crop_w = max(1, min(crop_w, src_w))
+    crop_h = max(1, min(crop_h, src_h))
+    return (src_w - crop_w) // 2, (src_h - crop_h) // 2, crop_w, crop_h
+
+
+def _png_chunk(tag, data):
+    crc = zlib.crc32(tag + data) & 0xFFFFFFFF
+    return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", crc)
+
+
+def encode_png(pixels, width, height, channels=3, level=6):
+    """Encode packed RGB (3) or RGBA (4) pixels as PNG bytes."""
+    color  = {3: 2, 4: 6}[channels]
+    stride = width * channels
+    raw    = bytearray()
+    for y in range(height):
+        raw.append(0)                                   # filter: none
+        raw.extend(pixels[y * stride:(y + 1) * stride])
+    header = struct.pack(">IIBBBBB", width, height, 8, color, 0, 0, 0)
+    return (b"\x89PNG\r\n\x1a\n"
+            + _png_chunk(b"IHDR", header)
+            + _png_chunk(b"IDAT", zlib.compress(bytes(raw), level))
+            + _png_chunk(b"IEND", b""))
+
+
+# ── Change detection ──────────────────────────────────────────────────────────
+
+SIGNATURE_COLS = 32
+SIGNATURE_ROWS = 18
+
+
+def luma_signature(pixels, width, height, channels=3,
+                   cols=SIGNATURE_COLS, rows=SIGNATURE_ROWS, samples=4):
+    """
+    Perceptual fingerprint of an RGB(A) frame: cols x rows cells of mean
+    luma (0-255). Each cell averages a samples x samples grid of pixels
+    instead of all of them, so the cost doesn't grow with the frame size.
+    Returns a bytearray of cols * rows values.
+    """
+    def _points(cell, cells, length):
+        return [min(length - 1, int((cell + (k + 0.5) / samples) * length / cells))
+                for k in range(samples)]
+
+    stride = width * channels
+    xs     = [[x * channels for x in _points(c, cols, width)] for c in range(cols)]
+    out    = bytearray(cols * rows)
+    scale  = 1000.0 * samples * samples
+    i      = 0
+    for r in range(rows):
+        row_offsets = [y * stride for y in _points(r, rows, height)]
+        for c in range(cols):
+            total = 0
+            for row in row_offsets:
+                for x in xs[c]:
+                    p = row + x
+                    # Rec. 601 luma in integer maths
+                    total += 299 * pixels[p] + 587 * pixels[p + 1] + 114 * pixels[p + 2]
+            out[i] = int(total / scale + 0.5)
+            i += 1
+    return out
+
+
+def signature_difference(a, b):
+    """Mean absolute luma difference of two signatures: 0.0 (same) to 1.0."""
+    if a is None or b is None or len(a) != len(b) or not a:
+        return 1.0
+    return sum(abs(x - y) for x, y in zip(a, b)) / (255.0 * len(a))
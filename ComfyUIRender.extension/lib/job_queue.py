@@ -0,0 +1,452 @@
+# -*- coding: utf-8 -*-
+"""
+job_queue.py
+Render jobs and a bounded pool of background workers.
+
+A RenderJob moves through
+    queued -> submitted -> running -> downloading -> done
+and can end in failed or cancelled from any point. Each job carries its own
+cancel event (replacing a global stop flag) plus cancel hooks, so the runner
+can remove exactly its own prompt from ComfyUI. Hooks run on background
+threads: cancel() never waits on the network, even on the UI thread.
+
+The queue knows nothing about ComfyUI: it calls runner(job) on a worker
+thread, and the runner reports back through job.set_state / set_progress.
+PipelineQueue instead splits the runner into stages with their own worker
+threads, so different jobs can be in different stages at the same time.
+UI code subscribes with add_listener(fn); fn(job) is called on the worker
+thread after every change, so WPF listeners must marshal to the Dispatcher.
+Headless callers can instead block on job.wait() / job.result().
+
+IronPython 2.7 compatible.
+"""
+
+import threading
+import time
+from collections import deque
+
+try:
+    import queue as _queue
+except ImportError:
+    import Queue as _queue
+
+QUEUED      = "queued"
+SUBMITTED   = "submitted"
+RUNNING     = "running"
+DOWNLOADING = "downloading"
+DONE        = "done"
+FAILED      = "failed"
+CANCELLED   = "cancelled"
+
+FINISHED = (DONE, FAILED, CANCELLED)
+
+CANCEL_WORKERS = 4      # threads running cancel hooks (shared by all queues)
+
+
+class _CancelRunner(object):
+    """
+    Runs cancel hooks on daemon threads. Hooks talk to ComfyUI (delete or
+    interrupt a prompt) and can take a request timeout on a slow server, so
+    cancel() — often called on the UI thread — only hands them over.
+    """
+
+    def __init__(self, workers):
+        self.workers  = workers
+        self._q       = _queue.Queue()
+        self._threads = []
+        self._pending = 0
+        self._cond    = threading.Condition()
+
+    def run(self, job, hooks):
+        with self._cond:
+            self._pending += 1
+            if len(self._threads) < self.workers:
+                t = threading.Thread(target=self._work)
+                t.daemon = True
+                t.start()
+                self._threads.append(t)
+        self._q.put((job, hooks))
+
+    def wait(self, timeout=None):
+        """Block until every handed-over hook has run. Returns False on timeout."""
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while self._pending:
+                left = None if deadline is None else deadline - time.time()
+                if left is not None and left <= 0:
+                    return False
+                self._cond.wait(left)
+        return True
+
+    def _work(self):
+        while True:
+            job, hooks = self._q.get()
+            for hook in hooks:
+                try:
+                    hook(job)
+                except Exception:
+                    pass
+            with self._cond:
+                self._pending -= 1
+                self._cond.notify_all()
+
+
+_cancels = _CancelRunner(CANCEL_WORKERS)
+
+
+def wait_for_cancels(timeout=None):
+    """Wait for pending cancel hooks (e.g. before a script exits)."""
+    return _cancels.wait(timeout)
+
+
+class RenderJob(object):
+    """One render request (one prompt + seed on one snapshot)."""
+
+    _ids      = [0]
+    _ids_lock = threading.Lock()
+
+    def __init__(self, snapshot, prompt, seed, **options):
+        with RenderJob._ids_lock:
+            RenderJob._ids[0] += 1
+            self.id = RenderJob._ids[0]
+        self.snapshot    = snapshot
+        self.prompt      = prompt
+        self.seed        = seed
+        self.options     = options       # free-form extras for the runner
+        self.state       = QUEUED
+        self.progress    = (0, 0)        # sampler (value, max)
+        self.message     = ""
+        self.error       = None
+        self.result_path = None
+        self.base_url    = None          # server that ran the job
+        self.prompt_id   = None
+        self.created     = time.time()
+        self.finished    = None
+        self.times       = {QUEUED: self.created}   # state -> when entered
+        self._queue      = None
+        self._cancel     = threading.Event()
+        self._done       = threading.Event()
+        self._hooks      = []
+        self._lock       = threading.Lock()
+
+    # ── Cancellation ──────────────────────────────────────────────────────
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def cancel(self):
+        """
+        Request cancellation. Returns at once: hooks run once, on a cancel
+        worker thread (see wait_for_cancels).
+        """
+        with self._lock:
+            if self._cancel.is_set() or self.state in FINISHED:
+                return
+            self._cancel.set()
+            hooks, self._hooks = self._hooks, []
+        if hooks:
+            _cancels.run(self, hooks)
+        if self.state == QUEUED:
+            self.set_state(CANCELLED)
+
+    def add_cancel_hook(self, fn):
+        """
+        fn(job) runs if the job is cancelled; immediately, on the calling
+        thread, if it already was.
+        """
+        with self._lock:
+            if not self._cancel.is_set():
+                self._hooks.append(fn)
+                return
+        fn(self)
+
+    def check_cancelled(self):
+        if self._cancel.is_set():
+            raise Exception("Stopped.")
+
+    # ── Result ────────────────────────────────────────────────────────────
+
+    def wait(self, timeout=None):
+        """Block until the job is finished. Returns False on timeout."""
+        return self._done.wait(timeout)
+
+    def result(self, timeout=None):
+        """Result path once done; raises if the job failed, was cancelled or timed out."""
+        if not self.wait(timeout):
+            raise Exception("Timed out waiting for job #{0}.".format(self.id))
+        if self.state == FAILED:
+            raise Exception(self.error or "Render failed.")
+        if self.state == CANCELLED:
+            raise Exception("Stopped.")
+        return self.result_path
+
+    # ── Reporting ─────────────────────────────────────────────────────────
+
+    def set_state(self, state, message=""):
+        with self._lock:
+            if self.state in FINISHED:
+                return
+            self.state   = state
+            self.message = message
+            self.times.setdefault(state, time.time())
+            if state in FINISHED:
+                self.finished = time.time()
+                self._done.set()
+        self._notify()
+
+    def set_progress(self, value, total):
+        self.progress = (value, total)
+        self._notify()
+
+    def set_message(self, message):
+        self.message = message
+        self._notify()
+
+    def _notify(self):
+        if self._queue is not None:
+            self._queue._notify(self)
+
+    @property
+    def label(self):
+        text = self.prompt if len(self.prompt) <= 40 else self.prompt[:37] + "..."
+        return "#{0}  {1}".format(self.id, text)
+
+
+class JobQueue(object):
+    """
+    Bounded worker pool. At most max_jobs unfinished jobs are accepted;
+    `workers` of them run at once (a small number keeps ComfyUI's own queue
+    fed with the next job without flooding it). Only the newest
+    keep_finished finished jobs are remembered; older ones are dropped when
+    a job is submitted.
+    """
+
+    def __init__(self, runner, workers=2, max_jobs=50, keep_finished=50):
+        self.runner        = runner
+        self.workers       = workers
+        self.max_jobs      = max_jobs
+        self.keep_finished = keep_finished
+        self._q         = _queue.Queue()
+        self._jobs      = []
+        self._listeners = []
+        self._lock      = threading.Lock()
+        self._threads   = []
+
+    # ── Listeners ─────────────────────────────────────────────────────────
+
+    def add_listener(self, fn):
+        with self._lock:
+            self._listeners.append(fn)
+
+    def remove_listener(self, fn):
+        with self._lock:
+            if fn in self._listeners:
+                self._listeners.remove(fn)
+
+    def _notify(self, job):
+        with self._lock:
+            listeners = list(self._listeners)
+        for fn in listeners:
+            try:
+                fn(job)
+            except Exception:
+                pass
+
+    # ── Jobs ──────────────────────────────────────────────────────────────
+
+    def submit(self, job):
+        with self._lock:
+            active = [j for j in self._jobs if j.state not in FINISHED]
+            if len(active) >= self.max_jobs:
+                raise Exception("Render queue is full ({0} jobs).".format(self.max_jobs))
+            job._queue = self
+            self._jobs.append(job)
+            self._prune(self.keep_finished)
+            self._start_workers()
+        self._enqueue(job)
+        self._notify(job)
+        return job
+
+    def jobs(self):
+        with self._lock:
+            return list(self._jobs)
+
+    def active(self):
+        return [j for j in self.jobs() if j.state not in FINISHED]
+
+    def get(self, job_id):
+        for j in self.jobs():
+            if j.id == job_id:
+                return j
+        return None
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is not None:
+            job.cancel()
+
+    def cancel_all(self):
+        for job in self.active():
+            job.cancel()
+
+    def clear_finished(self, keep=0):
+        """Forget finished jobs except the newest `keep`."""
+        with self._lock:
+            self._prune(keep)
+
+    def _prune(self, keep):
+        finished = [j for j in self._jobs if j.state in FINISHED]
+        if len(finished) > keep:
+            drop = set(j.id for j in finished[:len(finished) - keep])
+            self._jobs = [j for j in self._jobs if j.id not in drop]
+
+    # ── Workers ───────────────────────────────────────────────────────────
+
+    def _enqueue(self, job):
+        self._q.put(job)
+
+    def _start_workers(self):
+        self._threads = [t for t in self._threads if t.is_alive()]
+        while len(self._threads) < self.workers:
+            t = threading.Thread(target=self._work)
+            t.daemon = True
+            t.start()
+            self._threads.append(t)
+
+    def _work(self):
+        while True:
+            job = self._q.get()
+            if job is None:
+                return
+            if job.cancelled or job.state in FINISHED:
+                job.set_state(CANCELLED)
+                continue
+            try:
+                self.runner(job)
+                if job.cancelled:
+                    job.set_state(CANCELLED)
+                else:
+                    job.set_state(DONE, job.message)
+            except Exception as ex:
+                if job.cancelled:
+                    job.set_state(CANCELLED)
+                else:
+                    job.error = str(ex)
+                    job.set_state(FAILED, job.error)
+
+    def shutdown(self):
+        """Cancel everything and let the workers exit."""
+        self.cancel_all()
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for _ in threads:
+            self._q.put(None)
+
+
+class PipelineQueue(JobQueue):
+    """
+    A JobQueue whose runner is split into stages, each with its own worker
+    threads, joined by bounded queues:
+
+        stages = [("prepare", prepare, 2), ("submit", submit, 1), ...]
+
+    Every job gets a ctx dict that travels with it; a stage calls
+    fn(job, ctx), which fills in ctx for the stages after it and returns
+    False to finish the job early (e.g. served from a cache). A full queue
+    blocks the stage before it, so no stage runs more than `depth` jobs
+    ahead of the next one. finish(job, ctx, error) runs once per job before
+    its final state is set, to release whatever the stages acquired.
+    Jobs move on from every stage in the order they were submitted: with
+    several workers on a stage, a job that finishes early waits for the
+    ones ahead of it, so ComfyUI receives prompts in click order.
+    """
+
+    def __init__(self, stages, finish=None, depth=2, max_jobs=50, keep_finished=50):
+        JobQueue.__init__(self, None, workers=0, max_jobs=max_jobs,
+                          keep_finished=keep_finished)
+        self.stages   = stages
+        self.finish   = finish
+        self.depth    = depth
+        self._inboxes = [self._q] + [_queue.Queue(maxsize=depth) for _ in stages[1:]]
+        self._lines   = [deque() for _ in stages]     # jobs in each stage, oldest first
+        self._turn    = threading.Condition()
+        self._closed  = threading.Event()
+
+    def _enqueue(self, job):
+        with self._turn:
+            self._lines[0].append(job)
+            self._q.put(job)
+
+    def _start_workers(self):
+        if self._threads:
+            return
+        for index, (_, _, count) in enumerate(self.stages):
+            for _ in range(count):
+                t = threading.Thread(target=self._stage_work, args=(index,))
+                t.daemon = True
+                t.start()
+                self._threads.append(t)
+
+    def _stage_work(self, index):
+        fn    = self.stages[index][1]
+        inbox = self._inboxes[index]
+        last  = index == len(self.stages) - 1
+        while True:
+            try:
+                item = inbox.get(timeout=0.5)
+            except _queue.Empty:
+                if self._closed.is_set():
+                    return      # shut down and nothing left to drain
+                continue
+            job, ctx = item if index else (item, {})
+            if job.cancelled or job.state in FINISHED:
+                self._leave(index, job)
+                self._end(job, ctx)
+                continue
+            try:
+                more = fn(job, ctx)
+            except Exception as ex:
+                self._leave(index, job)
+                self._end(job, ctx, ex)
+                continue
+            if more is False or last:
+                self._leave(index, job)
+                self._end(job, ctx)
+            else:
+                self._pass_on(index, job, ctx)
+
+    def _pass_on(self, index, job, ctx):
+        """Hand job to the next stage once the jobs ahead of it have moved on."""
+        line = self._lines[index]
+        with self._turn:
+            while line[0] is not job:
+                self._turn.wait()
+            self._lines[index + 1].append(job)
+        # Still first in line: the stage's other jobs wait while this blocks
+        self._inboxes[index + 1].put((job, ctx))
+        self._leave(index, job)
+
+    def _leave(self, index, job):
+        with self._turn:
+            self._lines[index].remove(job)
+            self._turn.notify_all()
+
+    def _end(self, job, ctx, error=None):
+        if self.finish is not None:
+            try:
+                self.finish(job, ctx, error)
+            except Exception:
+                pass
+        if job.cancelled:
+            job.set_state(CANCELLED)
+        elif error is not None:
+            job.error = str(error)
+            job.set_state(FAILED, job.error)
+        else:
+            job.set_state(DONE, job.message)
+
+    def shutdown(self):
+        """Cancel everything; stage workers exit once their queues are drained."""
+        self.cancel_all()
+        self._closed.set()
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+profiles.py
+Resolution profiles: one setting drives the snapshot size, the aspect ratio
+and the workflow's scale nodes together.
+
+The snapshot is captured at exactly the size the model will sample at, so
+the workflow's scale-to-side (141), crop (143) and total-pixels (75:80)
+nodes become pass-throughs instead of resampling the image three times,
+and a draft sends and generates a quarter of the pixels of a standard
+render.
+
+IronPython 2.7 compatible.
+"""
+
+import math
+
+# Name -> megapixels (ComfyUI counts a megapixel as 1024 * 1024)
+PROFILES = [
+    ("draft",    0.25),
+    ("standard", 1.0),
+    ("final",    2.0),
+]
+
+ASPECTS = [
+    ("16:9", (16, 9)),
+    ("3:2",  (3, 2)),
+    ("4:3",  (4, 3)),
+    ("1:1",  (1, 1)),
+    ("9:16", (9, 16)),
+]
+
+# Draft pass of the draft/refine mode: few sampler steps, small latent
+PREVIEW_STEPS      = 4
+PREVIEW_MEGAPIXELS = 0.25
+
+DEFAULT_PROFILE = "standard"
+DEFAULT_ASPECT  = "16:9"
+
+_STEP = 16      # latent-friendly sizes: multiples of 16 px
+
+
+def megapixels(profile):
+    return dict(PROFILES).get(profile, dict(PROFILES)[DEFAULT_PROFILE])
+
+
+def ratio(aspect):
+    w, h = dict(ASPECTS).get(aspect, dict(ASPECTS)[DEFAULT_ASPECT])
+    return float(w) / float(h)
+
+
+def frame_size(profile, aspect):
+    """(width, height) of a profile at an aspect, rounded to multiples of 16."""
+    area = megapixels(profile) * 1024 * 1024
+    r    = ratio(aspect)
+    w    = math.sqrt(area * r)
+    h    = w / r
+    return (max(_STEP, int(round(w / _STEP)) * _STEP),
+            max(_STEP, int(round(h / _STEP)) * _STEP))
+
+
+def workflow_values(profile, aspect):
+    """Slot values for workflow.build / prompt_body (see workflow.SLOTS)."""
+    w, h = frame_size(profile, aspect)
+    return {
+        "side":       h,        # node 141 scales to height
+        "width":      w,
+        "height":     h,
+        "megapixels": megapixels(profile),
+    }
+
+
+def preview_values(profile, aspect):
+    """
+    workflow_values() for a fast preview: the same frame (so the snapshot
+    and a later refine match), sampled at PREVIEW_STEPS on a latent of at
+    most PREVIEW_MEGAPIXELS.
+    """
+    values = workflow_values(profile, aspect)
+    values["steps"]      = PREVIEW_STEPS
+    values["megapixels"] = min(values["megapixels"], PREVIEW_MEGAPIXELS)
+    return values
+
+
+def current(settings):
+    """(profile, aspect) from settings, falling back to the defaults."""
+    profile = settings.get("profile") or DEFAULT_PROFILE
+    aspect  = settings.get("aspect") or DEFAULT_ASPECT
+    if profile not in dict(PROFILES):
+        profile = DEFAULT_PROFILE
+    if aspect not in dict(ASPECTS):
+        aspect = DEFAULT_ASPECT
+    return profile, aspect
+
+
+def capture_size(settings):
+    """Snapshot size for the configured profile and aspect."""
+    return frame_size(*current(settings))
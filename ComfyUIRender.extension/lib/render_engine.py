@@ -0,0 +1,455 @@
+# -*- coding: utf-8 -*-
+"""
+render_engine.py
+The render pipeline without a window: snapshot PNG in, result PNG out.
+
+RenderSession owns a job_queue.JobQueue whose runner does the whole ComfyUI
+round trip for one job — result cache, server pick, upload, /prompt,
+websocket (or /history) wait, download — and reports only through the job
+(set_state / set_progress / set_message). The WPF window, ribbon scripts
+and command-line tools all drive it the same way:
+
+    session = RenderSession()
+    job     = session.submit(snapshot_path, "timber facade, dusk", seed=1)
+    path    = job.result(timeout=600)       # blocks; raises on failure
+
+session.add_listener(fn) calls fn(job) on the worker thread after every
+change of any job; UI listeners marshal to their own thread.
+
+By default each worker takes one job through every stage in turn. With
+pipelined=True the stages — prepare (cache, server pick, upload), submit,
+await, fetch (download) — run on their own threads joined by bounded
+queues (job_queue.PipelineQueue): while the GPU renders one job the next
+is already uploaded and waiting in ComfyUI's queue, and downloads never
+hold up a submission. `ahead` caps the prompts kept in ComfyUI's queues.
+
+No WPF or Revit imports: runs under CPython as well as IronPython 2.7.
+"""
+
+import os
+import time
+import threading
+import uuid
+import random
+import shutil
+
+import settings_manager
+import comfy_http
+import snapshot
+import profiles
+import server_pool
+import tracing
+import job_queue
+import result_cache
+import workflow
+
+
+class RenderSession(object):
+    """
+    A render queue plus the settings it renders with.
+
+    settings: dict used for every job; None re-reads settings.json per job,
+    so changes made in Settings apply to the next render.
+    result_dir: where results go unless a job sets output=<path>.
+    cache: look up / store results in the shared result_cache.
+    max_jobs: unfinished jobs accepted at once (see job_queue.JobQueue).
+    pipelined: run the stages on separate threads (see module docstring);
+    ahead defaults to 2 prompts per server: the running one and the next.
+    """
+
+    def __init__(self, settings=None, workers=None, result_dir=None, cache=True,
+                 max_jobs=50, pipelined=False, ahead=None):
+        self._settings  = settings
+        self.result_dir = result_dir or snapshot.TMP_DIR
+        self.use_cache  = cache
+        self._slots     = None
+        s = self.settings()
+        if pipelined:
+            ahead = ahead or 2 * max(1, len(server_pool.server_urls(s)))
+            self._slots = threading.Semaphore(ahead)
+            self.queue  = job_queue.PipelineQueue([
+                ("prepare", self._stage(self._prepare, begin=True), 2),
+                ("submit",  self._stage(self._submit_gated),        1),
+                ("await",   self._stage(self._await_released),      ahead),
+                ("fetch",   self._stage(self._fetch),               2),
+            ], finish=self._finish, max_jobs=max_jobs)
+            return
+        if workers is None:
+            # At least one worker per server, plus one to keep a queue fed
+            workers = max(int(s.get("render_workers", 2)),
+                          len(server_pool.server_urls(s)) + 1)
+        self.queue = job_queue.JobQueue(self._run_job, workers=workers, max_jobs=max_jobs)
+
+    def settings(self):
+        if self._settings is not None:
+            return self._settings
+        return settings_manager.load()
+
+    # ── Jobs ──────────────────────────────────────────────────────────────
+
+    def job_workflow(self, profile=None, preview=False):
+        """
+        (template, slot values) for a new job: the configured workflow file
+        (None = built-in), its settings.json values, then the profile's.
+        profile is a (profile, aspect) pair; None uses the configured one.
+        Raises if the workflow file can't be used.
+        """
+        s        = self.settings()
+        template = s.get("workflow_path") or None
+        if template:
+            workflow.compiled("upload", template)     # parse + validate now
+        profile = profile or profiles.current(s)
+        values  = workflow.settings_values(s)
+        if preview:
+            values.update(profiles.preview_values(*profile))
+        else:
+            values.update(profiles.workflow_values(*profile))
+        return template, values
+
+    def submit(self, snapshot_path, prompt, seed=None, profile=None, preview=False,
+               **options):
+        """
+        Queue one render and return its RenderJob. seed None = random.
+        options are kept on the job; output=<path> sets the result file, and
+        workflow / template (from job_workflow) skip resolving them again.
+        """
+        if seed is None:
+            seed = random.randint(0, 2147483647)
+        profile = profile or profiles.current(self.settings())
+        if "workflow" not in options:
+            options["template"], options["workflow"] = self.job_workflow(profile, preview)
+        return self.queue.submit(job_queue.RenderJob(
+            snapshot_path, prompt, seed, profile=profile, preview=preview, **options))
+
+    def add_listener(self, fn):
+        self.queue.add_listener(fn)
+
+    def remove_listener(self, fn):
+        self.queue.remove_listener(fn)
+
+    def jobs(self):
+        return self.queue.jobs()
+
+    def active(self):
+        return self.queue.active()
+
+    def cancel(self, job_id):
+        self.queue.cancel(job_id)
+
+    def cancel_all(self, wait=0):
+        """
+        Cancel every unfinished job. The prompts are removed from ComfyUI in
+        the background; wait > 0 blocks up to that many seconds for it (for
+        scripts about to exit).
+        """
+        self.queue.cancel_all()
+        if wait:
+            job_queue.wait_for_cancels(wait)
+
+    def supersede(self, group, keep=(), interrupt=False):
+        """
+        A newer request replaces the unfinished jobs of group (job option
+        group=...) other than keep: they are cancelled, which deletes their
+        prompts from ComfyUI's queue. A job already rendering is interrupted
+        with interrupt=True and otherwise left to finish; one that is
+        downloading always finishes. Returns the cancelled jobs.
+        """
+        keep = set(j.id for j in keep)
+        out  = []
+        for job in self.active():
+            if job.options.get("group") != group or job.id in keep:
+                continue
+            if job.state == job_queue.DOWNLOADING:
+                continue
+            if job.state == job_queue.RUNNING and not interrupt:
+                continue
+            job.options["interrupt"] = interrupt
+            job.cancel()
+            out.append(job)
+        return out
+
+    def shutdown(self):
+        self.queue.shutdown()
+
+    def result_path(self, job):
+        output = job.options.get("output")
+        if output:
+            return output
+        if not os.path.exists(self.result_dir):
+            os.makedirs(self.result_dir)
+        return os.path.join(self.result_dir, "result_{0}_{1}.png".format(
+            int(job.created), job.id))
+
+    # ── Job runner (worker thread) ────────────────────────────────────────
+
+    def _run_job(self, job):
+        """Queue runner: all stages of one job in turn, inside one trace."""
+        ctx   = {"trace": self._begin_trace(job)}
+        error = None
+        try:
+            if self._prepare(job, ctx) is not False:
+                self._submit(job, ctx)
+                self._await(job, ctx)
+                self._fetch(job, ctx)
+        except Exception as ex:
+            error = ex
+            raise
+        finally:
+            self._finish(job, ctx, error)
+
+    def _begin_trace(self, job):
+        return tracing.begin("render", job=job.id,
+                             preview=bool(job.options.get("preview")),
+                             custom=bool(job.options.get("template")))
+
+    def _finish(self, job, ctx, error=None):
+        """Release the server (and pipeline slot); close the job's trace."""
+        ws = ctx.pop("ws", None)
+        if ws is not None:
+            ws.close()
+        if ctx.pop("slot", False):
+            self._slots.release()
+        node = ctx.pop("node", None)
+        if node is not None:
+            ctx["pool"].release(node, ctx.get("submitted") if job.result_path else None)
+
+        trace = ctx.get("trace")
+        if trace is None:
+            return
+        tracing.attach(trace)
+        times = job.times
+        # Time in ComfyUI's queue vs. on the GPU, from the job's states
+        if job_queue.SUBMITTED in times and job_queue.RUNNING in times:
+            trace.add("queued", times[job_queue.RUNNING] - times[job_queue.SUBMITTED],
+                      times[job_queue.SUBMITTED])
+        if job_queue.RUNNING in times and job_queue.DOWNLOADING in times:
+            trace.add("execute", times[job_queue.DOWNLOADING] - times[job_queue.RUNNING],
+                      times[job_queue.RUNNING])
+        if job.cancelled:
+            outcome = "cancelled"
+        elif error is not None:
+            outcome = "failed"
+        else:
+            outcome = "cached" if job.options.get("cached") else "done"
+        tracing.end(outcome=outcome, server=job.base_url)
+
+    def _stage(self, fn, begin=False):
+        """fn as a pipeline stage: run on this thread inside the job's trace."""
+        def stage(job, ctx):
+            if begin:
+                ctx["trace"] = self._begin_trace(job)
+            else:
+                tracing.attach(ctx.get("trace"))
+            try:
+                return fn(job, ctx)
+            finally:
+                tracing.attach(None)
+        return stage
+
+    def _submit_gated(self, job, ctx):
+        """Submit once fewer than `ahead` of our prompts are in ComfyUI."""
+        self._slots.acquire()
+        ctx["slot"] = True
+        job.check_cancelled()
+        self._submit(job, ctx)
+
+    def _await_released(self, job, ctx):
+        """Await, then free the slot: the next prompt can go in while this downloads."""
+        try:
+            self._await(job, ctx)
+        finally:
+            if ctx.pop("slot", False):
+                self._slots.release()
+
+    # ── Stages ────────────────────────────────────────────────────────────
+    # Each fills in ctx for the next; _run_job calls them in turn, the
+    # pipelined queue runs them on separate threads.
+
+    def _prepare(self, job, ctx):
+        """Cache lookup, server pick, upload. Returns False on a cache hit."""
+        s        = self.settings()
+        cache    = result_cache.get_cache(s) if self.use_cache else None
+        wf       = job.options.get("workflow") or {}
+        template = job.options.get("template")
+        key      = workflow.fingerprint(snapshot.payload_digest(job.snapshot), job.prompt,
+                                        job.seed, template=template, **wf)
+        hit      = cache.get(key) if cache is not None else None
+        if hit is not None:
+            # Same snapshot + prompt + seed + workflow: no ComfyUI round trip
+            job.result_path = self.result_path(job)
+            shutil.copyfile(hit, job.result_path)
+            job.options["cached"] = True
+            job.message = "Done (cached)"
+            return False
+        ctx.update(settings=s, cache=cache, key=key, workflow=wf, template=template)
+
+        pool     = server_pool.get_pool(s)
+        required = workflow.required_nodes("upload", template)
+        ctx["pool"] = pool
+        # A server that can't be reached is marked down and the next one
+        # tried, so one dead box doesn't fail the job
+        for attempt in range(len(pool.nodes)):
+            job.set_message("Connecting...")
+            # Cached health + installed nodes; no preflight request while fresh
+            node = pool.pick(required=required)
+            ctx["node"]  = node
+            job.base_url = node.base_url
+            job.check_cancelled()
+            try:
+                self._upload(job, ctx, node)
+                break
+            except comfy_http.ConnectionFailed as ex:
+                node.mark_failed(ex)        # unreachable: re-check before reuse
+                pool.release(ctx.pop("node"))
+                if attempt + 1 == len(pool.nodes):
+                    raise
+        job.check_cancelled()
+
+    def _upload(self, job, ctx, node):
+        """Upload the snapshot to node (base64 in the prompt as a fallback)."""
+        job.set_message("Uploading snapshot...")
+        try:
+            ctx["image"]  = comfy_http.upload_image(
+                node.base_url, job.snapshot,
+                data=snapshot.payload(job.snapshot),
+                digest=snapshot.payload_digest(job.snapshot))
+            ctx["source"] = "upload"
+        except comfy_http.ConnectionFailed:
+            raise
+        except Exception as ex:
+            # Older servers / proxies without /upload/image
+            if node.missing(["easy loadImageBase64"]):
+                raise Exception("Snapshot upload failed ({0}) and {1} has no "
+                                "easy loadImageBase64 node to fall back on.".format(ex, node.base_url))
+            ctx["image"]  = comfy_http.image_to_base64(job.snapshot)
+            ctx["source"] = "base64"
+
+    def _submit(self, job, ctx):
+        """POST the prompt (with the websocket already open)."""
+        client_id = str(uuid.uuid4()).replace("-", "")
+        # Open the socket before queueing so no event is missed
+        ctx["ws"] = comfy_http.open_websocket(job.base_url, client_id)
+        try:
+            job.prompt_id, ctx["image"] = self._queue_prompt(
+                job.base_url, job.snapshot, ctx["image"], ctx["source"], job.prompt,
+                job.seed, client_id, ctx["template"], ctx["workflow"])
+        except comfy_http.ConnectionFailed as ex:
+            ctx["node"].mark_failed(ex)
+            raise
+        ctx["submitted"] = time.time()
+        job.add_cancel_hook(self._cancel_on_server)
+        job.set_state(job_queue.SUBMITTED, "Queued...")
+
+    def _await(self, job, ctx):
+        """Wait for the output image (websocket, else /history polling)."""
+        deadline = float(ctx["settings"].get("render_timeout", 1800))
+        ws       = ctx.get("ws")
+        output   = None
+        try:
+            with tracing.span("wait", websocket=ws is not None):
+                if ws is not None:
+                    output = self._watch(ws, job, deadline)
+                if output is None:
+                    output = self._poll(job, deadline)
+        finally:
+            ctx.pop("ws", None)
+            if ws is not None:
+                ws.close()
+        job.check_cancelled()
+        ctx["output"] = output
+
+    def _fetch(self, job, ctx):
+        """Download the result and store it in the cache."""
+        job.set_state(job_queue.DOWNLOADING, "Downloading...")
+        shown = [-1]
+        def _progress(done, total):
+            pct = 100 * done // total if total else -1
+            if pct >= shown[0] + 10:
+                shown[0] = pct
+                job.set_message("Downloading... {0}%".format(pct))
+        job.result_path = comfy_http.download_image(
+            job.base_url, ctx["output"], self.result_path(job), on_progress=_progress)
+        if ctx["cache"] is not None:
+            try:
+                ctx["cache"].put(ctx["key"], job.result_path)
+            except Exception:
+                pass    # a full disk must not fail the render
+        job.message = "Done ({0:.0f}s)".format(time.time() - job.created)
+
+    def _queue_prompt(self, base_url, snap_path, image, source, prompt, seed, client_id,
+                      template, wf):
+        """POST one prompt. Returns (prompt_id, image) — image may be re-uploaded."""
+        try:
+            result = comfy_http.post_json(base_url, "/prompt", workflow.prompt_body(
+                image, prompt, seed, client_id, image_source=source,
+                template=template, **wf))
+        except Exception as ex:
+            if source != "upload" or image not in str(ex):
+                raise
+            # Cached upload no longer on the server — send it again
+            image  = comfy_http.upload_image(
+                base_url, snap_path, force=True,
+                data=snapshot.payload(snap_path),
+                digest=snapshot.payload_digest(snap_path))
+            result = comfy_http.post_json(base_url, "/prompt", workflow.prompt_body(
+                image, prompt, seed, client_id, image_source=source,
+                template=template, **wf))
+        if "prompt_id" not in result:
+            raise Exception("No prompt_id. Got: " + str(result)[:300])
+        return result["prompt_id"], image
+
+    def _cancel_on_server(self, job):
+        """Cancel hook: remove this job's prompt — and only it — from ComfyUI."""
+        if job.base_url and job.prompt_id:
+            try:
+                comfy_http.cancel_prompt(job.base_url, job.prompt_id,
+                                         interrupt=job.options.get("interrupt", True))
+            except Exception:
+                pass
+
+    # ── Watch (websocket) ─────────────────────────────────────────────────
+
+    def _watch(self, ws, job, deadline):
+        """
+        Follow the job over the websocket. Returns the output descriptor,
+        or None if the socket dropped / reported no image (caller polls).
+        """
+        def _start(prompt_id):
+            job.set_state(job_queue.RUNNING, "Rendering...")
+
+        def _progress(prompt_id, value, total):
+            if job.state != job_queue.RUNNING:
+                job.set_state(job_queue.RUNNING, "Rendering...")
+            job.set_progress(value, total)
+
+        try:
+            results = ws.wait_for_outputs(
+                [job.prompt_id],
+                on_start=_start,
+                on_progress=_progress,
+                should_stop=lambda: job.cancelled,
+                timeout=deadline)
+            return results.get(job.prompt_id)
+        except Exception as ex:
+            msg = str(ex)
+            if "Stopped" in msg or "ComfyUI error" in msg or "Timed out" in msg:
+                raise
+            return None     # socket trouble — fall back to polling
+
+    # ── Poll ──────────────────────────────────────────────────────────────
+
+    def _poll(self, job, deadline):
+        def _state(state, elapsed, position):
+            if state == "pending":
+                job.set_state(job_queue.SUBMITTED, "Queued (position {0})... {1}s".format(
+                    position, int(elapsed)))
+            else:
+                job.set_state(job_queue.RUNNING, "Rendering... ({0}s)".format(int(elapsed)))
+
+        poller = comfy_http.HistoryPoller(
+            job.base_url, job.prompt_id, deadline=deadline,
+            should_stop=lambda: job.cancelled,
+            on_state=_state)
+        output = poller.poll()
+        job.options["poll_summary"] = poller.summary()
+        return output
@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 """render_window.py - Non-modal WPF UI. Settings panel inline, no popup windows."""
 
-import os, sys, json, uuid, threading, tempfile, glob
+import os, sys, json, time, random, shutil, threading, tempfile, glob
 
 import clr
 clr.AddReference("PresentationFramework")
@@ -11,17 +11,30 @@ clr.AddReference("System")
 clr.AddReference("System.Windows.Forms")
 
 import System
-from System import Action
+from System import Action, TimeSpan
 from System.Windows import (
-    Visibility, MessageBox, MessageBoxButton, MessageBoxImage
+    Visibility, MessageBox, MessageBoxButton, MessageBoxImage, Thickness
 )
+from System.Windows.Controls import Border, Image, ListBoxItem, ContextMenu, MenuItem
+from System.Windows.Input import Cursors
+from System.Windows.Media import BrushConverter, Brushes, Stretch
 from System.Windows.Markup import XamlReader
+from System.Windows.Threading import DispatcherTimer
 from System.Windows.Media.Imaging import BitmapImage, BitmapCacheOption
 from System.Windows.Forms import SaveFileDialog, DialogResult
 
 import settings_manager
 import comfy_http
+import snapshot
+import profiles
+import server_pool
+import warmup
+import watch
+import tracing
+import job_queue
+import render_engine
 import app_state
+import workflow
 
 WINDOW_XAML = r"""
 <Window
@@ -133,6 +146,11 @@ WINDOW_XAML = r"""
           <Viewbox x:Name="ResultViewbox" Stretch="Uniform" Visibility="Collapsed">
             <Image x:Name="ResultImg" Width="1280" Height="1280"/>
           </Viewbox>
+          <!-- Variations: one tile per seed, click to select for Save/Open -->
+          <ScrollViewer x:Name="ResultGridScroll" Visibility="Collapsed"
+                        VerticalScrollBarVisibility="Auto">
+            <UniformGrid x:Name="ResultGrid" Columns="2" Margin="4"/>
+          </ScrollViewer>
         </Grid>
       </Border>
 
@@ -145,7 +163,7 @@ WINDOW_XAML = r"""
           <RowDefinition Height="100"/>   <!-- 3 prompt box    -->
           <RowDefinition Height="Auto"/>  <!-- 4 buttons       -->
           <RowDefinition Height="Auto"/>  <!-- 5 status        -->
-          <RowDefinition Height="*"/>     <!-- 6 spacer        -->
+          <RowDefinition Height="*"/>     <!-- 6 job queue     -->
           <RowDefinition Height="Auto"/>  <!-- 7 save buttons  -->
         </Grid.RowDefinitions>
 
@@ -190,12 +208,62 @@ WINDOW_XAML = r"""
               <ColumnDefinition Width="*"/>
               <ColumnDefinition Width="6"/>
               <ColumnDefinition Width="Auto"/>
+              <ColumnDefinition Width="6"/>
+              <ColumnDefinition Width="Auto"/>
             </Grid.ColumnDefinitions>
             <Button x:Name="RenderBtn" Grid.Column="0" Content="Render"
                     Style="{StaticResource PBtn}"/>
-            <Button x:Name="StopBtn"   Grid.Column="2" Content="Stop"
+            <ComboBox x:Name="VariationsBox" Grid.Column="2" Width="52"
+                      VerticalContentAlignment="Center" FontSize="12"
+                      ToolTip="Variations per click (one seed each)">
+              <ComboBoxItem Content="1" IsSelected="True"/>
+              <ComboBoxItem Content="2"/>
+              <ComboBoxItem Content="4"/>
+              <ComboBoxItem Content="6"/>
+              <ComboBoxItem Content="8"/>
+            </ComboBox>
+            <Button x:Name="StopBtn"   Grid.Column="4" Content="Stop"
                     Style="{StaticResource DBtn}" Visibility="Collapsed"/>
           </Grid>
+          <Grid Margin="0,0,0,6">
+            <Grid.ColumnDefinitions>
+              <ColumnDefinition Width="Auto"/>
+              <ColumnDefinition Width="*"/>
+              <ColumnDefinition Width="8"/>
+              <ColumnDefinition Width="Auto"/>
+            </Grid.ColumnDefinitions>
+            <TextBlock Grid.Column="0" Text="SEED" Style="{StaticResource Label}"
+                       VerticalAlignment="Center" Margin="0,0,8,0"/>
+            <TextBox x:Name="SeedBox" Grid.Column="1" Style="{StaticResource Field}"
+                     Padding="8,4"
+                     ToolTip="Blank = random. A fixed seed re-renders identically (and is served from the result cache)."/>
+            <CheckBox x:Name="WatchBox" Grid.Column="3" Content="Watch"
+                      Foreground="#9090B0" FontSize="11" VerticalAlignment="Center"
+                      ToolTip="Re-render automatically when the view changes and comes to rest. A newer view cancels the render of the previous one."/>
+          </Grid>
+          <Grid Margin="0,0,0,6">
+            <Grid.ColumnDefinitions>
+              <ColumnDefinition Width="Auto"/>
+              <ColumnDefinition Width="*"/>
+              <ColumnDefinition Width="8"/>
+              <ColumnDefinition Width="Auto"/>
+              <ColumnDefinition Width="Auto"/>
+              <ColumnDefinition Width="8"/>
+              <ColumnDefinition Width="Auto"/>
+            </Grid.ColumnDefinitions>
+            <TextBlock Grid.Column="0" Text="QUALITY" Style="{StaticResource Label}"
+                       VerticalAlignment="Center" Margin="0,0,8,0"/>
+            <ComboBox x:Name="ProfileBox" Grid.Column="1"
+                      VerticalContentAlignment="Center" FontSize="12"
+                      ToolTip="Draft sends and generates a quarter of the pixels of Standard"/>
+            <TextBlock Grid.Column="3" Text="ASPECT" Style="{StaticResource Label}"
+                       VerticalAlignment="Center" Margin="0,0,8,0"/>
+            <ComboBox x:Name="AspectBox" Grid.Column="4" Width="64"
+                      VerticalContentAlignment="Center" FontSize="12"/>
+            <CheckBox x:Name="PreviewBox" Grid.Column="6" Content="Preview"
+                      Foreground="#9090B0" FontSize="11" VerticalAlignment="Center"
+                      ToolTip="Fast draft: few steps on a small latent. Use Refine on a result for the full-quality pass with the same seed."/>
+          </Grid>
           <Button x:Name="SettingsBtn" Content="Settings"
                   Style="{StaticResource SBtn}" FontSize="11"/>
         </StackPanel>
@@ -210,11 +278,20 @@ WINDOW_XAML = r"""
           </StackPanel>
         </Border>
 
+        <!-- Job queue (right-click a job to cancel it) -->
+        <ListBox x:Name="JobList" Grid.Row="6" Margin="0,10,0,10"
+                 Background="#0C0C1E" BorderBrush="#2A2A50" BorderThickness="1"
+                 Foreground="#9090B0" FontSize="11"
+                 ScrollViewer.HorizontalScrollBarVisibility="Disabled"/>
+
         <!-- Save / Open -->
         <StackPanel Grid.Row="7" Margin="0,0,0,0">
           <Button x:Name="SaveBtn" Content="Save Image"
                   Style="{StaticResource PBtn}" Margin="0,0,0,6"
                   Visibility="Collapsed"/>
+          <Button x:Name="RefineBtn" Content="Refine (full quality, same seed)"
+                  Style="{StaticResource PBtn}" Margin="0,0,0,6"
+                  Visibility="Collapsed"/>
           <Button x:Name="OpenViewerBtn" Content="Open in Viewer"
                   Style="{StaticResource SBtn}"
                   Visibility="Collapsed"/>
@@ -243,9 +320,17 @@ WINDOW_XAML = r"""
         <TextBox x:Name="UrlBox" Style="{StaticResource Field}" Margin="0,0,0,16"/>
         <TextBlock Text="PORT" Style="{StaticResource Label}"/>
         <TextBox x:Name="PortBox" Style="{StaticResource Field}" Margin="0,0,0,16"/>
+        <TextBlock Text="EXTRA SERVERS (one URL per line, e.g. http://192.168.1.20:8188)"
+                   Style="{StaticResource Label}"/>
+        <TextBox x:Name="ServersBox" Style="{StaticResource Field}" Height="80"
+                 AcceptsReturn="True" TextWrapping="NoWrap"
+                 VerticalScrollBarVisibility="Auto" Margin="0,0,0,16"/>
+        <TextBlock Text="WORKFLOW FILE (API-format JSON, blank = built-in Flux2-Klein)"
+                   Style="{StaticResource Label}"/>
+        <TextBox x:Name="WorkflowBox" Style="{StaticResource Field}" Margin="0,0,0,16"/>
         <Border Background="#0C0C1E" CornerRadius="8" Padding="14,10" Margin="0,8,0,0">
           <TextBlock x:Name="SettingsStatus" Text="" Foreground="#55CC88"
-                     FontSize="12" TextWrapping="Wrap"/>
+                     FontSize="12" FontFamily="Consolas" TextWrapping="Wrap"/>
         </Border>
       </StackPanel>
 
@@ -268,12 +353,31 @@ WINDOW_XAML = r"""
 
 
 
+def _load_bitmap(path):
+    """Frozen BitmapImage read fully into memory (file stays unlocked)."""
+    uri_str = "file:///" + path.replace("\\", "/")
+    bmp = BitmapImage()
+    bmp.BeginInit()
+    bmp.UriSource     = System.Uri(uri_str)
+    bmp.CacheOption   = BitmapCacheOption.OnLoad
+    bmp.CreateOptions = System.Windows.Media.Imaging.BitmapCreateOptions.IgnoreImageCache
+    bmp.EndInit()
+    bmp.Freeze()
+    return bmp
+
+
 class RenderWindow(object):
 
     def __init__(self, snapshot_path, uidoc=None):
         self._uidoc         = uidoc
         self._snapshot_path = snapshot_path
         self._result_tmp    = None
+        self._result_seed   = None
+        self._result_job    = None
+        self._results       = []        # finished jobs shown in the result area
+        self._results_lock  = threading.Lock()  # appended from worker threads
+        self._view_batch    = False     # a multi-view export is queueing jobs
+        self._job_items     = {}        # job id -> ListBoxItem
 
         self._win = XamlReader.Parse(WINDOW_XAML)
 
@@ -291,13 +395,25 @@ class RenderWindow(object):
         self._result_hint  = self._win.FindName("ResultHint")
         self._result_img     = self._win.FindName("ResultImg")
         self._result_viewbox = self._win.FindName("ResultViewbox")
+        self._result_grid    = self._win.FindName("ResultGrid")
+        self._result_scroll  = self._win.FindName("ResultGridScroll")
+        self._variations_box = self._win.FindName("VariationsBox")
+        self._seed_box       = self._win.FindName("SeedBox")
+        self._profile_box    = self._win.FindName("ProfileBox")
+        self._aspect_box     = self._win.FindName("AspectBox")
+        self._preview_box    = self._win.FindName("PreviewBox")
+        self._watch_box      = self._win.FindName("WatchBox")
+        self._job_list     = self._win.FindName("JobList")
         self._save_btn     = self._win.FindName("SaveBtn")
         self._open_btn     = self._win.FindName("OpenViewerBtn")
+        self._refine_btn   = self._win.FindName("RefineBtn")
 
         # Settings panel elements
         self._settings_panel  = self._win.FindName("SettingsPanel")
         self._url_box         = self._win.FindName("UrlBox")
         self._port_box        = self._win.FindName("PortBox")
+        self._servers_box     = self._win.FindName("ServersBox")
+        self._workflow_box    = self._win.FindName("WorkflowBox")
         self._settings_status = self._win.FindName("SettingsStatus")
 
         # Wire up events
@@ -306,10 +422,34 @@ class RenderWindow(object):
         self._settings_btn.Click    += self._show_settings
         self._save_btn.Click        += self._on_save
         self._open_btn.Click        += self._on_open_viewer
+        self._refine_btn.Click      += self._on_refine
+        self._watch_box.Checked     += self._on_watch_toggled
+        self._watch_box.Unchecked   += self._on_watch_toggled
         self._win.FindName("SaveSettingsBtn").Click += self._save_settings
         self._win.FindName("BackBtn").Click         += self._hide_settings
 
-        app_state.clear_stop()
+        s = settings_manager.load()
+        # Room for a multi-view batch (up to ~50 views) on top of normal renders
+        self._session = render_engine.RenderSession(max_jobs=100)
+        self._session.add_listener(self._on_job_changed)
+        self._win.Closed += self._on_closed
+
+        self._watcher     = None
+        self._watch_seed  = None
+        self._watch_timer = DispatcherTimer()
+        self._watch_timer.Tick += self._on_watch_tick
+
+        self._closed    = threading.Event()
+        self._keepalive = None
+        if s.get("warmup_on_open", True):
+            t = threading.Thread(target=self._warm_up)
+            t.daemon = True
+            t.start()
+        minutes = float(s.get("keepalive_minutes", 0) or 0)
+        if minutes > 0:
+            self._keepalive = warmup.KeepAlive(self._keep_warm, minutes * 60).start()
+
+        self._init_profiles(s)
         self._load_snapshot_file(snapshot_path)
         self._set_status("OK", "Ready.")
 
@@ -323,13 +463,93 @@ class RenderWindow(object):
         self._load_snapshot_file(path)
         self._set_status("OK", "Snapshot updated.")
 
+    def snapshots_in_use(self):
+        """Snapshots that unfinished jobs or refinable previews still read."""
+        with self._results_lock:
+            shown = [job for job, _ in self._results if job.options.get("preview")]
+        jobs = self._session.active() + shown
+        return set(job.snapshot for job in jobs)
+
+    # ── Public: called by Render Views ribbon, once per exported view ─────
+
+    def prompt(self):
+        return self._prompt_box.Text.strip()
+
+    def queue_view(self, path, view_name, prompt):
+        """
+        Queue a render of an exported view with the window's quality,
+        preview and seed settings (a fixed seed is shared by all views).
+        """
+        if not self._session.active() and not self._view_batch:
+            self._clear_results()
+        self._view_batch = True
+        seed = self._seed_box.Text.strip()
+        seed = int(seed) % 2147483648 if seed.isdigit() else random.randint(0, 2147483647)
+        profile = self._selected_profile()
+        preview = bool(self._preview_box.IsChecked)
+        template, wf = self._session.job_workflow(profile, preview)
+        return self._session.submit(
+            path, prompt, seed, profile=profile, preview=preview,
+            workflow=wf, template=template, view=view_name)
+
+    def end_views(self):
+        """The multi-view export is finished; the next Render starts a new result set."""
+        self._view_batch = False
+
+    def _on_closed(self, sender, e):
+        self._watch_timer.Stop()
+        self._closed.set()
+        if self._keepalive is not None:
+            self._keepalive.stop()
+        self._session.shutdown()
+
+    # ── Model warm-up (background) ────────────────────────────────────────
+
+    def _warmers(self):
+        s        = settings_manager.load()
+        template = s.get("workflow_path") or None
+        values   = workflow.settings_values(s)
+        return [warmup.Warmer(n.base_url, template, values=values)
+                for n in server_pool.get_pool(s).refresh(force=True)]
+
+    def _warm_up(self):
+        """Load the models on every reachable server; report cold vs. warm."""
+        try:
+            warmers = self._warmers()
+            if not warmers:
+                return
+            self._set_status("...", "Loading models...")
+            lines = []
+            for w in warmers:
+                cold, warm = w.measure(should_stop=self._closed.is_set)
+                lines.append("{0:.1f}s cold, {1:.1f}s warm".format(cold, warm))
+            if not self._session.active():
+                self._set_status("OK", "Models loaded ({0}).".format("; ".join(lines)))
+        except Exception as ex:
+            if not self._session.active():
+                self._set_status("WARN", "Warm-up skipped: " + str(ex))
+
+    def _keep_warm(self):
+        """Keep-alive tick: ping idle servers so models stay resident."""
+        if self._session.active():
+            return          # real renders keep them loaded
+        for w in self._warmers():
+            w.ping(should_stop=self._closed.is_set)
+
     # ── Status ────────────────────────────────────────────────────────────
 
+    def _ui(self, fn):
+        """
+        Run fn on the UI thread without waiting for it, so job workers keep
+        going while the UI thread is busy (e.g. inside a multi-view export).
+        """
+        self._win.Dispatcher.BeginInvoke(Action(fn))
+
     def _set_status(self, icon, msg):
         def _do():
             self._status_icon.Text = icon
             self._status_msg.Text  = msg
-        self._win.Dispatcher.Invoke(Action(_do))
+        self._ui(_do)
 
     # ── Load snapshot ─────────────────────────────────────────────────────
 
@@ -338,22 +558,56 @@ class RenderWindow(object):
             self._set_status("ERR", "Snapshot not found.")
             return
         try:
-            uri_str = "file:///" + path.replace("\\", "/")
-            bmp = BitmapImage()
-            bmp.BeginInit()
-            bmp.UriSource     = System.Uri(uri_str)
-            bmp.CacheOption   = BitmapCacheOption.OnLoad
-            bmp.CreateOptions = System.Windows.Media.Imaging.BitmapCreateOptions.IgnoreImageCache
-            bmp.EndInit()
-            bmp.Freeze()
+            bmp = _load_bitmap(path)
             def _do():
                 self._snap_img.Source        = bmp
+                self._snap_img.Width         = bmp.PixelWidth
+                self._snap_img.Height        = bmp.PixelHeight
                 self._snap_viewbox.Visibility = Visibility.Visible
                 self._snap_hint.Visibility    = Visibility.Collapsed
-            self._win.Dispatcher.Invoke(Action(_do))
+            self._ui(_do)
         except Exception as ex:
             self._set_status("WARN", "Preview error: " + str(ex))
 
+    # ── Resolution profile ────────────────────────────────────────────────
+
+    def _init_profiles(self, s):
+        profile, aspect = profiles.current(s)
+        for name, _ in profiles.PROFILES:
+            self._profile_box.Items.Add(name.capitalize())
+        for name, _ in profiles.ASPECTS:
+            self._aspect_box.Items.Add(name)
+        self._profile_box.SelectedIndex = [n for n, _ in profiles.PROFILES].index(profile)
+        self._aspect_box.SelectedIndex  = [n for n, _ in profiles.ASPECTS].index(aspect)
+        self._profile_box.SelectionChanged += self._on_profile_changed
+        self._aspect_box.SelectionChanged  += self._on_profile_changed
+
+    def _selected_profile(self):
+        """(profile, aspect) currently chosen in the window."""
+        return (profiles.PROFILES[max(0, self._profile_box.SelectedIndex)][0],
+                profiles.ASPECTS[max(0, self._aspect_box.SelectedIndex)][0])
+
+    def _on_profile_changed(self, sender, e):
+        profile, aspect = self._selected_profile()
+        s = settings_manager.load()
+        s["profile"] = profile
+        s["aspect"]  = aspect
+        settings_manager.save(s)
+        w, h = profiles.frame_size(profile, aspect)
+        # Re-grab the view at the new size so nothing is resampled server-side
+        if self._uidoc is None:
+            self._set_status("OK", "{0} {1}x{2}.".format(profile.capitalize(), w, h))
+            return
+        try:
+            path = snapshot.capture_gdi_only(self._uidoc, (w, h),
+                                             keep=self.snapshots_in_use())
+            self._snapshot_path = path
+            self._load_snapshot_file(path)
+            self._set_status("OK", "{0} {1}x{2} - snapshot updated.".format(
+                profile.capitalize(), w, h))
+        except Exception as ex:
+            self._set_status("WARN", "Snapshot not updated: " + str(ex))
+
     # ── Settings panel ────────────────────────────────────────────────────
 
     def _show_settings(self, sender, e):
@@ -370,7 +624,10 @@ class RenderWindow(object):
             port = "8000"
         self._url_box.Text          = host
         self._port_box.Text         = port
-        self._settings_status.Text  = ""
+        self._servers_box.Text      = "\r\n".join(s.get("servers") or [])
+        self._workflow_box.Text     = s.get("workflow_path", "")
+        self._settings_status.Text  = (server_pool.get_pool(s).report() + "\n\n"
+                                       + tracing.format_summary(tracing.load()))
         self._main_panel.Visibility    = Visibility.Collapsed
         self._settings_panel.Visibility = Visibility.Visible
 
@@ -388,8 +645,23 @@ class RenderWindow(object):
             self._settings_status.Text = "Port must be a number."
             return
         full_url = "{0}:{1}".format(host, port)
+        servers  = [u.strip().rstrip("/") for u in self._servers_box.Text.splitlines()
+                    if u.strip()]
+        wf_path  = self._workflow_box.Text.strip().strip('"')
+        wf_note  = ""
+        if wf_path:
+            try:
+                _, slots, output = workflow.load_template(wf_path)
+            except Exception as ex:
+                self._settings_status.Text = "Workflow not saved: " + str(ex)
+                return
+            wf_note = "\nWorkflow: {0} -> output node {1}".format(
+                ", ".join("{0} = {1}".format(k, v[0]) for k, v in sorted(slots.items())),
+                output)
         s = settings_manager.load()
-        s["comfy_url"] = full_url
+        s["comfy_url"]     = full_url
+        s["servers"]       = servers
+        s["workflow_path"] = wf_path
         settings_manager.save(s)
         # Test connection
         ok, msg = comfy_http.test_connection(full_url)
@@ -397,20 +669,70 @@ class RenderWindow(object):
             self._settings_status.Text = "Saved. Connected to ComfyUI successfully."
         else:
             self._settings_status.Text = "Saved. Warning: " + msg
+        self._settings_status.Text += wf_note
+        if servers:
+            pool = server_pool.get_pool(s)
+            pool.refresh(force=True)
+            self._settings_status.Text += "\n\n" + pool.report()
         # Go back after short delay would need threading — just show message
         # User clicks Back when ready
 
     # ── Stop ──────────────────────────────────────────────────────────────
 
     def _on_stop(self, sender, e):
-        app_state.request_stop()
-        try:
-            s = settings_manager.load()
-            comfy_http.post_json(s["comfy_url"].rstrip("/"), "/interrupt", {})
-        except Exception:
-            pass
+        self._session.cancel_all()
         self._set_status("STOP", "Stopping...")
 
+    # ── Watch mode (UI thread timer) ──────────────────────────────────────
+
+    def _on_watch_toggled(self, sender, e):
+        if not self._watch_box.IsChecked:
+            self._watch_timer.Stop()
+            self._watcher = None
+            self._set_status("OK", "Watch stopped.")
+            return
+        if self._uidoc is None or not self.prompt():
+            self._watch_box.IsChecked = False
+            self._set_status("WARN", "Watch needs a prompt and an open 3D view.")
+            return
+        s    = settings_manager.load()
+        seed = self._seed_box.Text.strip()
+        # One seed for the whole session: only the view changes between renders
+        self._watch_seed = int(seed) % 2147483648 if seed.isdigit() else random.randint(0, 2147483647)
+        self._watcher = watch.ViewWatcher(
+            lambda: snapshot.grab_frame(self._uidoc),
+            snapshot.frame_signature,
+            self._watch_render,
+            threshold=float(s.get("watch_threshold", watch.DEFAULT_THRESHOLD)),
+            release=lambda frame: frame.Dispose())
+        self._watch_timer.Interval = TimeSpan.FromSeconds(float(s.get("watch_interval", 1.0)))
+        self._watch_timer.Start()
+        self._set_status("OK", "Watching the view — orbit, then pause to render.")
+
+    def _on_watch_tick(self, sender, e):
+        if self._watcher is None:
+            return
+        try:
+            self._watcher.tick()
+        except Exception as ex:
+            self._set_status("WARN", "Watch: " + str(ex))
+
+    def _watch_render(self, frame):
+        """ViewWatcher.render: encode the settled frame and queue it."""
+        path = snapshot.save_frame(frame, profiles.frame_size(*self._selected_profile()))
+        self._snapshot_path = path
+        self._load_snapshot_file(path)
+        prompt = self.prompt()
+        if not prompt:
+            return None
+        self._clear_results()       # live preview: show the latest view only
+        profile = self._selected_profile()
+        preview = bool(self._preview_box.IsChecked)
+        template, wf = self._session.job_workflow(profile, preview)
+        return self._session.submit(
+            path, prompt, self._watch_seed, profile=profile, preview=preview,
+            workflow=wf, template=template, watch=True)
+
     # ── Render ────────────────────────────────────────────────────────────
 
     def _on_render(self, sender, e):
@@ -425,135 +747,230 @@ class RenderWindow(object):
                 "ComfyUI Render", MessageBoxButton.OK, MessageBoxImage.Warning)
             return
 
-        snapshot = self._snapshot_path
-        app_state.clear_stop()
+        # A click with nothing in flight starts a fresh result set
+        if not self._session.active():
+            self._clear_results()
 
-        def _set_rendering(on):
-            self._render_btn.IsEnabled = not on
-            self._stop_btn.Visibility  = Visibility.Visible if on else Visibility.Collapsed
-            self._settings_btn.IsEnabled = not on
-
-        self._win.Dispatcher.Invoke(Action(lambda: _set_rendering(True)))
+        seed = self._seed_box.Text.strip()
+        if seed and not seed.isdigit():
+            MessageBox.Show("Seed must be a whole number (or blank for random).",
+                "ComfyUI Render", MessageBoxButton.OK, MessageBoxImage.Warning)
+            return
 
-        def _worker():
-            try:
-                s        = settings_manager.load()
-                base_url = s["comfy_url"].rstrip("/")
-
-                self._set_status("...", "Connecting...")
-                ok, msg = comfy_http.test_connection(base_url)
-                if not ok:
-                    raise Exception(msg)
-                if app_state.stop_requested:
-                    raise Exception("Stopped.")
-
-                self._set_status("...", "Encoding snapshot...")
-                b64 = comfy_http.image_to_base64(snapshot)
-                if app_state.stop_requested:
-                    raise Exception("Stopped.")
-
-                self._set_status("...", "Sending: " + prompt[:50] + "...")
-                from workflow import build as build_workflow
-                wf     = build_workflow(b64, prompt)
-                result = comfy_http.post_json(base_url, "/prompt", {
-                    "prompt":    wf,
-                    "client_id": str(uuid.uuid4()).replace("-", "")
-                })
-                if "prompt_id" not in result:
-                    raise Exception("No prompt_id. Got: " + str(result)[:300])
-
-                prompt_id   = result["prompt_id"]
-                output_file = self._poll(base_url, prompt_id)
-                if app_state.stop_requested:
-                    raise Exception("Stopped.")
-
-                self._set_status("...", "Downloading...")
-                data = comfy_http.download_image(base_url, output_file)
-                self._show_result(data)
-                self._set_status("OK", "Done! Click Save to export.")
+        profile = self._selected_profile()
+        preview = bool(self._preview_box.IsChecked)
+        try:
+            template, wf = self._session.job_workflow(profile, preview)
+        except Exception as ex:
+            self._set_status("ERR", "Workflow: " + str(ex))
+            return
 
-            except Exception as ex:
-                msg = str(ex)
-                if "Stopped" in msg:
-                    self._set_status("STOP", "Render stopped.")
+        # One job per variation; the worker pool keeps ComfyUI's queue fed
+        jobs = []
+        try:
+            for i in range(self._variation_count()):
+                if seed:
+                    job_seed = (int(seed) + i) % 2147483648
                 else:
-                    self._set_status("ERR", msg)
-                    e2 = msg
-                    self._win.Dispatcher.Invoke(Action(lambda:
-                        MessageBox.Show("Render failed:\n\n" + e2,
-                            "ComfyUI Render", MessageBoxButton.OK, MessageBoxImage.Error)))
-            finally:
-                app_state.clear_stop()
-                self._win.Dispatcher.Invoke(Action(lambda: _set_rendering(False)))
-
-        t = threading.Thread(target=_worker)
-        t.daemon = True
-        t.start()
-
-    # ── Poll ──────────────────────────────────────────────────────────────
-
-    def _poll(self, base_url, prompt_id):
-        import time
-        for i in range(120):
-            if app_state.stop_requested:
-                raise Exception("Stopped.")
-            time.sleep(5)
-            self._set_status("...", "Rendering... ({0}s)".format((i + 1) * 5))
-            data = comfy_http.get_json("{0}/history/{1}".format(base_url, prompt_id))
-            if prompt_id in data:
-                all_imgs = []
-                for node_out in data[prompt_id].get("outputs", {}).values():
-                    for img in node_out.get("images", []):
-                        all_imgs.append(img)
-                if all_imgs:
-                    for img in all_imgs:
-                        if img.get("type", "") == "output":
-                            return img["filename"]
-                    return all_imgs[0]["filename"]
-        raise Exception("Timed out.")
+                    job_seed = random.randint(0, 2147483647)
+                jobs.append(self._session.submit(
+                    self._snapshot_path, prompt, job_seed, profile=profile, preview=preview,
+                    workflow=wf, template=template, group="render"))
+        except Exception as ex:
+            self._set_status("ERR", str(ex))
 
-    # ── Show result ───────────────────────────────────────────────────────
+        # Opt-in (supersede): the newest click wins, and earlier clicks'
+        # renders that haven't started are taken off ComfyUI's queue (by
+        # prompt_id, never a global interrupt). Off, every click stays queued
+        s = settings_manager.load()
+        if jobs and s.get("supersede"):
+            self._session.supersede("render", keep=jobs,
+                                    interrupt=bool(s.get("supersede_interrupt")))
+
+    def _on_refine(self, sender, e):
+        """Re-render the selected preview at full settings with its seed."""
+        job = self._result_job
+        if job is None or not job.options.get("preview"):
+            return
+        if not snapshot.available(job.snapshot):
+            self._set_status("ERR", "The snapshot of this preview is no longer "
+                                    "available - render it again to refine.")
+            return
+        try:
+            template, wf = self._session.job_workflow(job.options["profile"], False)
+            self._session.submit(
+                job.snapshot, job.prompt, job.seed, profile=job.options["profile"],
+                workflow=wf, template=template, refined_from=job.id,
+                view=job.options.get("view"))
+        except Exception as ex:
+            self._set_status("ERR", str(ex))
 
-    def _show_result(self, data):
+    def _variation_count(self):
         try:
-            import time
-            tmp_dir = os.path.join(tempfile.gettempdir(), "RevitComfyUI")
-            if not os.path.exists(tmp_dir):
-                os.makedirs(tmp_dir)
-            tmp = os.path.join(tmp_dir, "result_{0}.png".format(int(time.time())))
-            for old_f in glob.glob(os.path.join(tmp_dir, "result_*.png")):
-                try: os.remove(old_f)
-                except: pass
-
-            f = open(tmp, "wb")
-            try:    f.write(bytes(data))
-            except: f.write(bytearray([b for b in data]))
-            f.close()
-            self._result_tmp = tmp
-
-            uri_str = "file:///" + tmp.replace("\\", "/")
-            bmp = BitmapImage()
-            bmp.BeginInit()
-            bmp.UriSource     = System.Uri(uri_str)
-            bmp.CacheOption   = BitmapCacheOption.OnLoad
-            bmp.CreateOptions = System.Windows.Media.Imaging.BitmapCreateOptions.IgnoreImageCache
-            bmp.EndInit()
-            bmp.Freeze()
+            return max(1, int(self._variations_box.SelectedItem.Content))
+        except Exception:
+            return 1
 
-            def _do():
-                self._result_img.Source         = bmp
-                self._result_viewbox.Visibility = Visibility.Visible
-                self._result_hint.Visibility    = Visibility.Collapsed
-                self._save_btn.Visibility       = Visibility.Visible
-                self._open_btn.Visibility       = Visibility.Visible
-            self._win.Dispatcher.Invoke(Action(_do))
+    # ── Job list / status (listener, any thread) ──────────────────────────
+
+    def _on_job_changed(self, job):
+        def _do():
+            item = self._job_items.get(job.id)
+            if item is None:
+                item = ListBoxItem()
+                item.Tag = job.id
+                menu   = ContextMenu()
+                cancel = MenuItem()
+                cancel.Header = "Cancel job"
+                cancel.Click += lambda sender, e: self._session.cancel(item.Tag)
+                menu.Items.Add(cancel)
+                item.ContextMenu = menu
+                self._job_items[job.id] = item
+                self._job_list.Items.Insert(0, item)
+                self._prune_job_items()
+            item.Content = self._job_text(job)
+            item.ToolTip = job.error or job.prompt
+            self._stop_btn.Visibility = (Visibility.Visible if self._session.active()
+                                         else Visibility.Collapsed)
+        self._ui(_do)
+
+        if job.state == job_queue.DONE:
+            self._show_result(job)
+        self._update_status(job)
+
+    def _prune_job_items(self):
+        """Drop list entries of jobs the session no longer keeps (UI thread)."""
+        kept = set(j.id for j in self._session.jobs())
+        for job_id in [i for i in self._job_items if i not in kept]:
+            self._job_list.Items.Remove(self._job_items.pop(job_id))
+
+    def _job_text(self, job):
+        state = job.state
+        if state == job_queue.RUNNING and job.progress[1]:
+            state = "running {0}/{1}".format(job.progress[0], job.progress[1])
+        if job.options.get("watch"):
+            state = "watch, " + state
+        if job.options.get("preview"):
+            state = "preview, " + state
+        elif job.options.get("refined_from"):
+            state = "refine #{0}, {1}".format(job.options["refined_from"], state)
+        label = job.label
+        if job.options.get("view"):
+            label = "#{0}  [{1}]".format(job.id, job.options["view"])
+        return "{0}  -  {1}".format(label, state)
+
+    def _update_status(self, job):
+        active  = self._session.active()
+        waiting = len([j for j in active if j.state == job_queue.QUEUED])
+        prefix  = "[{0} waiting] ".format(waiting) if waiting else ""
+        if job.state == job_queue.FAILED:
+            self._set_status("ERR", "#{0} failed: {1}".format(job.id, job.error))
+        elif job.state == job_queue.CANCELLED:
+            self._set_status("STOP", prefix + "#{0} cancelled.".format(job.id))
+        elif job.state == job_queue.DONE and not active:
+            done = "Done! Click Save to export."
+            with self._results_lock:
+                count = len(self._results)
+            if count > 1:
+                done = "Done! {0} results. Click one, then Save.".format(count)
+            ps = job.options.get("poll_summary")
+            if ps:
+                done += "  (polled {0}x, {1:.1f}s of {2:.1f}s waiting)".format(
+                    ps["requests"], ps["waiting"], ps["wall"])
+            self._set_status("OK", done)
+        elif job.state == job_queue.RUNNING and job.progress[1]:
+            self._set_status("...", prefix + "#{0} step {1}/{2}".format(
+                job.id, job.progress[0], job.progress[1]))
+        elif job.message:
+            self._set_status("...", prefix + "#{0} {1}".format(job.id, job.message))
+
+    # ── Show result ───────────────────────────────────────────────────────
+
+    def _clear_results(self):
+        """Remove old result files and reset the result area."""
+        for old_f in glob.glob(os.path.join(self._session.result_dir, "result_*.png")):
+            try: os.remove(old_f)
+            except: pass
+        with self._results_lock:
+            self._results = []
+
+        def _do():
+            self._result_grid.Children.Clear()
+        self._ui(_do)
+
+    def _show_result(self, job):
+        """One result fills the panel; from the second on they become tiles."""
+        try:
+            bmp = _load_bitmap(job.result_path)
+            # Held while the layout is dispatched (BeginInvoke doesn't block),
+            # so concurrent results reach the UI in the order they were counted
+            with self._results_lock:
+                self._results.append((job, bmp))
+                count = len(self._results)
+                if count == 1:
+                    def _do():
+                        self._result_img.Source         = bmp
+                        self._result_scroll.Visibility  = Visibility.Collapsed
+                        self._result_viewbox.Visibility = Visibility.Visible
+                        self._result_hint.Visibility    = Visibility.Collapsed
+                    self._ui(_do)
+                    self._select_result(job)
+                    return
+                if count == 2:
+                    self._add_tile(*self._results[0])
+                self._add_tile(job, bmp)
         except Exception as ex:
             self._set_status("ERR", "Display error: " + str(ex))
 
+    def _add_tile(self, job, bmp):
+        tmp = job.result_path
+        def _do():
+            img = Image()
+            img.Source  = bmp
+            img.Stretch = Stretch.Uniform
+            tile = Border()
+            tile.Child           = img
+            tile.Margin          = Thickness(4)
+            tile.BorderThickness = Thickness(2)
+            tile.BorderBrush     = Brushes.Transparent
+            tile.Cursor          = Cursors.Hand
+            tile.ToolTip         = "Seed {0}{1}".format(
+                job.seed, " (preview)" if job.options.get("preview") else "")
+            tile.Tag             = tmp
+            def _click(sender, e):
+                self._highlight_tile(tile)
+                self._select_result(job)
+            tile.MouseLeftButtonUp += _click
+            self._result_grid.Children.Add(tile)
+            n = self._result_grid.Children.Count
+            self._result_grid.Columns = 2 if n <= 4 else 3
+            self._result_viewbox.Visibility = Visibility.Collapsed
+            self._result_hint.Visibility    = Visibility.Collapsed
+            self._result_scroll.Visibility  = Visibility.Visible
+            if n == 1 or tmp == self._result_tmp:
+                self._highlight_tile(tile)
+        self._ui(_do)
+
+    def _highlight_tile(self, selected):
+        accent = BrushConverter().ConvertFromString("#6C63FF")
+        for tile in self._result_grid.Children:
+            tile.BorderBrush = accent if tile.Tag == selected.Tag else Brushes.Transparent
+
+    def _select_result(self, job):
+        """Make job's result the one that Save / Open in Viewer / Refine act on."""
+        self._result_tmp  = job.result_path
+        self._result_seed = job.seed
+        self._result_job  = job
+        def _do():
+            self._save_btn.Visibility = Visibility.Visible
+            self._open_btn.Visibility = Visibility.Visible
+            self._refine_btn.Visibility = (Visibility.Visible if job.options.get("preview")
+                                           else Visibility.Collapsed)
+        self._ui(_do)
+
     # ── Save ──────────────────────────────────────────────────────────────
 
     def _on_save(self, sender, e):
-        import shutil
         if not self._result_tmp or not os.path.exists(self._result_tmp):
             self._set_status("ERR", "No result to save.")
             return
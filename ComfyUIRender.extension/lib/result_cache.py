@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+result_cache.py
+On-disk cache of rendered images under %TEMP%/RevitComfyUI/cache.
+
+Keyed by workflow.fingerprint(): a hash of the final workflow graph with the
+snapshot's content hash in the image slot, so the same snapshot + prompt +
+seed + settings renders once. index.json records size and last use of every
+entry, so lookups and eviction never scan the directory. Entries are evicted
+least-recently-used first once they exceed max_age or the total passes
+max_bytes.
+
+IronPython 2.7 compatible.
+"""
+
+import os
+import json
+import shutil
+import threading
+import time
+
+from snapshot import TMP_DIR
+
+CACHE_DIR = os.path.join(TMP_DIR, "cache")
+
+
+class ResultCache(object):
+
+    def __init__(self, root=CACHE_DIR, max_bytes=500 * 1024 * 1024,
+                 max_age=14 * 86400):
+        self.root      = root
+        self.max_bytes = max_bytes
+        self.max_age   = max_age
+        self._index    = None       # key -> {"file", "size", "used"}
+        self._lock     = threading.Lock()
+
+    # ── Index ─────────────────────────────────────────────────────────────
+
+    def _index_path(self):
+        return os.path.join(self.root, "index.json")
+
+    def _load(self):
+        if self._index is not None:
+            return self._index
+        self._index = {}
+        try:
+            with open(self._index_path(), "r") as f:
+                self._index = json.load(f)
+        except Exception:
+            pass
+        return self._index
+
+    def _save(self):
+        if not os.path.exists(self.root):
+            os.makedirs(self.root)
+        tmp = self._index_path() + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self._index, f)
+        # os.rename won't replace an existing file on Windows
+        if os.path.exists(self._index_path()):
+            os.remove(self._index_path())
+        os.rename(tmp, self._index_path())
+
+    # ── Lookup / store ────────────────────────────────────────────────────
+
+    def get(self, key):
+        """Path of the cached image for key, or None."""
+        with self._lock:
+            index = self._load()
+            entry = index.get(key)
+            if entry is None:
+                return None
+            path = os.path.join(self.root, entry["file"])
+            if (time.time() - entry["used"] > self.max_age
+                    or not os.path.exists(path)):
+                self._drop(key)
+                self._save()
+                return None
+            entry["used"] = time.time()
+            self._save()
+            return path
+
+    def put(self, key, src_path):
+        """Copy the image file at src_path in under key. Returns the cached path."""
+        with self._lock:
+            index = self._load()
+            if not os.path.exists(self.root):
+                os.makedirs(self.root)
+            name = key + ".png"
+            path = os.path.join(self.root, name)
+            shutil.copyfile(src_path, path)
+            index[key] = {"file": name, "size": os.path.getsize(path),
+                          "used": time.time()}
+            self._evict()
+            self._save()
+            return path
+
+    def _drop(self, key):
+        entry = self._index.pop(key, None)
+        if entry is not None:
+            try:
+                os.remove(os.path.join(self.root, entry["file"]))
+            except Exception:
+                pass
+
+    def _evict(self):
+        now = time.time()
+        for key, entry in list(self._index.items()):
+            if now - entry["used"] > self.max_age:
+                self._drop(key)
+        total = sum(e["size"] for e in self._index.values())
+        if total <= self.max_bytes:
+            return
+        for key, entry in sorted(self._index.items(), key=lambda kv: kv[1]["used"]):
+            if total <= self.max_bytes:
+                break
+            total -= entry["size"]
+            self._drop(key)
+
+    def stats(self):
+        with self._lock:
+            index = self._load()
+            return len(index), sum(e["size"] for e in index.values())
+
+
+_cache = None
+
+def get_cache(settings):
+    """Shared cache sized from settings (cache_max_mb, cache_max_days)."""
+    global _cache
+    max_bytes = int(settings.get("cache_max_mb", 500)) * 1024 * 1024
+    max_age   = float(settings.get("cache_max_days", 14)) * 86400
+    if _cache is None:
+        _cache = ResultCache()
+    _cache.max_bytes = max_bytes
+    _cache.max_age   = max_age
+    return _cache
@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+"""
+server_pool.py
+Several ComfyUI servers used as one render farm.
+
+Each node is health-checked via /system_stats and /queue; pick() sends the
+next prompt to the healthy node with the shortest expected wait
+(queue depth + our in-flight jobs, times that node's recent seconds/job).
+Results must be downloaded from the node that ran the job — callers keep
+the ServerNode returned by pick() alongside the prompt_id.
+
+Health is cached: within HEALTH_TTL a render makes no preflight request at
+all, and up to STALE_TTL a node that was healthy is used while a
+background check refreshes it. Nodes that are down are only waited for
+when no usable node is left. The installed node types (/object_info,
+several MB) are re-read only every OBJECT_INFO_TTL, and pick(required=...)
+skips servers that lack a workflow's custom nodes.
+
+IronPython 2.7 compatible.
+"""
+
+import threading
+import time
+
+import comfy_http
+
+HEALTH_TTL      = 5.0    # seconds a health check stays valid
+STALE_TTL       = 60.0   # ...and may be used while it is refreshed
+OBJECT_INFO_TTL = 300.0  # seconds between /object_info reads
+DEFAULT_JOB_SEC = 10.0   # assumed seconds/job before a node has finished one
+EWMA            = 0.3    # weight of the newest sample in latency averages
+
+
+class ServerNode(object):
+    """Health and throughput bookkeeping for one ComfyUI server."""
+
+    def __init__(self, base_url):
+        self.base_url    = base_url.rstrip("/")
+        self.healthy     = False
+        self.error       = ""
+        self.device      = ""
+        self.vram_free   = 0
+        self.queue_depth = 0      # running + pending, all clients
+        self.rtt         = 0.0    # health-check round trip, EWMA
+        self.job_seconds = None   # seconds per finished job, EWMA
+        self.inflight    = 0      # our prompts not yet finished
+        self.completed   = 0
+        self.busy_time   = 0.0
+        self.checked_at  = 0.0
+        self.node_types  = None   # installed class_types, None = not read yet
+        self.types_at    = 0.0
+        self.checking    = False  # a background check is running
+        self._checker    = None   # ...and its thread
+        self._last_done  = None
+
+    def check(self):
+        """Refresh health from /system_stats and /queue. Never raises."""
+        client = comfy_http.client_for(self.base_url)
+        start  = time.time()
+        try:
+            stats = client.get_json("/system_stats", timeout=3)
+            rtt   = time.time() - start
+            queue = client.get_json("/queue", timeout=3)
+            devices = stats.get("devices") or [{}]
+            self.device      = devices[0].get("name", "")
+            self.vram_free   = devices[0].get("vram_free", 0)
+            self.queue_depth = (len(queue.get("queue_running", []))
+                                + len(queue.get("queue_pending", [])))
+            self.rtt     = rtt if not self.rtt else EWMA * rtt + (1 - EWMA) * self.rtt
+            if time.time() - self.types_at > OBJECT_INFO_TTL:
+                self.node_types = set(client.get_json("/object_info", timeout=30))
+                self.types_at   = time.time()
+            self.healthy = True
+            self.error   = ""
+        except Exception as ex:
+            self.healthy = False
+            self.error   = str(ex)
+        self.checked_at = time.time()
+        self.checking   = False
+
+    def mark_failed(self, error):
+        """A request to this node failed: treat it as down until re-checked."""
+        self.healthy    = False
+        self.error      = str(error)
+        self.checked_at = 0.0
+
+    def missing(self, required):
+        """Class types in required that this server doesn't have (sorted)."""
+        if self.node_types is None:
+            return []       # unknown yet; ComfyUI's own validation will tell
+        return sorted(set(required) - self.node_types)
+
+    def expected_wait(self, default_job):
+        """Seconds until a prompt sent now would be done (lower is better)."""
+        job = self.job_seconds if self.job_seconds is not None else default_job
+        # Our submitted prompts can be counted twice until the next health
+        # check; that only biases towards spreading work, which is fine.
+        ahead = self.queue_depth + self.inflight
+        return (ahead + 1) * job + self.rtt
+
+    def record_done(self, submitted_at):
+        """
+        A job from this node finished. Jobs run one at a time per server, so
+        the time since the previous completion (or since submission, for the
+        first) is what this job cost.
+        """
+        now   = time.time()
+        since = submitted_at
+        if self._last_done is not None and self._last_done > submitted_at:
+            since = self._last_done
+        took = max(0.0, now - since)
+        self._last_done = now
+        self.completed += 1
+        self.busy_time += took
+        if self.job_seconds is None:
+            self.job_seconds = took
+        else:
+            self.job_seconds = EWMA * took + (1 - EWMA) * self.job_seconds
+
+    def throughput(self):
+        """Images per minute while busy."""
+        if self.busy_time <= 0:
+            return 0.0
+        return 60.0 * self.completed / self.busy_time
+
+
+class ServerPool(object):
+
+    def __init__(self, urls):
+        self.nodes = [ServerNode(u) for u in urls]
+        self._lock = threading.Lock()
+
+    def refresh(self, force=False, required=()):
+        """
+        Health-check stale nodes in parallel. Returns the healthy nodes.
+        With force, waits for every check (joining any already running).
+        Otherwise it only waits while no node is usable — healthy less than
+        STALE_TTL ago and, with required, not known to lack those node
+        types — and the rest are re-checked in the background, so a
+        powered-off server doesn't slow down every render.
+        """
+        now    = time.time()
+        checks = []
+        with self._lock:
+            for node in self.nodes:
+                if node.checking:
+                    checks.append(node._checker)    # share the running check
+                    continue
+                if not force and now - node.checked_at <= HEALTH_TTL:
+                    continue
+                node.checking = True
+                t = threading.Thread(target=node.check)
+                t.daemon = True
+                node._checker = t
+                t.start()
+                checks.append(t)
+        if force:
+            for t in checks:
+                t.join()
+        else:
+            # Wait only until the first usable node turns up
+            while not self._usable(required) and any(t.is_alive() for t in checks):
+                [t for t in checks if t.is_alive()][0].join(0.05)
+        return self.healthy()
+
+    def _usable(self, required=()):
+        now = time.time()
+        return [n for n in self.nodes
+                if n.healthy and now - n.checked_at <= STALE_TTL
+                and not n.missing(required)]
+
+    def healthy(self):
+        return [n for n in self.nodes if n.healthy]
+
+    def pick(self, required=()):
+        """
+        Reserve the least-loaded healthy node for one prompt. With required
+        (node class_types), servers known to lack any of them are skipped.
+        Call release() when the job has finished (or failed).
+        """
+        self.refresh(required=required)
+        with self._lock:
+            nodes = self.healthy()
+            if not nodes:
+                raise Exception(self.unreachable_message())
+            capable = [n for n in nodes if not n.missing(required)]
+            if not capable:
+                raise Exception(self.missing_message(required))
+            nodes = capable
+            known = [n.job_seconds for n in nodes if n.job_seconds is not None]
+            default_job = sum(known) / len(known) if known else DEFAULT_JOB_SEC
+            node = min(nodes, key=lambda n: n.expected_wait(default_job))
+            node.inflight += 1
+            return node
+
+    def release(self, node, submitted_at=None):
+        """Return a reservation; pass submitted_at when the job succeeded."""
+        with self._lock:
+            node.inflight = max(0, node.inflight - 1)
+            if submitted_at is not None:
+                node.record_done(submitted_at)
+
+    def missing_message(self, required):
+        lines = ["No ComfyUI server has all the nodes this workflow needs:"]
+        for n in self.healthy():
+            lines.append("  {0}: missing {1}".format(
+                n.base_url, ", ".join(n.missing(required))))
+        lines.append("Install them with ComfyUI Manager and restart ComfyUI.")
+        return "\n".join(lines)
+
+    def unreachable_message(self):
+        lines = ["No ComfyUI server reachable:"]
+        for n in self.nodes:
+            lines.append("  {0}: {1}".format(n.base_url, n.error or "not checked"))
+        return "\n".join(lines)
+
+    def report(self):
+        """One line per node: health, queue and throughput."""
+        lines = []
+        for n in self.nodes:
+            if not n.healthy:
+                lines.append("{0}  OFFLINE  {1}".format(
+                    n.base_url, n.error.split("\n")[-1][:80]))
+                continue
+            lines.append("{0}  queue {1}  {2} done  {3:.1f} img/min  {4}  {5:.1f} GB free".format(
+                n.base_url, n.queue_depth, n.completed, n.throughput(),
+                n.device.split(":")[-1].strip() or "?", n.vram_free / 1e9))
+        return "\n".join(lines)
+
+
+# ── Shared pool ───────────────────────────────────────────────────────────────
+_pool      = None
+_pool_lock = threading.Lock()
+
+def server_urls(settings):
+    """comfy_url first, then any extra "servers" from settings, de-duplicated."""
+    urls = []
+    for u in [settings.get("comfy_url", "")] + list(settings.get("servers") or []):
+        u = (u or "").strip().rstrip("/")
+        if u and u not in urls:
+            urls.append(u)
+    return urls
+
+
+def get_pool(settings):
+    """
+    The pool for the configured servers. Reused while the server list is
+    unchanged, so health and throughput stats survive between renders.
+    """
+    global _pool
+    urls = server_urls(settings)
+    with _pool_lock:
+        if _pool is None or [n.base_url for n in _pool.nodes] != urls:
+            _pool = ServerPool(urls)
+        return _pool
@@ -14,9 +14,27 @@ DEFAULTS = {
     "steps":         20,
     "cfg_scale":     7.0,
     "denoise":       0.75,
+    "render_timeout": 1800,     # seconds before a render is abandoned
+    "servers":       [],        # extra ComfyUI URLs for the render farm
+    "render_workers": 2,        # jobs in flight at once (per window)
+    "cache_max_mb":  500,       # on-disk result cache size limit
+    "cache_max_days": 14,       # cache entries unused this long are evicted
+    "profile":       "standard", # resolution profile (profiles.PROFILES)
+    "aspect":        "16:9",     # output aspect ratio (profiles.ASPECTS)
+    "warmup_on_open": True,     # load models when the render window opens
+    "keepalive_minutes": 0,     # re-ping to keep models resident (0 = off)
+    "watch_interval": 1.0,      # seconds between watch-mode view checks
+    "watch_threshold": 0.04,    # mean luma change (0-1) that counts as a new view
+    "supersede":     False,     # a new Render click drops earlier clicks' unstarted renders
+    "supersede_interrupt": False, # ...and interrupts the one ComfyUI is running
 }
 
 
+def path(name):
+    """Path of a file kept next to settings.json (logs, traces)."""
+    return os.path.join(_DIR, name)
+
+
 def load():
     if os.path.exists(_FILE):
         try:
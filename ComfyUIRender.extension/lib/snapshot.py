@@ -6,16 +6,35 @@ Two methods tried in order:
   1. GDI BitBlt  — reads screen pixels of the exact viewport rectangle
   2. ExportImage — Revit's own export, kept as fallback
 
+Either way the frame is decoded once, cropped and resized to the requested
+size (1366x768 by default, see profiles.capture_size) in a single DrawImage
+and PNG-encoded once, straight into the snapshot file. The encoded bytes
+and their SHA-1 stay in memory (payload / payload_digest), so the upload
+and the result cache don't read the file back.
+
+export_views() does the same for a chosen set of views through ExportImage,
+a few views per call, handing each one on as soon as its call returns.
+grab_frame() / frame_signature() / save_frame() split capture_gdi_only()
+up for watch mode, which encodes only the frames it renders.
+
 IronPython 2.7 compatible (no exist_ok, no f-strings, no py3-only stdlib).
 """
 
 import os
 import ctypes
+import hashlib
 import tempfile
+import threading
 import glob
 
+import image_ops
+import tracing
+
 TMP_DIR = os.path.join(tempfile.gettempdir(), "RevitComfyUI")
 
+TARGET_W = 1366
+TARGET_H = 768
+
 
 def _ensure_dir(path):
     """makedirs without exist_ok (IronPython 2.7 compatible)."""
@@ -23,35 +42,34 @@ def _ensure_dir(path):
         os.makedirs(path)
 
 
-def capture(uidoc):
+@tracing.traced("capture")
+def capture(uidoc, size=None):
     """
     Try GDI capture first, then ExportImage fallback.
-    Returns path to saved PNG, or raises Exception.
+    size is the (width, height) of the saved PNG; the view is centre-cropped
+    to its aspect ratio. Returns path to saved PNG, or raises Exception.
     """
     import time
     _ensure_dir(TMP_DIR)
     # Unique name per capture so WPF never shows a stale cached image
-    out = os.path.join(TMP_DIR, "snap_{0}.png".format(int(time.time())))
+    out = os.path.join(TMP_DIR, "snap_{0}.png".format(int(time.time() * 1000)))
 
     errors = []
 
     # ── Method 1: GDI screen capture ─────────────────────────────────────
     try:
-        path = _capture_gdi(uidoc, out)
-        if path and os.path.exists(path) and os.path.getsize(path) > 1000:
-            crop_to_1366x768(path)
-            return path
-        else:
-            errors.append("GDI: file not created or empty")
+        with tracing.span("grab"):
+            frame = _grab_gdi(uidoc)
+        return _finish(frame, out, size)
     except Exception as ex:
         errors.append("GDI: " + str(ex))
 
     # ── Method 2: ExportImage fallback ────────────────────────────────────
     try:
-        path = _capture_export_image(uidoc.Document, out)
+        with tracing.span("export"):
+            path = _capture_export_image(uidoc.Document)
         if path and os.path.exists(path) and os.path.getsize(path) > 1000:
-            crop_to_1366x768(path)
-            return path
+            return _finish(_load_bitmap(path), out, size)
         else:
             errors.append("ExportImage: file not created or empty")
     except Exception as ex:
@@ -62,7 +80,8 @@ def capture(uidoc):
 
 # ── Method 1: GDI BitBlt ──────────────────────────────────────────────────────
 
-def _capture_gdi(uidoc, out_path):
+def _grab_gdi(uidoc):
+    """BitBlt the active viewport into an in-memory System.Drawing.Bitmap."""
     import clr
     clr.AddReference("RevitAPIUI")
     clr.AddReference("System.Drawing")
@@ -110,23 +129,21 @@ def _capture_gdi(uidoc, out_path):
         user32.ReleaseDC(0, hdc_screen)
         raise Exception("BitBlt returned 0 (failed)")
 
-    # Convert to System.Drawing.Bitmap and save
+    # Copy into a managed Bitmap; nothing is encoded or written yet
     bmp = System.Drawing.Bitmap.FromHbitmap(System.IntPtr(hbmp))
-    bmp.Save(out_path, System.Drawing.Imaging.ImageFormat.Png)
-    bmp.Dispose()
 
     gdi32.DeleteObject(hbmp)
     gdi32.DeleteDC(hdc_mem)
     user32.ReleaseDC(0, hdc_screen)
 
-    return out_path
+    return bmp
 
 
 # ── Method 2: ExportImage ─────────────────────────────────────────────────────
 
-def _capture_export_image(doc, out_path):
+def _capture_export_image(doc):
+    """Export the current view with Revit. Returns the exported PNG's path."""
     import clr
-    import shutil
     clr.AddReference("RevitAPI")
     from Autodesk.Revit.DB import (
         ImageExportOptions, ImageFileType,
@@ -155,73 +172,292 @@ def _capture_export_image(doc, out_path):
     # Find whatever Revit named the file
     candidates = glob.glob(os.path.join(TMP_DIR, "snap_export*.png"))
     if candidates:
-        newest = max(candidates, key=os.path.getmtime)
-        shutil.copy2(newest, out_path)
-        return out_path
+        return max(candidates, key=os.path.getmtime)
 
     raise Exception("ExportImage produced no PNG file in " + TMP_DIR)
 
 
+# ── Several views: ExportImage with ExportRange.SetOfViews ──────────────────
+
+EXPORT_CHUNK = 4        # views per ExportImage call
+
+
+def _exported_file(folder, doc, view):
+    """The PNG Revit wrote for view in folder (named "<prefix> - 3D View - <name>.png")."""
+    from Autodesk.Revit.DB import ImageExportOptions
+    try:
+        name = ImageExportOptions.GetFileName(doc, view.Id)
+        for path in (name, name + ".png", os.path.join(folder, os.path.basename(name) + ".png")):
+            if os.path.exists(path):
+                return path
+    except Exception:
+        pass
+    # Revit replaces characters that are illegal in file names
+    safe = "".join("-" if c in '\\/:*?"<>|' else c for c in view.Name)
+    for path in glob.glob(os.path.join(folder, "*.png")):
+        if os.path.splitext(os.path.basename(path))[0].endswith(" - " + safe):
+            return path
+    return None
+
+
+@tracing.traced("capture")
+def export_views(doc, views, size=None, chunk=EXPORT_CHUNK, on_view=None, keep=()):
+    """
+    Export views with Revit's ExportImage (ExportRange.SetOfViews) and
+    crop/resize each like capture(). Views are exported `chunk` per call and
+    on_view(view, path) runs after each call, so renders of the first views
+    are already running while Revit exports the next ones.
+    Revit's own files are deleted once read; snapshots of earlier calls are
+    deleted too, except the paths in keep (still needed by jobs).
+    Must run in Revit API context. Returns [(view, path)]; raises if no view
+    could be exported.
+    """
+    import clr
+    import time
+    clr.AddReference("RevitAPI")
+    from System.Collections.Generic import List
+    from Autodesk.Revit.DB import (
+        ElementId, ImageExportOptions, ImageFileType,
+        ImageResolution, ZoomFitType, ExportRange
+    )
+
+    dst_w, dst_h = size or (TARGET_W, TARGET_H)
+    root  = os.path.join(TMP_DIR, "views")
+    stamp = int(time.time() * 1000)
+    keep  = set(os.path.normcase(os.path.abspath(p)) for p in keep)
+    for old_f in (glob.glob(os.path.join(root, "*", "*.png"))
+                  + glob.glob(os.path.join(root, "view_*.png"))):
+        if os.path.normcase(os.path.abspath(old_f)) in keep:
+            continue
+        try:
+            os.remove(old_f)
+        except Exception:
+            pass
+
+    done   = []
+    errors = []
+    for start in range(0, len(views), chunk):
+        group  = views[start:start + chunk]
+        folder = os.path.join(root, "chunk_{0}".format(start // chunk))
+        _ensure_dir(folder)
+
+        opts = ImageExportOptions()
+        opts.ExportRange            = ExportRange.SetOfViews
+        opts.FilePath               = os.path.join(folder, "view")
+        opts.HLRandWFViewsFileType  = ImageFileType.PNG
+        opts.ShadowViewsFileType    = ImageFileType.PNG
+        opts.ImageResolution        = ImageResolution.DPI_150
+        opts.ZoomType               = ZoomFitType.FitToPage
+        opts.PixelSize              = max(1280, dst_w, dst_h)
+        opts.SetViewsAndSheets(List[ElementId]([v.Id for v in group]))
+
+        try:
+            with tracing.span("export", views=len(group)):
+                doc.ExportImage(opts)
+        except Exception as ex:
+            errors.append("ExportImage: " + str(ex))
+            continue
+
+        for view in group:
+            src = None
+            try:
+                src = _exported_file(folder, doc, view)
+                if src is None:
+                    raise Exception("no file written")
+                out = os.path.join(root, "view_{0}_{1}.png".format(view.Id, stamp))
+                _finish(_load_bitmap(src), out, size)
+            except Exception as ex:
+                errors.append("{0}: {1}".format(view.Name, ex))
+                continue
+            finally:
+                if src is not None:
+                    try:
+                        os.remove(src)
+                    except Exception:
+                        pass
+            done.append((view, out))
+            if on_view is not None:
+                on_view(view, out)
+
+    if not done:
+        raise Exception("No view could be exported:\n  " + "\n  ".join(errors))
+    return done
+
+
+# ── Crop / resize / encode once ───────────────────────────────────────────────
+
+def _finish(src, out_path, size=None):
+    """
+    Centre-crop src (a System.Drawing.Bitmap) to size (default TARGET_W x
+    TARGET_H) in one DrawImage and encode it once as PNG into out_path.
+    Disposes src.
+    Returns out_path; the bytes are kept for payload().
+    """
+    import clr
+    clr.AddReference("System.Drawing")
+    import System.Drawing as SD
+    import System.Drawing.Imaging as SDI
+    import System.Drawing.Drawing2D as SD2
+    from System.IO import MemoryStream
+
+    dst_w, dst_h = size or (TARGET_W, TARGET_H)
+    with tracing.span("encode", width=dst_w, height=dst_h) as sp:
+        try:
+            x, y, w, h = image_ops.center_crop_box(src.Width, src.Height,
+                                                   dst_w, dst_h)
+            # 24bpp: the alpha channel is always opaque, drop it from the PNG
+            dst = SD.Bitmap(dst_w, dst_h, SDI.PixelFormat.Format24bppRgb)
+            g   = SD.Graphics.FromImage(dst)
+            g.InterpolationMode = SD2.InterpolationMode.HighQualityBicubic
+            g.PixelOffsetMode   = SD2.PixelOffsetMode.HighQuality
+            g.DrawImage(src, SD.Rectangle(0, 0, dst_w, dst_h),
+                             SD.Rectangle(x, y, w, h),
+                             SD.GraphicsUnit.Pixel)
+            g.Dispose()
+            stream = MemoryStream()
+            try:
+                dst.Save(stream, SDI.ImageFormat.Png)
+            finally:
+                dst.Dispose()
+            data = bytes(bytearray(stream.ToArray()))
+        finally:
+            src.Dispose()
+
+        with open(out_path, "wb") as f:
+            f.write(data)
+        sp.set(bytes=len(data))
+    _remember(out_path, data)
+    return out_path
+
+
+def _load_bitmap(path):
+    """Decode an image file into a Bitmap that doesn't keep the file locked."""
+    import clr
+    clr.AddReference("System.Drawing")
+    import System.Drawing as SD
+    from System.IO import File, MemoryStream
+    return SD.Bitmap(MemoryStream(File.ReadAllBytes(path)))
+
+
+# ── Encoded snapshot bytes ────────────────────────────────────────────────────
+_payloads      = {}     # path -> (bytes, sha1 hex)
+_payloads_lock = threading.Lock()   # shared by the UI thread and render workers
+_MAX_PAYLOAD   = 4      # snapshots kept in memory
+
+def _remember(path, data):
+    """Keep data as path's payload; returns the (bytes, sha1 hex) entry."""
+    entry = (data, hashlib.sha1(data).hexdigest())
+    with _payloads_lock:
+        if path not in _payloads and len(_payloads) >= _MAX_PAYLOAD:
+            _payloads.clear()
+        _payloads[path] = entry
+    return entry
+
+
+def _entry(path):
+    with _payloads_lock:
+        entry = _payloads.get(path)
+    if entry is None:
+        with open(path, "rb") as f:
+            entry = _remember(path, f.read())
+    return entry
+
+
+def available(path):
+    """True while payload(path) can still be served (memory or file)."""
+    with _payloads_lock:
+        if path in _payloads:
+            return True
+    return os.path.exists(path)
+
+
+def payload(path):
+    """PNG bytes of a snapshot; from memory when it was captured this session."""
+    return _entry(path)[0]
+
+
+def payload_digest(path):
+    """SHA-1 hex digest of payload(path)."""
+    return _entry(path)[1]
+
+
+# ── Watch mode: cheap frames ─────────────────────────────────────────────────
+
+def grab_frame(uidoc):
+    """GDI grab of the active viewport as a Bitmap; see watch.py."""
+    return _grab_gdi(uidoc)
+
+
+def frame_signature(bmp):
+    """
+    image_ops.luma_signature of a Bitmap. System.Drawing shrinks it to the
+    signature grid natively, so only a few hundred pixels are read.
+    """
+    import clr
+    clr.AddReference("System.Drawing")
+    import System.Drawing as SD
+    import System.Drawing.Imaging as SDI
+    import System.Drawing.Drawing2D as SD2
+
+    cols, rows = image_ops.SIGNATURE_COLS, image_ops.SIGNATURE_ROWS
+    small = SD.Bitmap(cols, rows, SDI.PixelFormat.Format24bppRgb)
+    try:
+        g = SD.Graphics.FromImage(small)
+        g.InterpolationMode = SD2.InterpolationMode.HighQualityBilinear
+        g.DrawImage(bmp, 0, 0, cols, rows)
+        g.Dispose()
+        pixels = bytearray(cols * rows * 3)
+        i = 0
+        for y in range(rows):
+            for x in range(cols):
+                c = small.GetPixel(x, y)
+                pixels[i], pixels[i + 1], pixels[i + 2] = c.R, c.G, c.B
+                i += 3
+    finally:
+        small.Dispose()
+    return image_ops.luma_signature(pixels, cols, rows, 3, cols, rows, samples=1)
+
+
+def save_frame(bmp, size=None):
+    """Crop/resize/encode a grabbed frame like capture(). Disposes bmp; returns the path."""
+    import time
+    _ensure_dir(TMP_DIR)
+    now = time.time()
+    # Frames of earlier watch renders, once their jobs have long uploaded
+    for old_f in glob.glob(os.path.join(TMP_DIR, "watch_*.png")):
+        try:
+            if now - os.path.getmtime(old_f) > 600:
+                os.remove(old_f)
+        except Exception:
+            pass
+    out = os.path.join(TMP_DIR, "watch_{0}.png".format(int(now * 1000)))
+    return _finish(bmp, out, size)
+
+
 # ── Public: GDI only (safe from any thread, no Revit API calls) ──────────────
-def capture_gdi_only(uidoc):
+@tracing.traced("capture")
+def capture_gdi_only(uidoc, size=None, keep=()):
     """
-    Capture viewport using GDI BitBlt only.
+    Capture viewport using GDI BitBlt only (size as in capture()).
     Safe to call from WPF button handlers (no Revit API transactions).
     Uses a timestamped filename so WPF never serves a stale cached image.
+    Earlier snapshots are deleted, except the paths in keep (snapshots
+    that queued jobs or a later Refine still need).
     Raises Exception if it fails.
     """
     import time
     _ensure_dir(TMP_DIR)
     # Unique filename per capture so WPF image cache is always invalidated
-    out = os.path.join(TMP_DIR, "snap_{0}.png".format(int(time.time())))
+    out = os.path.join(TMP_DIR, "snap_{0}.png".format(int(time.time() * 1000)))
     # Remove previous snapshots to avoid clutter
+    keep = set(os.path.normcase(os.path.abspath(p)) for p in keep)
     for old_f in glob.glob(os.path.join(TMP_DIR, "snap_*.png")):
+        if os.path.normcase(os.path.abspath(old_f)) in keep:
+            continue
         try:
             os.remove(old_f)
         except Exception:
             pass
-    path = _capture_gdi(uidoc, out)
-    crop_to_1366x768(path)
-    return path
-def crop_to_1366x768(src_path):
-    """
-    Crop the centre of src_path to 16:9 then resize to 1366x768.
-    Overwrites the file in-place. Uses System.Drawing (always available).
-    Falls back to PIL if present.
-    """
-    try:
-        import clr
-        clr.AddReference("System.Drawing")
-        import System.Drawing as SD
-        import System.Drawing.Imaging as SDI
-
-        src = SD.Bitmap(src_path)
-        sw, sh = src.Width, src.Height
-
-        # Crop to 16:9 centre
-        target_ratio = 1366.0 / 768.0
-        src_ratio    = float(sw) / float(sh)
-        if src_ratio > target_ratio:
-            crop_w = int(sh * target_ratio)
-            crop_h = sh
-        else:
-            crop_w = sw
-            crop_h = int(sw / target_ratio)
-        cx = (sw - crop_w) // 2
-        cy = (sh - crop_h) // 2
-
-        dst = SD.Bitmap(1366, 768)
-        g   = SD.Graphics.FromImage(dst)
-        g.InterpolationMode = System.Drawing.Drawing2D.InterpolationMode.HighQualityBicubic
-        g.DrawImage(src, SD.Rectangle(0, 0, 1366, 768),
-                         SD.Rectangle(cx, cy, crop_w, crop_h),
-                         SD.GraphicsUnit.Pixel)
-        g.Dispose()
-        src.Dispose()
-
-        dst.Save(src_path, SDI.ImageFormat.Png)
-        dst.Dispose()
-        return src_path
-    except Exception as ex:
-        # If System.Drawing crop fails, return original unchanged
-        return src_path
+    with tracing.span("grab"):
+        frame = _grab_gdi(uidoc)
+    return _finish(frame, out, size)
@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+"""
+tracing.py
+Per-render stage timings, appended to a rolling JSONL log.
+
+A worker thread opens a trace with begin(); code underneath it (snapshot,
+workflow, comfy_http) wraps its stages in `with tracing.span("upload"):`
+without being passed anything — the trace is thread-local, and span() is a
+shared no-op when the thread has none. end() appends one JSON line:
+
+    {"kind": "render", "at": ..., "total": 12.3, "outcome": "done",
+     "spans": [["upload", 0.01, 0.08, {"bytes": 912345}], ...]}
+
+The cost per span is two time.time() calls and a list append, and one
+small file append per render, so it stays on in production. The log rolls
+over to traces.1.jsonl at MAX_BYTES.
+
+Summary per stage (count, p50, p95, mean size):
+    python tracing.py [traces.jsonl ...]
+
+IronPython 2.7 compatible.
+"""
+
+import os
+import sys
+import json
+import threading
+import time
+
+MAX_BYTES = 2 * 1024 * 1024
+
+_local      = threading.local()
+_write_lock = threading.Lock()
+
+
+def log_path():
+    import settings_manager
+    return settings_manager.path("traces.jsonl")
+
+
+class _Span(object):
+
+    def __init__(self, trace, stage, attrs):
+        self.trace = trace
+        self.stage = stage
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        """Attach sizes etc. once they are known (e.g. bytes downloaded)."""
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        self.trace.add(self.stage, time.time() - self.start, self.start, **self.attrs)
+        return False
+
+
+class _NullSpan(object):
+
+    def set(self, **attrs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NULL = _NullSpan()
+
+
+class Trace(object):
+    """Spans of one render (or capture)."""
+
+    def __init__(self, kind, **attrs):
+        self.kind  = kind
+        self.attrs = attrs
+        self.t0    = time.time()
+        self.spans = []
+
+    def span(self, stage, **attrs):
+        return _Span(self, stage, attrs)
+
+    def add(self, stage, seconds, start=None, **attrs):
+        """Record a stage measured elsewhere (start defaults to now - seconds)."""
+        if start is None:
+            start = time.time() - seconds
+        self.spans.append([stage, round(start - self.t0, 4), round(seconds, 4), attrs])
+
+    def record(self, **attrs):
+        out = {"kind": self.kind, "at": round(self.t0, 3),
+               "total": round(time.time() - self.t0, 4), "spans": self.spans}
+        out.update(self.attrs)
+        out.update(attrs)
+        return out
+
+
+# ── Thread-local API ──────────────────────────────────────────────────────────
+
+def begin(kind, **attrs):
+    """Start a trace for this thread and return it."""
+    trace = Trace(kind, **attrs)
+    _local.trace = trace
+    return trace
+
+
+def current():
+    return getattr(_local, "trace", None)
+
+
+def attach(trace):
+    """
+    Make trace this thread's trace (None detaches), so a render whose
+    stages run on different threads still records into one trace.
+    """
+    _local.trace = trace
+
+
+def span(stage, **attrs):
+    """Context manager timing stage in this thread's trace (no-op without one)."""
+    trace = current()
+    if trace is None:
+        return _NULL
+    return trace.span(stage, **attrs)
+
+
+def end(**attrs):
+    """Close this thread's trace and append it to the log. Never raises."""
+    trace = current()
+    _local.trace = None
+    if trace is None:
+        return None
+    record = trace.record(**attrs)
+    try:
+        write(record)
+    except Exception:
+        pass
+    return record
+
+
+def traced(kind):
+    """
+    Decorator: run the function in its own trace of `kind`, unless the
+    thread is already tracing (then its spans join that trace).
+    """
+    def wrap(fn):
+        def inner(*args, **kwargs):
+            if current() is not None:
+                return fn(*args, **kwargs)
+            begin(kind)
+            outcome = "failed"
+            try:
+                result  = fn(*args, **kwargs)
+                outcome = "done"
+                return result
+            finally:
+                end(outcome=outcome)
+        inner.__name__ = fn.__name__
+        inner.__doc__  = fn.__doc__
+        return inner
+    return wrap
+
+
+def write(record, path=None):
+    path = path or log_path()
+    line = json.dumps(record, separators=(",", ":")) + "\n"
+    with _write_lock:
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        if os.path.exists(path) and os.path.getsize(path) + len(line) > MAX_BYTES:
+            old = path[:-len(".jsonl")] + ".1.jsonl"
+            if os.path.exists(old):
+                os.remove(old)
+            os.rename(path, old)
+        with open(path, "a") as f:
+            f.write(line)
+
+
+# ── Summary ───────────────────────────────────────────────────────────────────
+
+def _percentile(sorted_values, p):
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, int(round(p / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[k]
+
+
+def load(paths=None):
+    """Records from the log and its rolled-over predecessor, oldest first."""
+    if not paths:
+        current_log = log_path()
+        paths = [current_log[:-len(".jsonl")] + ".1.jsonl", current_log]
+    records = []
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        with open(path, "r") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    pass        # torn last line after a crash
+    return records
+
+
+def summary(records):
+    """{(kind, stage): {"count", "p50", "p95", "mean_bytes"}}; stage "total" is the whole trace."""
+    times = {}
+    sizes = {}
+    for rec in records:
+        kind = rec.get("kind", "?")
+        times.setdefault((kind, "total"), []).append(rec.get("total", 0.0))
+        for stage, _, seconds, attrs in rec.get("spans", []):
+            times.setdefault((kind, stage), []).append(seconds)
+            if "bytes" in attrs:
+                sizes.setdefault((kind, stage), []).append(attrs["bytes"])
+    out = {}
+    for key, values in times.items():
+        values.sort()
+        b = sizes.get(key)
+        out[key] = {"count": len(values),
+                    "p50":   _percentile(values, 50),
+                    "p95":   _percentile(values, 95),
+                    "mean_bytes": sum(b) / len(b) if b else None}
+    return out
+
+
+def format_summary(records):
+    stats = summary(records)
+    if not stats:
+        return "No traces recorded yet."
+    lines = ["{0:<8} {1:<12} {2:>6} {3:>9} {4:>9} {5:>10}".format(
+        "kind", "stage", "count", "p50 s", "p95 s", "avg size")]
+    for (kind, stage) in sorted(stats, key=lambda k: (k[0], k[1] == "total", k[1])):
+        st   = stats[(kind, stage)]
+        size = ""
+        if st["mean_bytes"] is not None:
+            size = "{0:.0f} KB".format(st["mean_bytes"] / 1024.0)
+        lines.append("{0:<8} {1:<12} {2:>6} {3:>9.3f} {4:>9.3f} {5:>10}".format(
+            kind, stage, st["count"], st["p50"], st["p95"], size))
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    print(format_summary(load(sys.argv[1:])))
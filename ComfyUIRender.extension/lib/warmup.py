@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+warmup.py
+Load the models before the first real render, and keep them loaded.
+
+A warm-up prompt is the render workflow itself — same UNet / CLIP / VAE
+loaders — shrunk to one sampler step on a 64x64 grey frame, with the
+SaveImage node swapped for PreviewImage so nothing lands in ComfyUI's
+output folder. Each ping uses a new seed: ComfyUI would otherwise answer an
+identical prompt from its cache without touching the sampler.
+
+Warmer.measure() runs it twice and reports cold vs. warm latency; a
+KeepAlive thread re-pings on an interval while the render window is open.
+
+IronPython 2.7 compatible.
+"""
+
+import base64
+import random
+import threading
+import time
+import uuid
+
+import comfy_http
+import image_ops
+import workflow
+
+_SIZE = 64
+
+
+def _frame():
+    """Tiny mid-grey PNG used as the warm-up snapshot."""
+    return image_ops.encode_png(bytearray([128] * (_SIZE * _SIZE * 3)), _SIZE, _SIZE)
+
+
+def warmup_graph(image, seed, template=None, image_source="upload", values=None):
+    """
+    The render graph for template, cut down to the cheapest full pass.
+    values are the workflow.settings_values() real renders use, so the same
+    checkpoint gets loaded.
+    """
+    slots  = dict(values or {})
+    slots.update(steps=1, side=_SIZE, width=_SIZE, height=_SIZE, megapixels=0.01)
+    graph  = workflow.build(image, "warm-up", seed, image_source=image_source,
+                            template=template, **slots)
+    output = workflow.output_node(template)
+    node   = graph[output]
+    graph  = dict(graph)
+    graph[output] = {"inputs": {"images": node["inputs"]["images"]},
+                     "class_type": "PreviewImage", "_meta": {"title": "Warm-up"}}
+    return graph
+
+
+class Warmer(object):
+    """Warm-up pings against one server."""
+
+    def __init__(self, base_url, template=None, timeout=900, values=None):
+        self.base_url = base_url.rstrip("/")
+        self.template = template
+        self.values   = values or {}    # workflow.settings_values()
+        self.timeout  = timeout
+        self.history  = []          # seconds per ping, oldest first
+        self._image   = None
+        self._source  = "upload"
+
+    def _snapshot(self):
+        if self._image is None:
+            data = _frame()
+            try:
+                self._image = comfy_http.upload_image(
+                    self.base_url, "warmup.png", data=data)
+            except Exception:
+                self._image  = base64.b64encode(data).decode("ascii")
+                self._source = "base64"
+        return self._image
+
+    def ping(self, should_stop=None):
+        """Run one warm-up prompt to completion. Returns seconds taken."""
+        start = time.time()
+        graph = warmup_graph(self._snapshot(), random.randint(0, 2147483647),
+                             self.template, self._source, self.values)
+        result = comfy_http.post_json(self.base_url, "/prompt", {
+            "prompt": graph, "client_id": uuid.uuid4().hex})
+        if "prompt_id" not in result:
+            raise Exception("Warm-up not queued. Got: " + str(result)[:300])
+        comfy_http.HistoryPoller(self.base_url, result["prompt_id"],
+                                 deadline=self.timeout, initial=0.1,
+                                 max_interval=1.0,
+                                 should_stop=should_stop).poll()
+        took = time.time() - start
+        self.history.append(took)
+        return took
+
+    def measure(self, should_stop=None):
+        """(cold, warm) seconds: the first ping loads models, the second doesn't."""
+        cold = self.ping(should_stop)
+        warm = self.ping(should_stop)
+        return cold, warm
+
+
+class KeepAlive(object):
+    """Calls fn() every `interval` seconds on a daemon thread until stop()."""
+
+    def __init__(self, fn, interval):
+        self.fn       = fn
+        self.interval = interval
+        self._stop    = threading.Event()
+        self._thread  = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.fn()
+            except Exception:
+                pass            # server down or busy: try again next time
+
+    def stop(self):
+        self._stop.set()
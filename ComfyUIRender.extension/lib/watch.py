@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+watch.py
+Watch mode: re-render the view when it has changed, not on every frame.
+
+The render window calls ViewWatcher.tick() on a timer. Each tick grabs a
+cheap frame (GDI only, no PNG encode) and reduces it to a luma signature
+(image_ops.luma_signature). A new render is queued only when
+
+  - the view differs from the last rendered one by more than `threshold`
+    (mean luma difference, 0-1), and
+  - with `settle`, it hardly differs from the previous tick — the user has
+    stopped orbiting, so mid-motion frames are never sent.
+
+A newer view supersedes the job of the previous one: if that job hasn't
+finished it is cancelled, so ComfyUI only ever works on the latest view.
+
+Nothing here touches Revit or WPF; grab / sign / render are passed in, so
+the logic runs on synthetic frames too.
+
+IronPython 2.7 compatible.
+"""
+
+import image_ops
+
+DEFAULT_THRESHOLD = 0.04    # ~4% mean luma change: a small orbit or pan
+
+
+class ViewWatcher(object):
+    """
+    grab()         -> frame (e.g. a System.Drawing.Bitmap)
+    sign(frame)    -> signature (image_ops.luma_signature)
+    render(frame)  -> job for the new view (anything with cancel()), or None
+    release(frame) -> dispose of a frame that isn't rendered (optional)
+    """
+
+    def __init__(self, grab, sign, render, threshold=DEFAULT_THRESHOLD,
+                 settle=True, release=None):
+        self.grab      = grab
+        self.sign      = sign
+        self.render    = render
+        self.threshold = threshold
+        self.settle    = settle
+        self.release   = release
+        self.rendered  = None       # signature of the last rendered view
+        self.previous  = None       # signature of the last tick
+        self.job       = None       # job of the last rendered view
+        self.ticks     = 0
+        self.renders   = 0
+
+    def reset(self):
+        """Forget the last rendered view: the next settled frame renders."""
+        self.rendered = None
+
+    def changed(self, signature):
+        """True if signature should be rendered (see module docstring)."""
+        moved  = image_ops.signature_difference(signature, self.rendered) > self.threshold
+        steady = (not self.settle or
+                  image_ops.signature_difference(signature, self.previous) <= self.threshold)
+        return moved and steady
+
+    def tick(self):
+        """Grab and compare one frame. Returns the new job, or None."""
+        self.ticks += 1
+        frame     = self.grab()
+        signature = self.sign(frame)
+        render    = self.changed(signature)
+        self.previous = signature
+        if not render:
+            if self.release is not None:
+                self.release(frame)
+            return None
+
+        if self.job is not None:
+            self.job.cancel()       # newest view wins; no-op once finished
+        self.rendered = signature
+        self.job      = self.render(frame)
+        self.renders += 1
+        return self.job
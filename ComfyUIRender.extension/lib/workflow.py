@@ -1,8 +1,22 @@
 # -*- coding: utf-8 -*-
-"""workflow.py - Builds ComfyUI workflow JSON. Injects base64 image, prompt, seed."""
+"""
+workflow.py - Builds ComfyUI workflow JSON. Injects input image, prompt, seed.
 
+The built-in Flux2-Klein graph is used unless settings point workflow_path
+at an API-format JSON export ("Save (API)" in ComfyUI). Loaded graphs have
+their injection points found by class_type (detect_slots) and are cached by
+file mtime, so switching back and forth never re-parses a large file.
+"""
+
+import os
 import json
+import re
 import random
+import hashlib
+import threading
+
+import settings_manager
+import tracing
 
 _TEMPLATE = {
     "9": {"inputs": {"filename_prefix": "Flux2-Klein", "images": ["75:65", 0]}, "class_type": "SaveImage", "_meta": {"title": "Save Image"}},
@@ -29,11 +43,324 @@ _TEMPLATE = {
 }
 
 
-def build(base64_image, prompt, seed=None):
-    if seed is None or seed < 0:
-        seed = random.randint(0, 2147483647)
-    wf = json.loads(json.dumps(_TEMPLATE))
-    wf["132"]["inputs"]["base64_data"]  = base64_image
-    wf["75:74"]["inputs"]["text"]       = prompt
-    wf["75:73"]["inputs"]["noise_seed"] = seed
+OUTPUT_NODE = "9"
+
+# Node "132" is swapped for a stock LoadImage when the snapshot was uploaded
+_LOAD_IMAGE = {"inputs": {"image": "", "upload": "image"}, "class_type": "LoadImage", "_meta": {"title": "Load Image"}}
+
+# Injection points: slot name -> (node id, input name)
+SLOTS = {
+    "image":      ("132",   "image"),
+    "prompt":     ("75:74", "text"),
+    "seed":       ("75:73", "noise_seed"),
+    "steps":      ("75:62", "steps"),
+    "side":       ("141",   "side_length"),
+    "width":      ("143",   "width"),
+    "height":     ("143",   "height"),
+    "megapixels": ("75:80", "megapixels"),
+}
+
+_MARK    = "@@slot:{0}@@"
+_MARK_RE = re.compile(r'"@@slot:(\w+)@@"')
+
+
+class CompiledWorkflow(object):
+    """
+    A workflow graph serialized once, with its injection points recorded.
+
+    build(**values) returns a dict that shares every untouched node with the
+    template (only injected nodes are copied) — treat it as read-only.
+    chunks(**values) returns the JSON text as a list of byte strings, with
+    each value spliced between static segments. "Raw" slots (the base64
+    image) are inserted between quotes as-is, so a multi-megabyte payload
+    is never escaped, re-parsed or concatenated.
+    """
+
+    def __init__(self, graph, slots, raw=()):
+        self.graph    = graph
+        self.slots    = dict(slots)
+        self.raw      = set(raw)
+        self.defaults = {}
+
+        marked = json.loads(json.dumps(graph))      # compile time only
+        for name, (node_id, key) in self.slots.items():
+            self.defaults[name] = graph[node_id]["inputs"][key]
+            marked[node_id]["inputs"][key] = _MARK.format(name)
+
+        pieces         = _MARK_RE.split(json.dumps(marked))
+        self._segments = [p.encode("ascii") for p in pieces[0::2]]
+        self._order    = pieces[1::2]
+
+    def _value(self, values, name):
+        return values[name] if name in values else self.defaults[name]
+
+    def build(self, **values):
+        wf     = dict(self.graph)
+        copied = set()
+        for name, (node_id, key) in self.slots.items():
+            if name not in values:
+                continue
+            if node_id not in copied:
+                node       = dict(wf[node_id])
+                node["inputs"] = dict(node["inputs"])
+                wf[node_id] = node
+                copied.add(node_id)
+            wf[node_id]["inputs"][key] = values[name]
+        return wf
+
+    def chunks(self, **values):
+        out = [self._segments[0]]
+        for name, segment in zip(self._order, self._segments[1:]):
+            value = self._value(values, name)
+            if name in self.raw:
+                if not isinstance(value, bytes):
+                    value = value.encode("ascii")
+                out.extend((b'"', value, b'"'))
+            else:
+                out.append(json.dumps(value).encode("ascii"))
+            out.append(segment)
+        return out
+
+
+# ── Workflow registry ────────────────────────────────────────────────────────
+
+_LOAD_BASE64 = {"inputs": {"base64_data": "", "image_output": "Hide", "save_prefix": "ComfyUI"}, "class_type": "easy loadImageBase64", "_meta": {"title": "Load Image (Base64)"}}
+
+# Slot name -> (class_type, input) candidates, most specific first
+_ROLES = [
+    ("seed",       [("RandomNoise", "noise_seed"), ("KSampler", "seed"),
+                    ("KSamplerAdvanced", "noise_seed"), ("SamplerCustom", "noise_seed")]),
+    ("steps",      [("Flux2Scheduler", "steps"), ("BasicScheduler", "steps"),
+                    ("KSampler", "steps"), ("KSamplerAdvanced", "steps")]),
+    ("cfg",        [("CFGGuider", "cfg"), ("KSampler", "cfg"),
+                    ("KSamplerAdvanced", "cfg"), ("SamplerCustom", "cfg")]),
+    ("denoise",    [("KSampler", "denoise"), ("BasicScheduler", "denoise")]),
+    ("model",      [("CheckpointLoaderSimple", "ckpt_name")]),
+    ("side",       [("DF_Image_scale_to_side", "side_length")]),
+    ("width",      [("ImageCrop+", "width")]),
+    ("height",     [("ImageCrop+", "height")]),
+    ("megapixels", [("ImageScaleToTotalPixels", "megapixels")]),
+]
+
+_IMAGE_INPUTS = {"LoadImage": "image", "easy loadImageBase64": "base64_data"}
+_TEXT_ENCODE  = "CLIPTextEncode"
+_SAVE_NODES   = ("SaveImage",)
+
+# settings.json key -> slot; only applied to workflows loaded from disk
+SETTING_SLOTS = {
+    "steps":      "steps",
+    "cfg_scale":  "cfg",
+    "denoise":    "denoise",
+    "model_name": "model",
+}
+
+
+def _node_order(graph):
+    """Node ids in a stable order (numeric ids numerically)."""
+    def key(node_id):
+        head = node_id.split(":")[0]
+        return (0, int(head), node_id) if head.isdigit() else (1, 0, node_id)
+    return sorted(graph, key=key)
+
+
+def _is_link(value):
+    return isinstance(value, list) and len(value) == 2
+
+
+def _positive_prompt(graph, order):
+    """The CLIPTextEncode feeding a "positive" input, followed through links."""
+    encoders = [n for n in order if graph[n].get("class_type") == _TEXT_ENCODE
+                and not _is_link(graph[n]["inputs"].get("text"))]
+    if not encoders:
+        return None
+    for node_id in order:
+        link = graph[node_id].get("inputs", {}).get("positive")
+        seen = set()
+        todo = [link[0]] if _is_link(link) else []
+        while todo:
+            up = todo.pop(0)
+            if up in seen or up not in graph:
+                continue
+            seen.add(up)
+            if up in encoders:
+                return up
+            todo.extend(v[0] for v in graph[up].get("inputs", {}).values() if _is_link(v))
+    for node_id in encoders:
+        if "positive" in graph[node_id].get("_meta", {}).get("title", "").lower():
+            return node_id
+    return encoders[0]
+
+
+def detect_slots(graph):
+    """
+    Find the injection points of an API-format graph by class_type.
+    Returns (slots, output_node). Raises if there is no image input,
+    prompt or SaveImage node to work with.
+    """
+    order = _node_order(graph)
+    slots = {}
+    for node_id in order:
+        ctype = graph[node_id].get("class_type")
+        if ctype in _IMAGE_INPUTS and "image" not in slots:
+            slots["image"] = (node_id, _IMAGE_INPUTS[ctype])
+    prompt = _positive_prompt(graph, order)
+    if prompt is not None:
+        slots["prompt"] = (prompt, "text")
+    for name, candidates in _ROLES:
+        for ctype, key in candidates:
+            found = [n for n in order if graph[n].get("class_type") == ctype
+                     and key in graph[n].get("inputs", {})
+                     and not _is_link(graph[n]["inputs"][key])]
+            if found:
+                slots[name] = (found[0], key)
+                break
+    outputs = [n for n in order if graph[n].get("class_type") in _SAVE_NODES]
+
+    missing = [r for r in ("image", "prompt", "seed") if r not in slots]
+    if not outputs:
+        missing.append("output (SaveImage)")
+    if missing:
+        raise Exception("Workflow has no node for: " + ", ".join(missing))
+    return slots, outputs[0]
+
+
+_templates = {}         # path -> (mtime, graph, slots, output_node)
+_compiled  = {}         # (path, mtime, image_source) -> CompiledWorkflow
+_lock      = threading.Lock()
+
+def load_template(path):
+    """
+    Parsed graph for an API-format workflow file: (graph, slots, output_node).
+    Re-parsed only when the file's mtime changes.
+    """
+    mtime = os.path.getmtime(path)
+    with _lock:
+        entry = _templates.get(path)
+        if entry is not None and entry[0] == mtime:
+            return entry[1:]
+    with open(path, "r") as f:
+        graph = json.load(f)
+    if not isinstance(graph, dict) or "nodes" in graph:
+        raise Exception("{0} is not an API-format workflow. In ComfyUI use "
+                        "Workflow > Export (API).".format(os.path.basename(path)))
+    slots, output = detect_slots(graph)
+    with _lock:
+        _templates[path] = (mtime, graph, slots, output)
+    return graph, slots, output
+
+
+def compiled(image_source="upload", template=None):
+    """
+    CompiledWorkflow for template (a workflow_path; None / "" = built-in),
+    compiled on first use and again only when the file changes.
+    """
+    if not template:
+        key = ("", 0, image_source)
+    else:
+        key = (template, os.path.getmtime(template), image_source)
+    with _lock:
+        if key in _compiled:
+            return _compiled[key]
+
+    if not template:
+        graph, slots = dict(_TEMPLATE), dict(SLOTS)
+    else:
+        graph, slots, _ = load_template(template)
+        graph, slots = dict(graph), dict(slots)
+    node_id, _ = slots["image"]
+    raw = ()
+    if image_source == "upload":
+        graph[node_id] = _with_image_node(graph[node_id], _LOAD_IMAGE)
+        slots["image"] = (node_id, "image")
+    else:
+        graph[node_id] = _with_image_node(graph[node_id], _LOAD_BASE64)
+        slots["image"] = (node_id, "base64_data")
+        raw = ("image",)
+    wf = CompiledWorkflow(graph, slots, raw)
+    with _lock:
+        for old in [k for k in _compiled if k[0] == key[0] and k[1] != key[1]]:
+            del _compiled[old]          # superseded by an edit of the file
+        _compiled[key] = wf
     return wf
+
+
+def required_nodes(image_source="upload", template=None):
+    """class_types a server must have installed to run the workflow."""
+    graph = compiled(image_source, template).graph
+    return set(node["class_type"] for node in graph.values())
+
+
+def output_node(template=None):
+    """Id of the SaveImage node of template (None = built-in)."""
+    if not template:
+        return OUTPUT_NODE
+    return load_template(template)[2]
+
+
+def _with_image_node(node, replacement):
+    """node itself if it already is that loader type, else the replacement."""
+    if node.get("class_type") == replacement["class_type"]:
+        return node
+    return replacement
+
+
+def settings_values(settings):
+    """
+    Slot values from settings.json (steps, cfg_scale, denoise, model_name)
+    for a workflow loaded from workflow_path. Only values the user changed
+    apply: empty ones, and the DEFAULTS that settings_manager.load() fills
+    in, keep the workflow's own value. The built-in graph ignores these.
+    """
+    if not settings.get("workflow_path"):
+        return {}
+    values = {}
+    for key, slot in SETTING_SLOTS.items():
+        value = settings.get(key)
+        if value not in (None, "") and value != settings_manager.DEFAULTS.get(key):
+            values[slot] = value
+    return values
+
+
+def _seed(seed):
+    if seed is None or seed < 0:
+        return random.randint(0, 2147483647)
+    return seed
+
+
+def build(image, prompt, seed=None, image_source="upload", template=None, **overrides):
+    """
+    image_source="upload": image is a server filename from comfy_http.upload_image.
+    image_source="base64": image is base64 PNG data (needs comfyui-easy-use).
+    template is a workflow_path (None = built-in).
+    overrides sets other slots, e.g. profiles.workflow_values(); slots the
+    workflow doesn't have are ignored.
+    """
+    return compiled(image_source, template).build(
+        image=image, prompt=prompt, seed=_seed(seed), **overrides)
+
+
+def prompt_body(image, prompt, seed, client_id, image_source="upload", template=None,
+                **overrides):
+    """
+    Full /prompt request body as a list of byte chunks, ready for
+    comfy_http.post_json. Nothing is copied or re-serialized per call
+    except the small injected values.
+    """
+    with tracing.span("build"):
+        head = '{{"client_id": {0}, "prompt": '.format(json.dumps(client_id))
+        return ([head.encode("ascii")]
+                + compiled(image_source, template).chunks(
+                    image=image, prompt=prompt, seed=_seed(seed), **overrides)
+                + [b"}"])
+
+
+def fingerprint(image_digest, prompt, seed, template=None, **overrides):
+    """
+    Hash of the final graph with the snapshot's content hash in the image
+    slot — identical for identical renders, whatever the upload name.
+    """
+    with tracing.span("fingerprint"):
+        graph = compiled("upload", template).build(image=image_digest, prompt=prompt,
+                                                   seed=seed, **overrides)
+        text  = json.dumps(graph, sort_keys=True)
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
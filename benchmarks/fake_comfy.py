@@ -0,0 +1,415 @@
+# -*- coding: utf-8 -*-
+"""
+fake_comfy.py
+A local stand-in for a ComfyUI server, for benchmarks without a GPU.
+
+Implements the endpoints the extension uses — /prompt, /history,
+/history/<id>, /view, /queue (GET and POST delete), /interrupt,
+/system_stats, /object_info and /upload/image — over HTTP/1.1 keep-alive.
+/ws answers 404, so clients fall back to polling, unless websocket=True:
+then it streams execution_start, progress, executed and execution_success
+(or execution_interrupted) for the prompts posted with that clientId.
+fail_next makes that many of the next prompts end in an execution_error.
+preview_bytes adds a binary preview frame when a prompt starts, sent in
+two halves `preview_split` seconds apart to test partial-frame reads.
+
+Prompts run one at a time like on a single GPU: each starts when the
+previous one ends, pays `load_delay` when the models are cold, and
+finishes `exec_time` later with one output image of `image_bytes`.
+`latency` is added to every request and `transfer_rate` (bytes/s) limits
+uploads and /view downloads, to simulate the network.
+
+    server = FakeComfy(exec_time=0.2, image_bytes=2 << 20).start()
+    ... server.url ...
+    server.counts      # {"POST /prompt": 10, "GET /history": 31, ...}
+    server.stop()
+
+CPython 3 only (a development tool, not loaded by pyRevit).
+"""
+
+import base64
+import hashlib
+import json
+import os
+import re
+import select
+import struct
+import sys
+import threading
+import time
+import uuid
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LIB_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                       "..", "ComfyUIRender.extension", "lib")
+if LIB_DIR not in sys.path:
+    sys.path.insert(0, LIB_DIR)
+
+import workflow     # noqa: E402  (node list for /object_info)
+
+
+def make_png(size):
+    """A structurally valid PNG of roughly `size` bytes (random IDAT)."""
+    def chunk(tag, data):
+        return (struct.pack(">I", len(data)) + tag + data
+                + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF))
+    header = struct.pack(">IIBBBBB", 1, 1, 8, 2, 0, 0, 0)
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header)
+            + chunk(b"IDAT", os.urandom(max(0, size - 57)))
+            + chunk(b"IEND", b""))
+
+
+class _Server(ThreadingHTTPServer):
+
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients hanging up mid-request (e.g. the /ws probe) are expected
+        if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            ThreadingHTTPServer.handle_error(self, request, client_address)
+
+
+_WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+def ws_frame(opcode, payload):
+    """An unmasked (server to client) websocket frame."""
+    n    = len(payload)
+    head = bytes([0x80 | opcode])
+    if n < 126:
+        head += bytes([n])
+    elif n < 65536:
+        head += bytes([126]) + struct.pack(">H", n)
+    else:
+        head += bytes([127]) + struct.pack(">Q", n)
+    return head + payload
+
+
+def _end_message(job):
+    """(type, data) of the message a failed or interrupted prompt ends with."""
+    if job.interrupted:
+        return "execution_interrupted", {"prompt_id": job.prompt_id, "node_id": "9"}
+    return "execution_error", {"prompt_id": job.prompt_id, "node_id": "9",
+                               "node_type": "SaveImage",
+                               "exception_message": "Simulated failure"}
+
+
+class _Job(object):
+
+    def __init__(self, prompt_id, number, start, end, client_id=None):
+        self.prompt_id   = prompt_id
+        self.client_id   = client_id
+        self.number      = number
+        self.start       = start
+        self.end         = end
+        self.interrupted = False
+        self.failed      = False
+
+
+class FakeComfy(object):
+
+    def __init__(self, latency=0.0, exec_time=0.5, load_delay=0.0,
+                 image_bytes=1024 * 1024, unload_after=None, transfer_rate=None,
+                 websocket=False, preview_bytes=0, preview_split=0.0,
+                 host="127.0.0.1"):
+        self.latency       = latency
+        self.transfer_rate = transfer_rate   # bytes/s, None = unlimited
+        self.exec_time     = exec_time
+        self.load_delay    = load_delay
+        self.image_bytes   = image_bytes
+        self.unload_after  = unload_after    # idle seconds before models unload
+        self.websocket     = websocket
+        self.preview_bytes = preview_bytes
+        self.preview_split = preview_split   # seconds between the preview's halves
+        self.fail_next     = 0               # next N prompts fail with an error
+        self.host          = host
+        self.counts        = {}
+        self.uploads       = {}
+        self.prompts       = []              # graphs received, in order
+        self._jobs         = {}
+        self._order        = []
+        self._gpu_free     = 0.0
+        self._loaded       = False
+        self._number       = 0
+        self._png          = make_png(image_bytes)
+        self._lock         = threading.Lock()
+        self._server       = None
+
+    # ── Lifecycle ─────────────────────────────────────────────────────────
+
+    def start(self):
+        handler = type("Handler", (_Handler,), {"fake": self})
+        self._server = _Server((self.host, 0), handler)
+        t = threading.Thread(target=self._server.serve_forever)
+        t.daemon = True
+        t.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    @property
+    def url(self):
+        return "http://{0}:{1}".format(self.host, self._server.server_address[1])
+
+    def reset_counts(self):
+        with self._lock:
+            self.counts = {}
+
+    def set_image_bytes(self, size):
+        self.image_bytes = size
+        self._png = make_png(size)
+
+    # ── Simulated execution ───────────────────────────────────────────────
+
+    def submit(self, graph, client_id=None):
+        now = time.time()
+        with self._lock:
+            self.prompts.append(graph)
+            self._number += 1
+            pid   = str(uuid.uuid4())
+            start = max(now, self._gpu_free)
+            idle  = start - self._gpu_free
+            if self.unload_after is not None and self._loaded and idle > self.unload_after:
+                self._loaded = False
+            if not self._loaded:
+                start += self.load_delay
+                self._loaded = True
+            job = _Job(pid, self._number, start, start + self.exec_time, client_id)
+            if self.fail_next:
+                self.fail_next -= 1
+                job.failed = True
+            self._gpu_free = job.end
+            self._jobs[pid] = job
+            self._order.append(pid)
+            return pid, self._number
+
+    def queue(self):
+        now = time.time()
+        running, pending = [], []
+        with self._lock:
+            for pid in self._order:
+                job = self._jobs[pid]
+                if job.end <= now:
+                    continue
+                item = [job.number, pid, {}, {}, ["9"]]
+                (running if job.start <= now else pending).append(item)
+        return {"queue_running": running, "queue_pending": pending}
+
+    def delete(self, prompt_ids):
+        now = time.time()
+        with self._lock:
+            for pid in prompt_ids:
+                job = self._jobs.get(pid)
+                if job is not None and job.start > now:
+                    del self._jobs[pid]
+                    self._order.remove(pid)
+
+    def interrupt(self, prompt_id=None):
+        """Stop the running prompt (only if it is prompt_id, when given)."""
+        now = time.time()
+        with self._lock:
+            for pid in self._order:
+                job = self._jobs[pid]
+                if prompt_id and pid != prompt_id:
+                    continue
+                if job.start <= now < job.end:
+                    job.end, job.interrupted = now, True
+                    self._gpu_free = now
+
+    def ws_events(self, client_id, sent):
+        """
+        Messages now due for client_id's prompts, as (kind, payload) with
+        kind "text" (a dict) or "preview" (bytes). sent maps prompt_id to
+        the last phase reported (1 started, 2 finished) and is updated.
+        """
+        now = time.time()
+        out = []
+        with self._lock:
+            for pid in self._order:
+                job   = self._jobs[pid]
+                phase = sent.get(pid, 0)
+                if job.client_id != client_id or phase == 2:
+                    continue
+                if phase == 0 and job.start <= now:
+                    out.append(("text", {"type": "execution_start",
+                                         "data": {"prompt_id": pid}}))
+                    if self.preview_bytes:
+                        # ComfyUI's preview header: event type 1, format 2 (PNG)
+                        out.append(("preview", struct.pack(">II", 1, 2)
+                                    + os.urandom(self.preview_bytes)))
+                    out.append(("text", {"type": "progress",
+                                         "data": {"prompt_id": pid, "value": 1, "max": 1}}))
+                    phase = 1
+                if phase == 1 and job.end <= now:
+                    if job.interrupted or job.failed:
+                        out.append(("text", {"type": _end_message(job)[0],
+                                             "data": _end_message(job)[1]}))
+                    else:
+                        image = {"filename": pid[:8] + ".png", "subfolder": "", "type": "output"}
+                        out.append(("text", {"type": "executed", "data": {
+                            "prompt_id": pid, "node": "9", "output": {"images": [image]}}}))
+                        out.append(("text", {"type": "execution_success",
+                                             "data": {"prompt_id": pid}}))
+                    phase = 2
+                sent[pid] = phase
+        return out
+
+    def history(self, prompt_id=None):
+        now = time.time()
+        out = {}
+        with self._lock:
+            ids = [prompt_id] if prompt_id else list(self._order)
+            for pid in ids:
+                job = self._jobs.get(pid)
+                if job is None or job.end > now:
+                    continue
+                ok     = not (job.interrupted or job.failed)
+                images = [{"filename": pid[:8] + ".png", "subfolder": "",
+                           "type": "output"}] if ok else []
+                status = {"status_str": "success" if ok else "error", "completed": ok,
+                          "messages": [["execution_start", {"prompt_id": pid}]]}
+                if not ok:
+                    status["messages"].append(list(_end_message(job)))
+                out[pid] = {
+                    "outputs": {"9": {"images": images}} if images else {},
+                    "status":  status,
+                }
+        return out
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    protocol_version        = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    fake                    = None
+
+    def log_message(self, *args):
+        pass
+
+    def _count(self, method):
+        key = "{0} {1}".format(method, self.path.split("?")[0].rstrip("/"))
+        key = re.sub(r"/history/.*", "/history", key)
+        with self.fake._lock:
+            self.fake.counts[key] = self.fake.counts.get(key, 0) + 1
+        if self.fake.latency:
+            time.sleep(self.fake.latency)
+
+    def _json(self, obj, status=200):
+        body = json.dumps(obj).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _transfer(self, size):
+        if self.fake.transfer_rate:
+            time.sleep(size / float(self.fake.transfer_rate))
+
+    def _body(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        self._transfer(len(body))
+        return body
+
+    def _websocket(self):
+        """Upgrade to a websocket and push this client's events until it hangs up."""
+        query  = self.path.partition("?")[2]
+        client = dict(p.partition("=")[::2] for p in query.split("&")).get("clientId")
+        accept = base64.b64encode(hashlib.sha1(
+            (self.headers.get("Sec-WebSocket-Key", "") + _WS_GUID).encode("ascii")).digest())
+        self.send_response(101, "Switching Protocols")
+        self.send_header("Upgrade", "websocket")
+        self.send_header("Connection", "Upgrade")
+        self.send_header("Sec-WebSocket-Accept", accept.decode("ascii"))
+        self.end_headers()
+        self.wfile.flush()
+        self.close_connection = True
+        sent = {}
+        while True:
+            # The client only ever sends a close frame (or hangs up)
+            if select.select([self.connection], [], [], 0.01)[0]:
+                return
+            for kind, payload in self.fake.ws_events(client, sent):
+                if kind == "text":
+                    self.wfile.write(ws_frame(0x1, json.dumps(payload).encode("utf-8")))
+                    continue
+                frame = ws_frame(0x2, payload)
+                if self.fake.preview_split:
+                    half = len(frame) // 2
+                    self.wfile.write(frame[:half])
+                    self.wfile.flush()
+                    time.sleep(self.fake.preview_split)
+                    frame = frame[half:]
+                self.wfile.write(frame)
+            self.wfile.flush()
+
+    def do_GET(self):
+        self._count("GET")
+        path = self.path.split("?")[0]
+        fake = self.fake
+        if path == "/ws" and fake.websocket:
+            return self._websocket()
+        if path.startswith("/history/"):
+            return self._json(fake.history(path[len("/history/"):]))
+        if path == "/history":
+            return self._json(fake.history())
+        if path == "/queue":
+            return self._json(fake.queue())
+        if path == "/system_stats":
+            return self._json({"system": {"comfyui_version": "fake"},
+                               "devices": [{"name": "cuda:0 Fake GPU",
+                                            "vram_total": 8 << 30, "vram_free": 6 << 30}]})
+        if path == "/object_info":
+            nodes = set(["PreviewImage"])
+            for source in ("upload", "base64"):
+                nodes |= workflow.required_nodes(source)
+            return self._json(dict((n, {}) for n in nodes))
+        if path == "/view":
+            png = fake._png
+            self.send_response(200)
+            self.send_header("Content-Type", "image/png")
+            self.send_header("Content-Length", str(len(png)))
+            self.end_headers()
+            view = memoryview(png)
+            for i in range(0, len(png), 1 << 20):
+                chunk = view[i:i + (1 << 20)]
+                self._transfer(len(chunk))
+                self.wfile.write(chunk)
+            return
+        self._json({"error": "not found"}, 404)
+
+    def do_POST(self):
+        self._count("POST")
+        path = self.path.split("?")[0]
+        body = self._body()
+        fake = self.fake
+        if path == "/prompt":
+            data = json.loads(body.decode("utf-8"))
+            pid, number = fake.submit(data.get("prompt") or {}, data.get("client_id"))
+            return self._json({"prompt_id": pid, "number": number, "node_errors": {}})
+        if path == "/upload/image":
+            m    = re.search(br'filename="([^"]+)"', body)
+            name = m.group(1).decode("utf-8") if m else "upload.png"
+            fake.uploads[name] = len(body)
+            return self._json({"name": name, "subfolder": "revit", "type": "input"})
+        if path == "/queue":
+            fake.delete(json.loads(body.decode("utf-8") or "{}").get("delete", []))
+            return self._json({})
+        if path == "/interrupt":
+            fake.interrupt(json.loads(body.decode("utf-8") or "{}").get("prompt_id"))
+            return self._json({})
+        self._json({"error": "not found"}, 404)
+
+
+if __name__ == "__main__":
+    server = FakeComfy().start()
+    print("Fake ComfyUI on " + server.url + " (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
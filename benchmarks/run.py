@@ -0,0 +1,474 @@
+# -*- coding: utf-8 -*-
+"""
+run.py
+Offline benchmarks of the extension's client side against fake_comfy.
+
+    python benchmarks/run.py                    # all suites
+    python benchmarks/run.py render download    # some suites
+    python benchmarks/run.py --quick            # smaller sizes / counts
+    python benchmarks/run.py --compare benchmarks/results/<older>.json
+
+Suites:
+  http      keep-alive ComfyClient vs. one urlopen per request (req/s)
+  build     /prompt body: compiled chunks vs. deep copy + dumps, 1366x768
+            and 4K base64 snapshots (ms, peak memory)
+  download  streaming /view download of a large image (MB/s, peak memory)
+  snapshot  crop (image_ops.center_crop_box) + PNG encode of a synthetic
+            frame in one pass vs. the old encode -> decode -> crop ->
+            encode round trip (ms); resizing is System.Drawing's, in Revit
+  render    end-to-end renders through render_engine.RenderSession
+            (renders/s, latency p50/p95, HTTP requests per render, p50 per
+            traced stage)
+  pipeline  images/min of a bandwidth-bound batch: one worker, the worker
+            pool, and the pipelined stages (RenderSession(pipelined=True))
+  farm      renders spread over three fake servers of different speeds
+            (images/min vs. the fastest server alone, jobs per server,
+            results fetched from the server that ran them, pool report)
+  websocket renders followed over /ws vs. /history polling, and over /ws
+            with a large preview frame arriving in two parts (latency p50,
+            requests per render, jobs that fell back to polling)
+  warmup    cold vs. warm warm-up ping against simulated model loading
+
+Every run is saved as JSON under benchmarks/results/ (or --save DIR), so a
+later run can be compared with --compare.
+
+CPython 3 only (a development tool, not loaded by pyRevit).
+"""
+
+import argparse
+import base64
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+from fake_comfy import FakeComfy, make_png     # noqa: E402  (also puts lib/ on sys.path)
+
+import comfy_http           # noqa: E402
+import image_ops            # noqa: E402
+import render_engine        # noqa: E402
+import server_pool          # noqa: E402
+import settings_manager     # noqa: E402
+import tracing              # noqa: E402
+import warmup               # noqa: E402
+import workflow             # noqa: E402
+
+RESULTS_DIR = os.path.join(HERE, "results")
+
+
+# ── Helpers ───────────────────────────────────────────────────────────────────
+
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    k = max(0, min(len(values) - 1, int(round(p / 100.0 * len(values))) - 1))
+    return values[k]
+
+
+def timed(fn, repeat):
+    """(best seconds per call, peak traced bytes of one call)."""
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        took = time.perf_counter() - start
+        best = took if best is None else min(best, took)
+    return best, peak
+
+
+def mb(n):
+    return round(n / 1048576.0, 2)
+
+
+# ── Suites ────────────────────────────────────────────────────────────────────
+
+def bench_http(quick):
+    """Keep-alive pool vs. a new connection per request."""
+    from urllib.request import urlopen
+    n      = 300 if quick else 2000
+    server = FakeComfy().start()
+    try:
+        client = comfy_http.ComfyClient(server.url)
+        start  = time.perf_counter()
+        for _ in range(n):
+            client.get_json("/system_stats")
+        pooled = n / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for _ in range(n):
+            with urlopen(server.url + "/system_stats") as resp:
+                json.loads(resp.read().decode("utf-8"))
+        fresh = n / (time.perf_counter() - start)
+        client.close()
+    finally:
+        server.stop()
+    return {"keepalive_rps": round(pooled), "urlopen_rps": round(fresh),
+            "speedup": round(pooled / fresh, 2)}
+
+
+def bench_build(quick):
+    """/prompt body construction with a base64 snapshot."""
+    sizes  = [("1366x768", 2 << 20), ("4k", 12 << 20)]     # typical PNG sizes
+    repeat = 3 if quick else 10
+    out    = {}
+    for label, png_size in sizes:
+        b64 = base64.b64encode(os.urandom(png_size)).decode("ascii")
+
+        def old():
+            wf = json.loads(json.dumps(workflow._TEMPLATE))
+            wf["132"]["inputs"]["base64_data"] = b64
+            wf["75:74"]["inputs"]["text"] = "prompt"
+            wf["75:73"]["inputs"]["noise_seed"] = 1
+            return json.dumps({"prompt": wf, "client_id": "c"}).encode("utf-8")
+
+        def new():
+            return workflow.prompt_body(b64, "prompt", 1, "c", image_source="base64")
+
+        workflow.compiled("base64")     # compile once, outside the timing
+        t_old, m_old = timed(old, repeat)
+        t_new, m_new = timed(new, repeat)
+        out[label] = {"old_ms": round(t_old * 1000, 2), "old_peak_mb": mb(m_old),
+                      "new_ms": round(t_new * 1000, 2), "new_peak_mb": mb(m_new)}
+    return out
+
+
+def bench_download(quick):
+    """Streaming /view download into a file."""
+    size   = (8 if quick else 64) << 20
+    server = FakeComfy(image_bytes=size).start()
+    folder = tempfile.mkdtemp()
+    try:
+        dest  = os.path.join(folder, "result.png")
+        image = {"filename": "x.png", "subfolder": "", "type": "output"}
+        comfy_http.download_image(server.url, image, dest)        # warm the pool
+        tracemalloc.start()
+        start = time.perf_counter()
+        comfy_http.download_image(server.url, image, dest)
+        took  = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    finally:
+        server.stop()
+        shutil.rmtree(folder, ignore_errors=True)
+    return {"image_mb": mb(size), "seconds": round(took, 3),
+            "mb_per_s": round(mb(size) / took, 1), "peak_mb": mb(peak)}
+
+
+def _decode_plain_png(png, width, height, channels):
+    """Inverse of image_ops.encode_png (filter type 0 rows only)."""
+    pos, idat = 8, b""
+    while pos < len(png):
+        length = int.from_bytes(png[pos:pos + 4], "big")
+        tag    = png[pos + 4:pos + 8]
+        if tag == b"IDAT":
+            idat += png[pos + 8:pos + 8 + length]
+        pos += 12 + length
+    raw    = image_ops.zlib.decompress(idat)
+    stride = width * channels
+    out    = bytearray()
+    for y in range(height):
+        out.extend(raw[y * (stride + 1) + 1:(y + 1) * (stride + 1)])
+    return out
+
+
+def _crop(pixels, width, channels, box):
+    """Rows of box (x, y, w, h) out of a packed frame."""
+    x, y, w, h = box
+    stride = width * channels
+    out    = bytearray()
+    for row in range(y, y + h):
+        start = row * stride + x * channels
+        out.extend(pixels[start:start + w * channels])
+    return out
+
+
+def bench_snapshot(quick):
+    """One crop + encode pass vs. encode -> decode -> crop -> encode."""
+    src_w, src_h = (640, 400) if quick else (1280, 800)     # 16:10 viewport
+    box   = image_ops.center_crop_box(src_w, src_h, 16, 9)  # 16:9 frame
+    frame = bytearray(random.getrandbits(8) for _ in range(src_w * src_h * 3))
+
+    def old():
+        png    = image_ops.encode_png(frame, src_w, src_h)       # save full frame
+        pixels = _decode_plain_png(png, src_w, src_h, 3)         # reopen
+        small  = _crop(pixels, src_w, 3, box)
+        return image_ops.encode_png(small, box[2], box[3])       # save again
+
+    def new():
+        return image_ops.encode_png(_crop(frame, src_w, 3, box), box[2], box[3])
+
+    repeat = 3 if quick else 5
+    t_old, m_old = timed(old, repeat)
+    t_new, m_new = timed(new, repeat)
+    return {"frame": "{0}x{1} -> {2}x{3}".format(src_w, src_h, box[2], box[3]),
+            "old_ms": round(t_old * 1000, 1), "old_peak_mb": mb(m_old),
+            "new_ms": round(t_new * 1000, 1), "new_peak_mb": mb(m_new)}
+
+
+def bench_render(quick):
+    """End-to-end renders through render_engine.RenderSession."""
+    n, workers = (12, 2) if quick else (40, 3)
+    server = FakeComfy(latency=0.001, exec_time=0.05, image_bytes=2 << 20).start()
+    folder = tempfile.mkdtemp()
+    snap   = os.path.join(folder, "snapshot.png")
+    with open(snap, "wb") as f:
+        f.write(make_png(1 << 20))
+    # Keep the benchmark's traces out of the user's traces.jsonl
+    traces = os.path.join(folder, "traces.jsonl")
+    tracing.log_path = lambda: traces
+    settings = dict(settings_manager.DEFAULTS, comfy_url=server.url, servers=[])
+    session  = render_engine.RenderSession(settings, workers=workers,
+                                           result_dir=folder, cache=False)
+    try:
+        tracemalloc.start()
+        start = time.perf_counter()
+        jobs  = [session.submit(snap, "bench", seed=i) for i in range(n)]
+        for job in jobs:
+            job.result(timeout=60)
+        wall    = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        counts  = dict(server.counts)
+        stages  = tracing.summary(tracing.load([traces]))
+    finally:
+        session.shutdown()
+        server.stop()
+        shutil.rmtree(folder, ignore_errors=True)
+    lat      = [job.finished - job.created for job in jobs]
+    requests = sum(counts.values())
+    gpu      = n * server.exec_time
+    return {"renders": n, "workers": workers,
+            "renders_per_s": round(n / wall, 2),
+            "client_overhead": round(max(0.0, wall - gpu) / n, 4),
+            "latency_p50": round(percentile(lat, 50), 3),
+            "latency_p95": round(percentile(lat, 95), 3),
+            "requests_per_render": round(requests / float(n), 2),
+            "requests": counts, "peak_mb": mb(peak),
+            "stage_p50": dict((stage, round(st["p50"], 4))
+                              for (kind, stage), st in stages.items() if kind == "render")}
+
+
+def bench_pipeline(quick):
+    """Images/min of a batch: one worker vs. the worker pool vs. pipelined stages."""
+    n, exec_time = (8, 0.15) if quick else (24, 0.3)
+    # ~64 MB/s link: a 3 MB snapshot up and an 8 MB result down cost about
+    # as much as the GPU time, so idle GPU gaps show in the throughput
+    server = FakeComfy(latency=0.002, exec_time=exec_time, image_bytes=8 << 20,
+                       transfer_rate=64 << 20).start()
+    folder = tempfile.mkdtemp()
+    tracing.log_path = lambda: os.path.join(folder, "traces.jsonl")
+    settings = dict(settings_manager.DEFAULTS, comfy_url=server.url, servers=[])
+    modes = [("serial",    {"workers": 1}),
+             ("pool",      {}),
+             ("pipelined", {"pipelined": True})]
+    out = {"renders": n, "exec_time": exec_time}
+    try:
+        for name, kwargs in modes:
+            snaps = []
+            for i in range(n):      # distinct snapshots: every job uploads
+                path = os.path.join(folder, "{0}_{1}.png".format(name, i))
+                with open(path, "wb") as f:
+                    f.write(make_png(3 << 20))
+                snaps.append(path)
+            session = render_engine.RenderSession(settings, result_dir=folder,
+                                                  cache=False, **kwargs)
+            start = time.perf_counter()
+            jobs  = [session.submit(p, "bench", seed=i) for i, p in enumerate(snaps)]
+            for job in jobs:
+                job.result(timeout=120)
+            wall = time.perf_counter() - start
+            session.shutdown()
+            out[name] = {"images_per_min": round(60.0 * n / wall, 1),
+                         "gpu_busy": round(n * exec_time / wall, 2)}
+    finally:
+        server.stop()
+        shutil.rmtree(folder, ignore_errors=True)
+    return out
+
+
+def bench_farm(quick):
+    """Least-loaded scheduling over several servers of different speeds."""
+    n     = 18 if quick else 45
+    speed = [0.05, 0.1, 0.2]                # exec_time per server
+    servers = [FakeComfy(latency=0.001, exec_time=t, image_bytes=256 << 10).start()
+               for t in speed]
+    folder = tempfile.mkdtemp()
+    tracing.log_path = lambda: os.path.join(folder, "traces.jsonl")
+    snap = os.path.join(folder, "snapshot.png")
+    with open(snap, "wb") as f:
+        f.write(make_png(64 << 10))
+    urls = [s.url for s in servers]
+    out  = {"renders": n, "exec_time": speed}
+    try:
+        for name, used in (("fastest_alone", urls[:1]), ("farm", urls)):
+            for s in servers:
+                s.reset_counts()
+            settings = dict(settings_manager.DEFAULTS, comfy_url=used[0],
+                            servers=used[1:])
+            # Enough jobs in flight to keep every server's queue fed
+            session = render_engine.RenderSession(settings, workers=2 * len(used),
+                                                  result_dir=folder, cache=False)
+            try:
+                start = time.perf_counter()
+                jobs  = [session.submit(snap, "bench", seed=i) for i in range(n)]
+                for job in jobs:
+                    job.result(timeout=120)
+                wall = time.perf_counter() - start
+            finally:
+                session.shutdown()
+            out[name] = {"images_per_min": round(60.0 * n / wall, 1)}
+        ran = dict((u, sum(1 for j in jobs if j.base_url == u)) for u in urls)
+        out["farm"].update({
+            "jobs_per_server": [ran[u] for u in urls],
+            "fetched_elsewhere": sum(abs(s.counts.get("POST /prompt", 0)
+                                         - s.counts.get("GET /view", 0)) for s in servers),
+            "report": server_pool.get_pool(settings).report().split("\n"),
+        })
+    finally:
+        for s in servers:
+            s.stop()
+        shutil.rmtree(folder, ignore_errors=True)
+    return out
+
+
+def bench_websocket(quick):
+    """Renders followed over /ws vs. polling, incl. a preview split across recv timeouts."""
+    n     = 4 if quick else 10
+    modes = [("polling",   {}),
+             ("websocket", {"websocket": True}),
+             # 200 KB preview in two halves 1.5 s apart: longer than the
+             # client's 1 s recv timeout, so the frame is read in pieces
+             ("split_preview", {"websocket": True, "preview_bytes": 200 << 10,
+                                "preview_split": 1.5})]
+    folder = tempfile.mkdtemp()
+    tracing.log_path = lambda: os.path.join(folder, "traces.jsonl")
+    snap = os.path.join(folder, "snapshot.png")
+    with open(snap, "wb") as f:
+        f.write(make_png(64 << 10))
+    out = {"renders": n}
+    try:
+        for name, kwargs in modes:
+            server   = FakeComfy(latency=0.001, exec_time=0.1, image_bytes=256 << 10,
+                                 **kwargs).start()
+            settings = dict(settings_manager.DEFAULTS, comfy_url=server.url, servers=[],
+                            render_timeout=60)
+            session  = render_engine.RenderSession(settings, workers=2, result_dir=folder,
+                                                   cache=False)
+            try:
+                jobs = [session.submit(snap, "bench", seed=i) for i in range(n)]
+                for job in jobs:
+                    job.result(timeout=120)
+            finally:
+                session.shutdown()
+                server.stop()
+            lat = [job.finished - job.created for job in jobs]
+            out[name] = {"latency_p50": round(percentile(lat, 50), 3),
+                         "requests_per_render": round(sum(server.counts.values()) / float(n), 2),
+                         "polled": sum(1 for job in jobs if "poll_summary" in job.options)}
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+    return out
+
+
+def bench_warmup(quick):
+    """Cold vs. warm warm-up pings with a simulated model load."""
+    load   = 0.5 if quick else 2.0
+    server = FakeComfy(load_delay=load, exec_time=0.05).start()
+    try:
+        cold, warm = warmup.Warmer(server.url).measure()
+    finally:
+        server.stop()
+    return {"load_delay": load, "cold_s": round(cold, 3), "warm_s": round(warm, 3)}
+
+
+SUITES = [
+    ("http",       bench_http),
+    ("build",      bench_build),
+    ("download",   bench_download),
+    ("snapshot",   bench_snapshot),
+    ("render",     bench_render),
+    ("pipeline",   bench_pipeline),
+    ("farm",       bench_farm),
+    ("websocket",  bench_websocket),
+    ("warmup",     bench_warmup),
+]
+
+
+# ── Results ───────────────────────────────────────────────────────────────────
+
+def _flatten(obj, prefix=""):
+    out = {}
+    for key, value in obj.items():
+        name = prefix + key
+        if isinstance(value, dict):
+            out.update(_flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            out[name] = value
+    return out
+
+
+def compare(old, new):
+    """Lines of 'metric  old -> new  (+x%)' for metrics present in both."""
+    a, b  = _flatten(old["results"]), _flatten(new["results"])
+    lines = []
+    for key in sorted(set(a) & set(b)):
+        change = ""
+        if a[key]:
+            change = "{0:+.1f}%".format(100.0 * (b[key] - a[key]) / a[key])
+        lines.append("  {0:<40} {1:>12} -> {2:<12} {3}".format(key, a[key], b[key], change))
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("suites", nargs="*", help="suites to run (default: all)")
+    parser.add_argument("--quick", action="store_true", help="smaller sizes and counts")
+    parser.add_argument("--save", default=RESULTS_DIR, help="folder for the JSON result")
+    parser.add_argument("--compare", help="earlier result file to compare against")
+    args = parser.parse_args(argv)
+
+    names   = [name for name, _ in SUITES]
+    unknown = [s for s in args.suites if s not in names]
+    if unknown:
+        parser.error("unknown suite(s): {0} (choose from {1})".format(
+            ", ".join(unknown), ", ".join(names)))
+
+    results = {}
+    for name, fn in SUITES:
+        if args.suites and name not in args.suites:
+            continue
+        print("== {0}".format(name))
+        results[name] = fn(args.quick)
+        print(json.dumps(results[name], indent=2, sort_keys=True))
+
+    run = {"at": time.strftime("%Y-%m-%dT%H:%M:%S"), "quick": args.quick,
+           "python": platform.python_version(), "platform": platform.platform(),
+           "results": results}
+    if not os.path.exists(args.save):
+        os.makedirs(args.save)
+    path = os.path.join(args.save, time.strftime("%Y%m%d-%H%M%S") + ".json")
+    with open(path, "w") as f:
+        json.dump(run, f, indent=2, sort_keys=True)
+    print("Saved " + path)
+
+    if args.compare:
+        with open(args.compare) as f:
+            print("Compared with " + args.compare)
+            print("\n".join(compare(json.load(f), run)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""
+test_render.py
+Assertion tests of render_engine against fake_comfy: cancelling a queued
+job, a cache hit, pipeline ordering, a failed prompt and failover from a
+dead server.
+
+    python -m unittest discover benchmarks      # or: python -m pytest benchmarks
+
+CPython 3 only (a development tool, not loaded by pyRevit).
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+from fake_comfy import FakeComfy, make_png     # noqa: E402  (also puts lib/ on sys.path)
+
+import comfy_http           # noqa: E402
+import job_queue            # noqa: E402
+import render_engine        # noqa: E402
+import result_cache         # noqa: E402
+import server_pool          # noqa: E402
+import settings_manager     # noqa: E402
+import tracing              # noqa: E402
+
+
+def prompt_seed(graph):
+    """noise_seed of the built-in workflow's RandomNoise node."""
+    return graph["75:73"]["inputs"]["noise_seed"]
+
+
+class RenderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder  = tempfile.mkdtemp()
+        self.snap    = os.path.join(self.folder, "snapshot.png")
+        with open(self.snap, "wb") as f:
+            f.write(make_png(2000))
+        self.servers = []
+        self.session = None
+        # Keep traces and cached results out of the user's %TEMP%
+        self._log_path      = tracing.log_path
+        self._cache         = result_cache._cache
+        tracing.log_path    = lambda: os.path.join(self.folder, "traces.jsonl")
+        result_cache._cache = result_cache.ResultCache(os.path.join(self.folder, "cache"))
+
+    def tearDown(self):
+        if self.session is not None:
+            self.session.shutdown()
+        for server in self.servers:
+            server.stop()
+            comfy_http.client_for(server.url).close()
+        tracing.log_path    = self._log_path
+        result_cache._cache = self._cache
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def start(self, **kwargs):
+        server = FakeComfy(image_bytes=2000, **kwargs).start()
+        self.servers.append(server)
+        return server
+
+    def open_session(self, servers, **kwargs):
+        settings = dict(settings_manager.DEFAULTS, comfy_url=servers[0].url,
+                        servers=[s.url for s in servers[1:]])
+        kwargs.setdefault("cache", False)
+        self.session = render_engine.RenderSession(settings, result_dir=self.folder,
+                                                   **kwargs)
+        return self.session
+
+    # ── Tests ─────────────────────────────────────────────────────────────
+
+    def test_cancel_queued_job(self):
+        server  = self.start(exec_time=1.0)
+        session = self.open_session([server], workers=2)
+        jobs    = [session.submit(self.snap, "queued", seed=i) for i in (1, 2)]
+        deadline = time.time() + 5
+        while len(server.prompts) < 2 and time.time() < deadline:
+            time.sleep(0.01)
+        pending = [item[1] for item in server.queue()["queue_pending"]]
+        self.assertEqual(len(pending), 1)
+        queued  = [j for j in jobs if j.prompt_id == pending[0]][0]
+        running = [j for j in jobs if j is not queued][0]
+
+        session.cancel(queued.id)
+        job_queue.wait_for_cancels(5)
+        self.assertTrue(queued.wait(5))
+        self.assertEqual(queued.state, job_queue.CANCELLED)
+        self.assertEqual(server.queue()["queue_pending"], [])
+        # Only the cancelled prompt left ComfyUI: the running one finishes
+        self.assertTrue(os.path.exists(running.result(10)))
+        self.assertNotIn(queued.prompt_id, server.history())
+        self.assertEqual(server.counts.get("POST /interrupt", 0), 0)
+
+    def test_cache_hit(self):
+        server  = self.start(exec_time=0.05)
+        session = self.open_session([server], workers=1, cache=True)
+        first   = session.submit(self.snap, "cached", seed=7)
+        first.result(10)
+        second  = session.submit(self.snap, "cached", seed=7)
+        path    = second.result(10)
+        self.assertTrue(second.options.get("cached"))
+        self.assertFalse(first.options.get("cached"))
+        self.assertEqual(server.counts.get("POST /prompt"), 1)
+        with open(path, "rb") as f, open(first.result_path, "rb") as g:
+            self.assertEqual(f.read(), g.read())
+        # Another seed is another render
+        session.submit(self.snap, "cached", seed=8).result(10)
+        self.assertEqual(server.counts.get("POST /prompt"), 2)
+
+    def test_pipeline_order(self):
+        server  = self.start(exec_time=0.02)
+        session = self.open_session([server], pipelined=True)
+        jobs    = [session.submit(self.snap, "pipelined", seed=i) for i in range(8)]
+        for job in jobs:
+            self.assertTrue(os.path.exists(job.result(20)))
+        self.assertEqual([prompt_seed(g) for g in server.prompts], list(range(8)))
+        submitted = [job.times[job_queue.SUBMITTED] for job in jobs]
+        self.assertEqual(submitted, sorted(submitted))
+        self.assertEqual(len(set(job.result_path for job in jobs)), len(jobs))
+
+    def test_failed_prompt(self):
+        for websocket in (True, False):
+            server = self.start(exec_time=0.05, websocket=websocket)
+            server.fail_next = 1
+            session = self.open_session([server], workers=1)
+            start   = time.time()
+            failed  = session.submit(self.snap, "fails", seed=1)
+            self.assertTrue(failed.wait(10))
+            self.assertEqual(failed.state, job_queue.FAILED)
+            self.assertIn("ComfyUI error", failed.error)
+            self.assertLess(time.time() - start, 3)     # not left to the grace period
+            # The server is fine for the next prompt
+            self.assertTrue(os.path.exists(
+                session.submit(self.snap, "works", seed=2).result(10)))
+            session.shutdown()
+            self.session = None
+
+    def test_dead_server_failover(self):
+        dead, live = self.start(exec_time=0.05), self.start(exec_time=0.05)
+        session = self.open_session([dead, live], workers=1)
+        pool    = server_pool.get_pool(session.settings())
+        pool.refresh(force=True)
+        self.assertTrue(all(node.healthy for node in pool.nodes))
+        # Healthy a moment ago, unreachable now, and the least loaded
+        dead.stop()
+        comfy_http.client_for(dead.url).close()
+        self.servers.remove(dead)
+        pool.nodes[1].inflight = 5
+
+        job = session.submit(self.snap, "failover", seed=1)
+        self.assertTrue(os.path.exists(job.result(30)))
+        self.assertEqual(job.base_url, live.url)
+        self.assertFalse(pool.nodes[0].healthy)
+        self.assertEqual(live.counts.get("POST /prompt"), 1)
+        pool.nodes[1].inflight = 0
+
+
+if __name__ == "__main__":
+    unittest.main()